@@ -1,156 +1,212 @@
 """
-ARGUMENTS: python3 ParseMetaFilesUpdated.py <path-to-jstor-data> <which-part> <how-many-parts> <output-path>
+ARGUMENTS: python3 ParseMetaFilesUpdated.py <path-to-jstor-data> <which-part> <how-many-parts> <output-path> [<format>]
     <how-many-parts>: for parallel processing, this should be the number of workers available to run the program; 1 if not running in parallel.
     <which-part>: for parallel processing, this should be a unique number for each worker, from 1 to <how-many-parts>; 1 if not running in parallel.
+        'all' processes every part in this one program: files are served in small batches from a shared queue to a pool of
+        worker processes (see 'scheduler.py'), and the same <how-many-parts> part files are written as by separate runs
+        for parts 1 to <how-many-parts>.
+    <format>: 'hdf' (default) or 'parquet'; see OUTPUT.
 USAGE: This program takes already-split dictionaries and reads in a batch of JSTOR article n-gram files to count the number of appearances of each n-gram in the dictionaries.
-INPUT: JSTOR metadata files.
-OUTPUT: A table in HDF5 format, indexed on 'file_name', consisting of 18 columns.
+INPUT: JSTOR metadata files, either extracted to '<path-to-jstor-data>/metadata/' or inside the JSTOR receipt archives
+    (<path-to-jstor-data> is then a .zip/.tar archive or a folder of them; see 'corpus.py').
+OUTPUT: A table in HDF5 format, indexed on 'file_name', consisting of 18 columns. With format 'parquet', the same table
+    is written to a partitioned Parquet dataset instead, as '<output-path>/metadata_parts/part=<which-part>/data.parquet'
+    (see 'result_store.py'). Journal fields and the article type are categories, and day, month, year (its first four
+    characters) and volume nullable integers (missing if not a whole number; see 'result_store.METADATA_DTYPES').
+    Every part is written as soon as its files are parsed, CHUNK_ROWS rows at a time; with 'parquet', each chunk is
+    written out as it is converted, so memory does not grow with the size of a part.
 """
 
-import math
 import os
 import re
 import sys
 from tqdm import tqdm
 from xml.etree import ElementTree as ET
 
+import numpy as np
 import pandas as pd
 
+import instrumentation
+from corpus import open_corpus
+from journal_subjects import clean_years
+from result_store import METADATA_DTYPES, PartWriter
+from scheduler import run_tasks, split_parts
 
-# check if improper number of arguments; if so, return instructions and quit
-if len(sys.argv) != 5:
-    print(__doc__)
-    exit()
+CHUNK_ROWS = 10000 # rows converted to typed columns (and, with 'parquet', written) at a time
 
-# read in arguments from command line
-JSTOR_HOME, NUM, NUM_CPUS, OUTPATH = sys.argv[1:]
-NUM, NUM_CPUS = int(NUM), int(NUM_CPUS)
+RECORD_COLS = ['type', 'journal_id', 'journal_title', 'issn', 'article_id', 'article_name', 'given_names', 'surname', 'day', 'month', 'year', 'volume', 'issue', 'issue_id', 'fpage', 'lpage', 'jstor_url', 'abstract']
 
-METADATA_HOME = os.path.join(JSTOR_HOME, 'metadata/')
-path, dirs, files = next(os.walk(METADATA_HOME))
-files = [(path + file) for file in files] # Add folder name "path" as prefix to file
+# Fields read from any element with this tag (the article type from an attribute, the rest from text); when a
+# tag occurs more than once, the last one in document order wins
+ELEMENT_FIELDS = {'article': 'type', 'journal-id': 'journal_id', 'journal-title': 'journal_title', 'issn': 'issn',
+                  'article-id': 'article_id', 'day': 'day', 'month': 'month', 'year': 'year', 'volume': 'volume',
+                  'issue': 'issue', 'issue-id': 'issue_id', 'fpage': 'fpage', 'lpage': 'lpage'}
 
-NUM_EACH = math.ceil(len(files) / NUM_CPUS)
-LEFT = (NUM - 1) * NUM_EACH
-RIGHT = LEFT + NUM_EACH
+# Fields read from one path from the root, following the first element with each tag at every level
+PATH_FIELDS = {('article', 'front', 'article-meta', 'title-group', 'article-title'): 'article_name',
+               ('article', 'front', 'article-meta', 'abstract', 'p'): 'abstract',
+               ('article', 'front', 'article-meta', 'self-uri'): 'jstor_url'}
 
-files = files[LEFT:RIGHT]
+def parse_file(file, corpus):
+    """Extracts article info from one XML file in a single streaming pass, freeing each element once it is read.
+
+    Args:
+        file: complete file path (or archive member name, see corpus.metadata_files())
+        corpus: reader returned by `corpus.open_corpus()`
+
+    Returns:
+        record: dict with the 18 article info columns and 'file_name'; missing fields are None, and
+            'given_names' and 'surname' are lists (one entry per author) or None if the article lists no authors"""
 
-def add(elem, attrs):
     # TO DO: Filter by article-type?
 
-    elements = attrs['elements']
-    surnames = attrs['surname']
-    given_names = attrs['given-names']
-    tag = elem.tag
-    if tag in attrs['df_cols']:
-        if tag == 'journal-id':
-            tag = 'journal_id'
-        elif tag == 'article':
-            article_attrs = elem.attrib
-            article_type = article_attrs['article-type']
-            tag = 'type'
-            elem.text = article_type
-        elif tag =='journal-title':
-            tag = 'journal_title'
-        elif tag == 'article-id':
-            tag = 'article_id'
-        elif tag == 'article-name':
-            tag = 'article_name'
-        elif tag == 'surname':
-            if type(elem.text) == 'str':
-                surnames.append(elem.text.split(',')[0])
-            else:
-                surnames.append('None')
-            elem.text = surnames
-        elif tag == 'given-names':
-            tag = 'given_names'
-            given_names.append(elem.text)
-            elem.text = given_names
-        elif tag == 'issue-id':
-            tag = 'issue_id'
-        elif tag == 'ns1:ref':
-            tag = 'jstor_url'
-        elif tag == 'p':
-            tag = 'abstract'
-
-#        if tag not in elements:
-#            elements[tag] = pd.Series([elem.text])
-#        else:
-#            elements[tag].append(pd.Series([elem.text]), ignore_index=True)
-        len_list = len(elements[tag])
-        elements[tag][len_list - 1] = elem.text
-
-    for child in elem.findall('*'):
-        add(child, attrs)
-
-def xml2df(xml_files):
-    """Transforms XML files into a Pandas DataFrame.
+    record = dict.fromkeys(RECORD_COLS)
+    field_pos = {} # field -> document position of the element it was read from
+    given_names = []
+    surnames = []
+
+    path = [] # (tag, first sibling with this tag?, document position) of each open element
+    sibling_tags = [set()] # tags seen so far among the children of each open element
+    position = 0
+
+    with corpus.open_metadata(file) as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            tag = elem.tag
+
+            if event == 'start':
+                path.append((tag, tag not in sibling_tags[-1], position))
+                sibling_tags[-1].add(tag)
+                sibling_tags.append(set())
+                position += 1
+                continue
+
+            _, _, start = path[-1]
+
+            field = ELEMENT_FIELDS.get(tag)
+            if field and start >= field_pos.get(field, -1):
+                record[field] = elem.get('article-type') if tag == 'article' else elem.text
+                field_pos[field] = start
+            elif tag == 'given-names':
+                given_names.append(elem.text)
+            elif tag == 'surname':
+                surnames.append(elem.text.split(',')[0] if elem.text else elem.text)
+
+            field = PATH_FIELDS.get(tuple(tag for tag, _, _ in path))
+            if field and all(first for _, first, _ in path):
+                record[field] = next(iter(elem.attrib.values()), None) if field == 'jstor_url' else elem.text
+
+            path.pop()
+            sibling_tags.pop()
+            elem.clear() # free the element; its children were freed when they ended
+
+    record['given_names'] = given_names or None
+    record['surname'] = surnames or None
+    record['file_name'] = re.findall('journal-article-.+\\.xml', file)[0][:-4]
+
+    return record
+
+# Per-worker state, set once by `_init_worker()`: workers started by spawn import this module without running the script
+_worker_args = None
+
+def _init_worker(corpus):
+    global _worker_args
+    _worker_args = (corpus,)
+
+def _parse_file_worker(file):
+    return parse_file(file, *_worker_args)
+
+def whole_numbers(values:pd.Series, dtype:str):
+    """Nullable integer column (e.g. 'Int16') from text; values that are not whole numbers, or do not fit in dtype,
+    are missing."""
+
+    text = values.astype('string').str.strip()
+    numbers = pd.to_numeric(text.where(text.str.fullmatch(r'[+-]?\d+').fillna(False)), errors='coerce')
+    limits = np.iinfo(dtype.lower())
+    return numbers.where(numbers.between(limits.min, limits.max)).astype(dtype)
+
+def xml2df(records):
+    """Transforms parsed XML files into a Pandas DataFrame with typed columns.
 
     Args: 
-        files: list of complete file paths
+        records: output of parse_file() for each file of a chunk, in file order
 
     Returns:
-        df: DataFrame with article info"""
-
-    all_records = {'type':[], 'journal_id':[], 'journal_title':[], 'issn':[], 'article_id':[], 'article_name':[], 'given_names':[], 'surname':[], 'day':[], 'month':[], 'year':[], 'volume':[], 'issue':[], 'issue_id':[], 'fpage':[], 'lpage':[], 'jstor_url':[], 'abstract':[]}
-    attrs = {}
-    attrs['elements'] = all_records
-    attrs['surname'] = []
-    attrs['given-names'] = []
-    attrs['df_cols'] = ['article', 'journal-id', 'journal-title', 'issn', 'article-id', 'article-name', 'given-names', 'surname', 'day', 'month', 'year', 'volume', 'issue', 'issue-id', 'fpage', 'lpage', 'ns1:ref', 'p']
-
-    for file in tqdm(xml_files):
-        with open(file, 'rb') as f:
-            t = ET.parse(f) # element tree
-            root = t.getroot()
-            for record in all_records:
-                all_records[record].append('None')
-            add(root, attrs)
-
-    #print(all_records)
-    print ('Start creating data frame')
-    df = pd.DataFrame(all_records)
+        df: DataFrame with article info, with the column types of METADATA_DTYPES"""
+
+    columns = {col: [] for col in RECORD_COLS + ['file_name']}
+    for record in records:
+        for col, values in columns.items():
+            values.append(record[col])
+
+    df = pd.DataFrame(columns)
+    for col, dtype in METADATA_DTYPES.items():
+        if col == 'year':
+            df[col] = clean_years(df[col]).astype(dtype) # as read by 'Combine_Meta_Ngram_Data_into_Visual'
+        elif dtype == 'category':
+            df[col] = df[col].astype(dtype)
+        else:
+            df[col] = whole_numbers(df[col], dtype)
     return df
 
-# This is definitely NOT a good practice. However, I'm trying not to break what's running properly.
-def amend_df(df, files):
-    file_names = []
-    jstor_urls = []
-    abstracts = []
-    article_names = []
-
-    for file in tqdm(files):
-        file_names.append(re.findall('journal-article-.+\.xml', file)[0][:-4])
-        with open(file, 'rb') as f:
-            t = ET.parse(f) # element tree
-            root = t.getroot()
-
-            try:
-                jstor_urls.append(root.find('front').find('article-meta').find('self-uri').items()[0][1])
-            except:
-                jstor_urls.append('None')
-
-            try:
-                abstracts.append(root.find('front').find('article-meta').find('abstract').find('p').text)
-            except:
-                abstracts.append('None')
-
-            try:
-                article_names.append(root.find('front').find('article-meta').find('title-group').find('article-title').text)
-            except:
-                article_names.append('None')
-
-    df.loc[:, 'file_name'] = file_names
-    df.loc[:, 'jstor_url'] = jstor_urls
-    df.loc[:, 'abstract'] = abstracts
-    df.loc[:, 'article_name'] = article_names
-
-print('Start processing')
-df = xml2df(files)
-print('Start amending')
-amend_df(df, files)
-
-# df.to_pickle('pickles/part{}.pickle'.format(n))
-df.set_index('file_name').to_hdf(os.path.join(OUTPATH, 'part{}.h5'.format(NUM)), key='metadata', mode='w')
-#df.set_index('file_name').to_pickle(os.path.join(OUTPATH, 'part{}.pickle'.format(NUM)))
\ No newline at end of file
+
+if __name__ == '__main__':
+    instrumentation.setup('metadata_parse') # before reading sys.argv: removes --metrics/--profile/--sample
+
+    # check if improper number of arguments; if so, return instructions and quit
+    if len(sys.argv) not in (5, 6):
+        print(__doc__)
+        exit()
+
+    # read in arguments from command line
+    JSTOR_HOME, NUM, NUM_CPUS, OUTPATH = sys.argv[1:5]
+    FORMAT = sys.argv[5] if len(sys.argv) == 6 else 'hdf'
+    NUM_CPUS = int(NUM_CPUS)
+    instrumentation.label(part=NUM)
+
+    corpus = open_corpus(JSTOR_HOME) # extracted files or receipt archives
+    files = corpus.metadata_files() # file paths, or archive members
+
+    parts = split_parts(files, NUM_CPUS)
+    if NUM != 'all':
+        parts = {int(NUM): parts[int(NUM)]}
+
+    # Parse every file; a single part runs in this process, 'all' shares the files out to a pool as workers free up.
+    # Results come in completion order; each part takes them in its own file order and is written CHUNK_ROWS rows at a
+    # time, and closed as soon as its last file is parsed, so only the chunks in progress are held in memory.
+    print('Start processing')
+    part_files = [file for part in parts.values() for file in part]
+    part_of = {file: num for num, files in parts.items() for file in files}
+    writers = {num: PartWriter(OUTPATH, 'metadata', num, FORMAT) for num in parts}
+    next_file = dict.fromkeys(parts, 0) # position in the part of the next file to write
+    chunks = {num: [] for num in parts}
+    written = dict.fromkeys(parts, False) # whether any chunk of the part was written
+    results = {} # parsed, but not yet taken by their part (an earlier file of the part is still being parsed)
+
+    def take_results(num):
+        """Moves the results of part num that are next in file order into its chunk, writing every full chunk, and
+        closes the part once all its files are written."""
+
+        files, chunk = parts[num], chunks[num]
+        while next_file[num] < len(files) and files[next_file[num]] in results:
+            chunk.append(results.pop(files[next_file[num]]))
+            next_file[num] += 1
+            if len(chunk) == CHUNK_ROWS:
+                writers[num].write(xml2df(chunk).set_index('file_name'))
+                chunk.clear()
+                written[num] = True
+
+        if next_file[num] == len(files):
+            if chunk or not written[num]: # the last rows, or an empty table for an empty part
+                writers[num].write(xml2df(chunk).set_index('file_name'))
+                chunk.clear()
+            writers[num].close()
+
+    for num, files in parts.items():
+        if not files:
+            take_results(num)
+
+    for file, result in tqdm(run_tasks(_parse_file_worker, part_files, kind='cpu', processes=None if NUM == 'all' else 1,
+                                       initializer=_init_worker, initargs=(corpus,)),
+                             total=len(part_files)):
+        results[file] = result
+        take_results(part_of[file])
@@ -0,0 +1,194 @@
+"""
+ARGUMENTS: python3 benchmark.py <data-path> <results-file> [<worker-counts> [<repeats>]]
+           python3 benchmark.py compare <old-results-file> <new-results-file>
+    <data-path>: folder in the layout written by 'generate_corpus' ('jstor_data/', 'Dictionaries/', 'journals.csv').
+    <worker-counts>: comma-separated numbers of worker processes to run every stage with (default '1,2,4'); set through
+        the PIPELINE_WORKERS environment variable (see 'scheduler.py'), or the <processes> argument of 'ngram_agg'.
+    <repeats>: runs of every stage per worker count (default 1); the summary keeps the fastest.
+USAGE: Runs the pipeline end to end on <data-path>, each stage as its own process, and times every stage: metadata
+    parsing, metadata merge, dictionary split, n-gram counting (1, 2, 3), n-gram combine and corpus-wide n-gram
+    aggregation (1, 2, 3). For each run it records wall-clock and CPU time, peak resident memory (of the largest
+    process, main or worker, as reported by wait4) and throughput in articles and input megabytes per second.
+    'compare' prints the ratio of new to old wall-clock times for every stage and worker count found in both files,
+    e.g. for results from two commits.
+OUTPUT: <results-file>, in JSON: the commit, machine and corpus size, every run ('runs'), and per stage and worker
+    count the fastest run with its speedup and parallel efficiency relative to the smallest worker count ('summary').
+    Stage outputs and logs go to '<data-path>/benchmark_work/', which is cleared before each worker count.
+"""
+
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from multiprocessing import cpu_count
+from os.path import join
+
+from scheduler import WORKERS_ENV
+
+
+CODE_HOME = os.path.dirname(os.path.abspath(__file__))
+NUM_PARTS = 8 # part files written by the batch stages, the same for every worker count
+
+
+def folder_size(path):
+    '''Total size of the files under path, in bytes.'''
+    return sum(os.path.getsize(join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+
+def stages(data_path, work_path, workers):
+    '''The pipeline as (stage name, list of commands, input folder) triples, in the order they must run.'''
+
+    jstor = join(data_path, 'jstor_data')
+    metadata_results = join(work_path, 'metadata_results')
+    ngram_results = join(work_path, 'ngram_results')
+    dicts = join(work_path, 'dicts')
+    articles = join(work_path, 'articles.txt')
+
+    pipeline = [
+        ('metadata_parse', [['ParseMetaFilesUpdated.py', jstor, 'all', NUM_PARTS, metadata_results]],
+         join(jstor, 'metadata')),
+        ('metadata_merge', [['merge_metadata_result.py', metadata_results, NUM_PARTS, join(data_path, 'journals.csv'),
+                             join(work_path, 'metadata_combined.h5')]], metadata_results),
+        ('dictionary_split', [['split_dictionary.py', join(data_path, 'Dictionaries'), dicts, name]
+                              for name in ('Culture', 'Demographic', 'Relational')], join(data_path, 'Dictionaries')),
+    ]
+    pipeline += [('ngram{}_count'.format(n), [['parse_ngram_files.py', dicts, jstor, n, 'all', NUM_PARTS, ngram_results]],
+                  join(jstor, 'ngram{}'.format(n))) for n in (1, 2, 3)]
+    pipeline += [('ngram_combine', [['combine_ngram_result.py', ngram_results, NUM_PARTS]], ngram_results)]
+    pipeline += [('ngram{}_aggregate'.format(n), [['ngram_agg.py', jstor, n, articles, work_path, 0, workers]],
+                  join(jstor, 'ngram{}'.format(n))) for n in (1, 2, 3)]
+    return pipeline
+
+
+def run(command, env, log):
+    '''Runs one pipeline script to completion.
+
+    Returns:
+        exit_code (int): exit code of the script
+        wall (float): wall-clock seconds
+        usage (resource.struct_rusage): CPU time and peak memory of the script and its (waited-for) workers
+    '''
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + [str(arg) for arg in command], cwd=CODE_HOME, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    _, status, usage = os.wait4(process.pid, 0) # unlike Popen.wait(), also returns the resource usage
+    wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, wall, usage
+
+
+def benchmark(data_path, worker_counts, repeats):
+    '''Runs every stage for every worker count and returns the list of runs.'''
+
+    work_path = join(data_path, 'benchmark_work')
+    num_articles = len(os.listdir(join(data_path, 'jstor_data', 'ngram1')))
+    runs = []
+
+    for workers in worker_counts:
+        env = dict(os.environ, **{WORKERS_ENV: str(workers)})
+
+        for repeat in range(repeats):
+            shutil.rmtree(work_path, ignore_errors=True)
+            for folder in ('metadata_results', 'ngram_results', 'dicts'):
+                os.makedirs(join(work_path, folder))
+            with open(join(work_path, 'articles.txt'), 'w') as f:
+                f.writelines(file[:-len('-ngram1.txt')] + '\n'
+                             for file in sorted(os.listdir(join(data_path, 'jstor_data', 'ngram1'))))
+
+            for stage, commands, input_path in stages(data_path, work_path, workers):
+                input_mb = folder_size(input_path) / 1024 ** 2
+                record = {'stage': stage, 'workers': workers, 'repeat': repeat, 'wall_seconds': 0.0,
+                          'user_seconds': 0.0, 'system_seconds': 0.0, 'peak_rss_mb': 0.0, 'exit_code': 0}
+
+                with open(join(work_path, stage + '.log'), 'w') as log:
+                    for command in commands:
+                        exit_code, wall, usage = run(command, env, log)
+                        record['wall_seconds'] += wall
+                        record['user_seconds'] += usage.ru_utime
+                        record['system_seconds'] += usage.ru_stime
+                        record['peak_rss_mb'] = max(record['peak_rss_mb'], usage.ru_maxrss / 1024) # KiB on Linux
+                        record['exit_code'] = record['exit_code'] or exit_code
+
+                record.update(articles=num_articles, articles_per_second=num_articles / record['wall_seconds'],
+                              input_mb=input_mb, mb_per_second=input_mb / record['wall_seconds'])
+                runs.append(record)
+                print('{stage} with {workers} workers: {wall_seconds:.2f} s, {articles_per_second:.1f} articles/s, '
+                      'peak RSS {peak_rss_mb:.0f} MB'.format(**record))
+
+                if record['exit_code']: # later stages read this stage's output
+                    print('{} failed, skipping the remaining stages; see {}'.format(stage, join(work_path, stage + '.log')))
+                    break
+
+    return runs
+
+
+def summarize(runs):
+    '''Fastest run per stage and worker count, with speedup and efficiency relative to the smallest worker count.
+
+    Returns:
+        summary (dict): {stage: {workers (str): {'wall_seconds', 'speedup', 'efficiency'}}}
+    '''
+
+    best = {}
+    for record in runs:
+        if record['exit_code'] == 0:
+            key = (record['stage'], record['workers'])
+            best[key] = min(best.get(key, float('inf')), record['wall_seconds'])
+
+    summary = {}
+    for (stage, workers), wall in sorted(best.items()):
+        base_workers = min(w for s, w in best if s == stage)
+        speedup = best[(stage, base_workers)] / wall
+        summary.setdefault(stage, {})[str(workers)] = {
+            'wall_seconds': wall, 'speedup': speedup, 'efficiency': speedup / (workers / base_workers)}
+    return summary
+
+
+def compare(old_file, new_file):
+    with open(old_file, 'r') as f:
+        old = json.load(f)
+    with open(new_file, 'r') as f:
+        new = json.load(f)
+
+    print('{:<20}{:>8}{:>12}{:>12}{:>8}'.format('stage', 'workers', 'old (s)', 'new (s)', 'ratio'))
+    for stage, by_workers in new['summary'].items():
+        for workers, result in by_workers.items():
+            if workers in old['summary'].get(stage, {}):
+                before = old['summary'][stage][workers]['wall_seconds']
+                print('{:<20}{:>8}{:>12.2f}{:>12.2f}{:>8.2f}'.format(
+                    stage, workers, before, result['wall_seconds'], result['wall_seconds'] / before))
+
+
+if len(sys.argv) == 4 and sys.argv[1] == 'compare':
+    compare(sys.argv[2], sys.argv[3])
+    exit()
+
+if len(sys.argv) not in (3, 4, 5):
+    print(__doc__)
+    exit()
+
+DATA_PATH, RESULTS_FILE = sys.argv[1:3]
+WORKER_COUNTS = [int(n) for n in sys.argv[3].split(',')] if len(sys.argv) > 3 else [1, 2, 4]
+REPEATS = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=CODE_HOME, capture_output=True, text=True).stdout.strip()
+runs = benchmark(DATA_PATH, WORKER_COUNTS, REPEATS)
+
+results = {
+    'commit': commit or None,
+    'date': datetime.datetime.now().isoformat(timespec='seconds'),
+    'python': platform.python_version(),
+    'machine': {'platform': platform.platform(), 'cpus': cpu_count()},
+    'data': {'path': os.path.abspath(DATA_PATH), 'articles': runs[0]['articles'] if runs else 0,
+             'size_mb': folder_size(join(DATA_PATH, 'jstor_data')) / 1024 ** 2},
+    'runs': runs,
+    'summary': summarize(runs),
+}
+
+with open(RESULTS_FILE, 'w') as f:
+    json.dump(results, f, indent=2)
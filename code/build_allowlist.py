@@ -0,0 +1,57 @@
+"""
+ARGUMENTS: python3 build_allowlist.py <path-to-metadata-results> <total-number-of-parts> <journal-metadata-file> <output-file> [<subjects> [<first-year> [<last-year> [<format>]]]]
+    <subjects>: comma-separated primary subjects to keep (default 'Sociology,Management & Organizational Behavior',
+        the subjects 'merge_metadata_result' does not relabel as 'Other'); 'all' keeps every journal in the table.
+    <first-year>, <last-year>: keep only articles published in these years, inclusive (e.g. 1971 2014); 'none' for no
+        bound. The year is read as in 'Combine_Meta_Ngram_Data_into_Visual' (first four characters of 'year'), and
+        articles without a valid year are dropped when a bound is set.
+    <format>: 'hdf' (default) or 'parquet', as passed to 'ParseMetaFilesUpdated'.
+USAGE: Lists the articles that will be analyzed, from the parsed metadata (only its journal and year columns are read)
+    and the journal subject table, so that the counting scripts can skip all other articles before opening their
+    n-gram files (see <article-list> in 'parse_ngram_files'). Journals are matched to subjects as in
+    'merge_metadata_result'; articles whose journal has no primary subject are always dropped.
+OUTPUT: <output-file>, one article id (e.g. 'journal-article-10.2307_2065002') per line, in metadata part order.
+"""
+
+import sys
+
+import instrumentation
+from journal_subjects import FOCAL_SUBJECTS, clean_years, fix_titles, load_journals
+from result_store import FORMATS, read_parts
+
+instrumentation.setup('build_allowlist') # before reading sys.argv: removes --metrics/--profile/--sample
+
+
+if len(sys.argv) not in range(5, 10):
+    print(__doc__)
+    exit()
+
+METADATA_HOME, NUM_PARTS, JOURNAL_META_FILE, OUTFILE = sys.argv[1:5]
+SUBJECTS = sys.argv[5].split(',') if len(sys.argv) > 5 else FOCAL_SUBJECTS
+FIRST_YEAR = sys.argv[6] if len(sys.argv) > 6 else 'none'
+LAST_YEAR = sys.argv[7] if len(sys.argv) > 7 else 'none'
+FORMAT = sys.argv[8] if len(sys.argv) > 8 else 'hdf'
+assert FORMAT in FORMATS, f"Unknown format {FORMAT!r}; options are: {', '.join(FORMATS)}"
+
+data = read_parts(METADATA_HOME, 'metadata', int(NUM_PARTS), FORMAT, columns=['journal_title', 'year'])
+data = fix_titles(data)
+
+journals = load_journals(JOURNAL_META_FILE)
+journals = journals[~journals.primary_subject.isnull()]
+if SUBJECTS != ['all']:
+    journals = journals[journals.primary_subject.isin(SUBJECTS)]
+
+keep = data.journal_title.isin(set(journals.publication_title))
+
+if FIRST_YEAR != 'none' or LAST_YEAR != 'none':
+    years = clean_years(data.year)
+    keep &= years.notnull()
+    if FIRST_YEAR != 'none':
+        keep &= (years >= int(FIRST_YEAR)).fillna(False)
+    if LAST_YEAR != 'none':
+        keep &= (years <= int(LAST_YEAR)).fillna(False)
+
+with open(OUTFILE, 'w') as f:
+    f.writelines(file_name + '\n' for file_name in data.index[keep])
+
+print('Kept {} of {} articles'.format(keep.sum(), len(data)))
@@ -0,0 +1,36 @@
+"""
+ARGUMENTS: python3 build_dictionaries.py <path-to-dictionaries> <output-file> [<blacklist-file>]
+    <path-to-dictionaries>: folder of dictionary files, e.g. '../dictionaries' (sets 'original', 'core',
+        'expanded_1971_1981', ...) or the pipeline's 'Dictionaries/' ('Culture.csv', ... as set 'main').
+    <blacklist-file>: terms to remove from every dictionary, one per line (default
+        '../article_data/expanded_dict_blacklist.csv'); 'none' to keep every term.
+USAGE: Compiles every dictionary once: normalizes the terms, removes blacklisted ones and splits them by n-gram size
+    (see 'compiled_dictionaries.py'). The counting scripts load <output-file> instead of parsing the dictionary files,
+    and rebuild it themselves when a dictionary or the blacklist is newer. 'parse_ngram_files' takes a file compiled
+    from the pipeline's 'Dictionaries/' in place of the split dictionaries.
+OUTPUT: <output-file>, a pickle of the compiled dictionaries with their format version and content fingerprint.
+"""
+
+import sys
+
+import instrumentation
+from compiled_dictionaries import compile_dictionaries
+
+instrumentation.setup('build_dictionaries') # before reading sys.argv: removes --metrics/--profile/--sample
+
+
+if len(sys.argv) not in (3, 4):
+    print(__doc__)
+    exit()
+
+DICTS_HOME, OUTFILE = sys.argv[1:3]
+BLACKLIST = sys.argv[3] if len(sys.argv) == 4 else '../article_data/expanded_dict_blacklist.csv'
+
+dictionaries = compile_dictionaries(DICTS_HOME, None if BLACKLIST == 'none' else BLACKLIST)
+dictionaries.save(OUTFILE)
+
+for name in dictionaries.set_names():
+    entry = dictionaries.sets[name]
+    print('{}: {}'.format(name, ', '.join('{} ({} terms, {} blacklisted)'.format(
+        perspective, len(terms), len(entry['removed'][perspective])) for perspective, terms in entry['terms'].items())))
+print('Fingerprint {}'.format(dictionaries.fingerprint))
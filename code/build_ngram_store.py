@@ -0,0 +1,120 @@
+"""
+ARGUMENTS: python3 build_ngram_store.py <path-to-jstor-data> <output-path> [<articles-per-shard>]
+    <articles-per-shard>: how many articles' n-grams go into one shard file (default 10000).
+USAGE: One-time conversion of the extracted JSTOR n-gram text files into a packed binary store. Every n-gram string is
+    interned into a vocabulary per n-gram size, and each article's (term_id, count) pairs are appended to large
+    sharded NumPy arrays with an offsets index. Once built, pass <output-path> wherever a script expects the
+    JSTOR data folder (e.g. JSTOR_HOME in the dict_count_* and word_count_* scripts, <path-to-jstor-data> in
+    parse_ngram_files.py and ngram_agg.py); they detect the store and memory-map it instead of opening one text
+    file per article and n-gram size.
+INPUT: JSTOR n-gram files `<path-to-jstor-data>/ngram[123]/journal-article-*-ngram[123].txt`, or the JSTOR receipt archives
+    holding them (<path-to-jstor-data> is then a .zip/.tar archive or a folder of them).
+OUTPUT: A store directory as described in `corpus.NgramStore`.
+ERROR LOG: `<output-path>/build.log` lists every file that was skipped because of an error, if such files exist.
+"""
+
+import json
+import os
+import sys
+from array import array
+from os.path import join
+
+import numpy as np
+from tqdm import tqdm
+
+import instrumentation
+from corpus import STORE_MANIFEST, STORE_VERSION, open_corpus
+
+
+NGRAM_VALUES = (1, 2, 3)
+
+
+def build_ngram_store(JSTOR_HOME:str, OUTPUT_PATH:str, articles_per_shard:int=10000):
+    '''Converts the extracted n-gram text files under JSTOR_HOME into a packed store in OUTPUT_PATH.
+
+    Args:
+        JSTOR_HOME (str): path to top-level folder, under which are folders with ngram data
+        OUTPUT_PATH (str): folder to write the store into
+        articles_per_shard (int): number of articles per shard file
+
+    Returns:
+        skipped (list of str): paths of files that could not be parsed
+    '''
+
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    if os.path.isfile(join(OUTPUT_PATH, STORE_MANIFEST)): # rebuilding; invalidate the old store until we're done
+        os.remove(join(OUTPUT_PATH, STORE_MANIFEST))
+    source = open_corpus(JSTOR_HOME) # extracted text files or receipt archives
+
+    # Every article that has at least one n-gram file
+    article_ids = sorted(set().union(*[source.articles(ngram_value) for ngram_value in NGRAM_VALUES]))
+    with open(join(OUTPUT_PATH, 'articles.txt'), 'w', newline='\n') as f:
+        f.writelines(article_id + '\n' for article_id in article_ids)
+
+    skipped = []
+    num_shards = {}
+
+    for ngram_value in NGRAM_VALUES:
+        present = set(source.articles(ngram_value))
+        vocab = {} # term -> term_id
+        index = np.full((len(article_ids), 3), -1, dtype=np.int64) # shard, start, end
+        shard, term_ids, counts = 0, array('I'), array('I')
+
+        def write_shard():
+            prefix = join(OUTPUT_PATH, f'ngram{ngram_value}_shard{shard:04d}')
+            np.save(prefix + '_terms.npy', np.frombuffer(term_ids, dtype=np.uint32))
+            np.save(prefix + '_counts.npy', np.frombuffer(counts, dtype=np.uint32))
+
+        print(f'Packing ngram{ngram_value} files...')
+        for i, article_id in enumerate(tqdm(article_ids)):
+            if i > 0 and i % articles_per_shard == 0:
+                write_shard()
+                shard, term_ids, counts = shard + 1, array('I'), array('I')
+
+            if article_id not in present:
+                continue
+
+            start = len(term_ids)
+            try:
+                for term, count in source.read_ngrams(article_id, ngram_value):
+                    term_ids.append(vocab.setdefault(term, len(vocab)))
+                    counts.append(count)
+            except Exception:
+                del term_ids[start:], counts[start:] # drop the partial article
+                skipped.append(source.path(article_id, ngram_value))
+                continue
+
+            index[i] = (shard, start, len(term_ids))
+
+        write_shard()
+        num_shards[ngram_value] = shard + 1
+        np.save(join(OUTPUT_PATH, f'ngram{ngram_value}_index.npy'), index)
+
+        with open(join(OUTPUT_PATH, f'ngram{ngram_value}_vocab.txt'), 'w', newline='\n') as f:
+            f.writelines(term + '\n' for term in vocab) # dicts keep insertion order, i.e. term_id order
+        del vocab
+
+    # Write the manifest last, so an interrupted build is never mistaken for a complete store
+    with open(join(OUTPUT_PATH, STORE_MANIFEST), 'w') as f:
+        json.dump({'version': STORE_VERSION, 'ngram_values': list(NGRAM_VALUES), 'num_articles': len(article_ids),
+                   'num_shards': num_shards}, f, indent=2)
+
+    return skipped
+
+
+if __name__ == '__main__':
+    instrumentation.setup('build_ngram_store') # before reading sys.argv: removes --metrics/--profile/--sample
+    if len(sys.argv) not in (3, 4):
+        print(__doc__)
+        exit()
+
+    JSTOR_HOME, OUTPUT_PATH = sys.argv[1:3]
+    ARTICLES_PER_SHARD = int(sys.argv[3]) if len(sys.argv) == 4 else 10000
+
+    skipped = build_ngram_store(JSTOR_HOME, OUTPUT_PATH, ARTICLES_PER_SHARD)
+
+    if skipped:
+        LOG_FILE = join(OUTPUT_PATH, 'build.log')
+        with open(LOG_FILE, 'w') as log_file:
+            log_file.writelines(file + '\n' for file in skipped)
+        print('One or more files are skipped because of an error occurred when processing them. Check {} for these files.'.format(LOG_FILE))
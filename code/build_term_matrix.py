@@ -0,0 +1,122 @@
+"""
+ARGUMENTS: python3 build_term_matrix.py <path-to-jstor-data> <output-path> [<article-list>]
+    <path-to-jstor-data>: extracted JSTOR data folder, or a packed n-gram store built by 'build_ngram_store'.
+    <article-list>: optional text file with one article id per line (e.g. 'journal-article-10.2307_2065002');
+        defaults to every article that has an n-gram file.
+USAGE: Builds a sparse article x term count matrix (CSR) over unigrams, bigrams and trigrams and saves it to disk.
+    Afterwards, load it with `term_matrix.TermMatrix(<output-path>)` to count any dictionary with one sparse
+    matrix-vector product instead of rescanning the corpus.
+INPUT: JSTOR n-gram files for all three n-gram sizes (or a packed n-gram store).
+OUTPUT: In <output-path>: 'term_matrix.npz' (scipy CSR matrix), 'articles.txt' (row labels), 'vocab.txt' (column
+    labels, words separated by spaces) and 'term_matrix.json' (source and shape).
+ERROR LOG: '<output-path>/build.log' lists every file that was skipped because of an error, if such files exist.
+"""
+
+import json
+import os
+import sys
+from array import array
+from os.path import join
+
+import numpy as np
+from scipy import sparse
+from tqdm import tqdm
+
+import instrumentation
+from corpus import NgramStore, open_corpus
+from term_matrix import ARTICLES_FILE, MANIFEST_FILE, MATRIX_FILE, VOCAB_FILE
+
+
+NGRAM_VALUES = (1, 2, 3)
+
+
+def build_term_matrix(JSTOR_HOME:str, OUTPUT_PATH:str, files:list=None):
+    '''Builds the article x term matrix for the corpus at JSTOR_HOME and saves it in OUTPUT_PATH.
+
+    Args:
+        JSTOR_HOME (str): extracted JSTOR data folder or packed n-gram store
+        OUTPUT_PATH (str): folder to write the matrix into
+        files (list): article ids to include; defaults to every article with an n-gram file
+
+    Returns:
+        skipped (list of str): '{article_id}-ngram{N}' of every file that could not be read
+    '''
+
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    corpus = open_corpus(JSTOR_HOME)
+    packed = isinstance(corpus, NgramStore) # store term ids can be used as columns directly
+
+    if files is None:
+        files = sorted(set().union(*[corpus.articles(ngram_value) for ngram_value in NGRAM_VALUES]))
+
+    # Columns: for a store, [unigram | bigram | trigram] vocabularies back to back, so its term ids can be offset
+    # directly; for text files, terms are interned in order of first appearance (n-gram sizes never collide,
+    # since they differ in number of words)
+    if packed:
+        vocab, offsets = [], {}
+        for ngram_value in NGRAM_VALUES:
+            offsets[ngram_value] = len(vocab)
+            vocab.extend(corpus.vocab(ngram_value))
+    else:
+        term_col = {}
+
+    # 32-bit columns and counts (4 + 4 bytes per nonzero while the corpus is read); 64-bit row offsets
+    indptr, indices, data = array('q', [0]), array('i'), array('i')
+    skipped = []
+
+    for file in tqdm(files):
+        for ngram_value in NGRAM_VALUES:
+            start = len(indices)
+            try:
+                if packed:
+                    term_ids, counts = corpus.read(file, ngram_value)
+                    indices.extend((term_ids.astype(np.int64) + offsets[ngram_value]).tolist())
+                    data.extend(counts.tolist())
+                else:
+                    for term, count in corpus.read_ngrams(file, ngram_value):
+                        indices.append(term_col.setdefault(term, len(term_col)))
+                        data.append(count)
+            except Exception:
+                del indices[start:], data[start:]
+                skipped.append(f'{file}-ngram{ngram_value}')
+        indptr.append(len(indices))
+
+    if not packed:
+        vocab = list(term_col) # dicts keep insertion order, i.e. column order
+
+    assert len(vocab) < 2 ** 31, 'Vocabulary of {} terms does not fit in 32-bit column indices.'.format(len(vocab))
+    # scipy keeps indptr and indices in one index type: 32-bit up to 2**31 nonzeros, both 64-bit beyond
+    matrix = sparse.csr_matrix((np.frombuffer(data, dtype=np.int32), np.frombuffer(indices, dtype=np.int32),
+                                np.frombuffer(indptr, dtype=np.int64)), shape=(len(files), len(vocab)))
+    matrix.sum_duplicates() # in case an n-gram file lists the same term twice
+
+    sparse.save_npz(join(OUTPUT_PATH, MATRIX_FILE), matrix)
+    with open(join(OUTPUT_PATH, ARTICLES_FILE), 'w', newline='\n') as f:
+        f.writelines(file + '\n' for file in files)
+    with open(join(OUTPUT_PATH, VOCAB_FILE), 'w', newline='\n') as f:
+        f.writelines(term + '\n' for term in vocab)
+    with open(join(OUTPUT_PATH, MANIFEST_FILE), 'w') as f:
+        json.dump({'source': os.path.abspath(JSTOR_HOME), 'num_articles': len(files), 'num_terms': len(vocab)}, f, indent=2)
+
+    return skipped
+
+
+if __name__ == '__main__':
+    instrumentation.setup('build_term_matrix') # before reading sys.argv: removes --metrics/--profile/--sample
+    if len(sys.argv) not in (3, 4):
+        print(__doc__)
+        exit()
+
+    JSTOR_HOME, OUTPUT_PATH = sys.argv[1:3]
+    files = None
+    if len(sys.argv) == 4:
+        with open(sys.argv[3], 'r') as f:
+            files = [line.strip() for line in f.read().splitlines() if line.strip()]
+
+    skipped = build_term_matrix(JSTOR_HOME, OUTPUT_PATH, files)
+
+    if skipped:
+        LOG_FILE = join(OUTPUT_PATH, 'build.log')
+        with open(LOG_FILE, 'w') as log_file:
+            log_file.writelines(file + '\n' for file in skipped)
+        print('One or more files are skipped because of an error occurred when processing them. Check {} for these files.'.format(LOG_FILE))
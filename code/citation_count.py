@@ -0,0 +1,230 @@
+"""
+ARGUMENTS: python3 citation_count.py <path-to-jstor-data> <output-path> [<article-list> [<surnames-file> [<authors-file>]]]
+    <path-to-jstor-data>: extracted JSTOR data folder, receipt archives, or a packed n-gram store built by 'build_ngram_store'.
+    <article-list>: text file with one article id per line (e.g. 'journal-article-10.2307_2065002'), or 'all' (default)
+        for every article that has a unigram file.
+    <surnames-file>: surnames separated by '|' or new lines (default '../article_data/surnames.txt').
+    <authors-file>: further author names to count, one per line, e.g. author pairs such as 'pfeffer salancik'
+        (default: the author lists of 'Citation_Count.ipynb', AUTHOR_LISTS); 'none' to count only the surnames.
+USAGE: Counts how often every author is mentioned in every article, for the whole surname list at once: names are
+    normalized (case-folded, trailing commas and extra spaces removed, entries that are not names dropped) and compiled
+    into one lookup per n-gram size, so each article's unigram and bigram files are read once for all authors.
+    One-word names are matched in the unigram files and two-word names (pairs such as 'pfeffer salancik', or surnames
+    such as 'van lear') in the bigram files; longer names cannot be matched in either and are left out. Articles are
+    served to a pool of workers (see 'scheduler.py').
+    The output has the layout of 'build_term_matrix', with authors as terms, so per-perspective counts (the
+    '<perspective>_author_count' columns of 'Citation_Count.ipynb') are one sparse product:
+
+        from term_matrix import TermMatrix
+        counts_df = TermMatrix('citation_counts').count_dictionaries(
+            ALL_DICTS=list(AUTHOR_LISTS.values()), DICT_NAMES=[p + '_author' for p in AUTHOR_LISTS])
+
+OUTPUT: In <output-path>: 'term_matrix.npz' (scipy CSR, articles x authors), 'articles.txt' (row labels),
+    'vocab.txt' (column labels: author names, case-folded) and 'term_matrix.json' (source and shape).
+ERROR LOG: '<output-path>/citation_count.log' lists every n-gram file that could not be read, if such files exist.
+"""
+
+import json
+import os
+import re
+import sys
+from array import array
+from os.path import join
+
+import numpy as np
+from scipy import sparse
+from tqdm import tqdm
+
+import instrumentation
+from corpus import NgramStore, open_corpus
+from scheduler import run_tasks
+from term_matrix import ARTICLES_FILE, MANIFEST_FILE, MATRIX_FILE, VOCAB_FILE
+
+
+NGRAM_VALUES = (1, 2) # names of one or two words
+NAME_PATTERN = re.compile(r"[^\W\d_]+(?:[ '\-.]+[^\W\d_]+)*\.?") # letters, joined by spaces, hyphens, apostrophes or periods
+
+# Authors counted in 'Citation_Count.ipynb', by perspective
+AUTHOR_LISTS = {
+    'cultural': ['meyer rowan', 'dimaggio powell', 'powell dimaggio', 'oliver', 'powell', 'scott', 'weick'],
+    'demographic': ['hannan freeman', 'barnett carroll', 'barron west', 'brüderl schüssler', 'carrol hannan',
+                    'freeman carrol', 'fichman levinthal', 'carrol'],
+    'relational': ['pfeffer salancik', 'burt christman', 'pfeffer nowak', 'pfeffer'],
+}
+
+
+def normalize_name(name:str):
+    '''Case-folded name with single spaces between words, e.g. 'LEONARD,' -> 'leonard', 'Van  Lear' -> 'van lear';
+    '' if it is not a name (e.g. markup fragments such as 'valignbottom_west').'''
+
+    name = ' '.join(name.strip().strip(',').split()).casefold()
+    return name if NAME_PATTERN.fullmatch(name) else ''
+
+
+def read_names(path:str):
+    '''Normalized names in a file of names separated by '|' or new lines, without duplicates, in file order.'''
+
+    with open(path, 'r') as f:
+        names = [normalize_name(name) for name in re.split('[|\n]', f.read())]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def compile_authors(names:list):
+    '''One lookup per n-gram size from the names that fit in it.
+
+    Returns:
+        authors (list of str): column labels, in order of first appearance
+        lookup (dict): {ngram_value: {name: column}}
+        too_long (list of str): names of more than two words, which are left out
+    '''
+
+    authors, lookup, too_long = [], {ngram_value: {} for ngram_value in NGRAM_VALUES}, []
+    for name in dict.fromkeys(names):
+        ngram_value = len(name.split(' '))
+        if ngram_value in lookup:
+            lookup[ngram_value][name] = len(authors)
+            authors.append(name)
+        else:
+            too_long.append(name)
+    return authors, lookup, too_long
+
+
+def encode_lookup(corpus, lookup:dict):
+    '''Re-keys the lookup by the corpus' own keys. A packed store is re-keyed by term id, including every spelling
+    that case-folds to a name, so its articles are matched without folding each key.
+
+    Returns:
+        encoded (dict): {ngram_value: {corpus key: column}}
+        fold (bool): True if keys must still be case-folded when they miss (text files)
+    '''
+
+    if not isinstance(corpus, NgramStore):
+        return lookup, True
+
+    encoded = {}
+    for ngram_value, names in lookup.items():
+        encoded[ngram_value] = {term_id: names[term.casefold()] for term_id, term in enumerate(corpus.vocab(ngram_value))
+                                if term.casefold() in names}
+    return encoded, False
+
+
+def count_authors(file:str, corpus, lookup:dict, fold:bool):
+    '''Counts the mentions of every author in one article's unigram and bigram files.
+
+    Returns:
+        hits (dict): {column: count} of the authors mentioned
+        failed (list of str): '{article_id}-ngram{N}' of every file that could not be read
+    '''
+
+    hits, failed = {}, []
+    for ngram_value in NGRAM_VALUES:
+        names = lookup[ngram_value]
+        try:
+            for key, count in corpus.read_keys(file, ngram_value):
+                col = names.get(key)
+                if col is None and fold and not key.islower(): # e.g. 'Pfeffer'; lower-case keys are already folded
+                    col = names.get(key.casefold())
+                if col is not None:
+                    hits[col] = hits.get(col, 0) + count
+        except Exception:
+            failed.append(f'{file}-ngram{ngram_value}')
+
+    instrumentation.add(dictionary_hits=sum(hits.values()), errors=len(failed))
+    return hits, failed
+
+
+# Per-worker state, set once by `_init_worker()` so the lookup isn't re-sent with every batch
+_worker_args = None
+
+def _init_worker(corpus, lookup, fold):
+    global _worker_args
+    _worker_args = (corpus, lookup, fold) # the parent's corpus: archives aren't re-listed in every worker
+
+def _count_authors_worker(file):
+    return count_authors(file, *_worker_args)
+
+
+def count_citations(JSTOR_HOME:str, OUTPUT_PATH:str, names:list, files:list=None, processes:int=None):
+    '''Counts every author in names in every article and saves the sparse article x author matrix in OUTPUT_PATH.
+
+    Args:
+        JSTOR_HOME (str): JSTOR data folder, receipt archives or packed n-gram store
+        OUTPUT_PATH (str): folder to write the matrix into
+        names (list): normalized author names (see `normalize_name()`)
+        files (list): article ids; defaults to every article with a unigram file
+        processes (int): worker processes; defaults to `scheduler.pool_size('io')`, 1 runs in this process
+
+    Returns:
+        skipped (list of str): '{article_id}-ngram{N}' of every file that could not be read
+        too_long (list of str): names of more than two words, which were not counted
+    '''
+
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    corpus = open_corpus(JSTOR_HOME)
+    if files is None:
+        files = corpus.articles(1)
+
+    authors, lookup, too_long = compile_authors(names)
+    lookup, fold = encode_lookup(corpus, lookup)
+
+    results = {}
+    for file, result in tqdm(run_tasks(_count_authors_worker, files, kind='io', processes=processes,
+                                       initializer=_init_worker, initargs=(corpus, lookup, fold)),
+                             total=len(files)):
+        results[file] = result
+
+    # Rows in article order; only the authors an article mentions are stored
+    indptr, indices, data = array('q', [0]), array('q'), array('q')
+    skipped = []
+    for file in files:
+        hits, failed = results.pop(file)
+        indices.extend(sorted(hits))
+        data.extend(hits[col] for col in sorted(hits))
+        indptr.append(len(indices))
+        skipped.extend(failed)
+
+    matrix = sparse.csr_matrix((np.frombuffer(data, dtype=np.int64), np.frombuffer(indices, dtype=np.int64),
+                                np.frombuffer(indptr, dtype=np.int64)), shape=(len(files), len(authors)))
+
+    sparse.save_npz(join(OUTPUT_PATH, MATRIX_FILE), matrix)
+    with open(join(OUTPUT_PATH, ARTICLES_FILE), 'w', newline='\n') as f:
+        f.writelines(file + '\n' for file in files)
+    with open(join(OUTPUT_PATH, VOCAB_FILE), 'w', newline='\n') as f:
+        f.writelines(author + '\n' for author in authors)
+    with open(join(OUTPUT_PATH, MANIFEST_FILE), 'w') as f:
+        json.dump({'source': os.path.abspath(JSTOR_HOME), 'num_articles': len(files), 'num_terms': len(authors),
+                   'kind': 'citations'}, f, indent=2)
+
+    return skipped, too_long
+
+
+if __name__ == '__main__':
+    instrumentation.setup('citation_count') # before reading sys.argv: removes --metrics/--profile/--sample
+    if len(sys.argv) not in range(3, 7):
+        print(__doc__)
+        exit()
+
+    JSTOR_HOME, OUTPUT_PATH = sys.argv[1:3]
+    ARTICLE_LIST = sys.argv[3] if len(sys.argv) > 3 else 'all'
+    SURNAMES = sys.argv[4] if len(sys.argv) > 4 else '../article_data/surnames.txt'
+    AUTHORS = sys.argv[5] if len(sys.argv) > 5 else None
+
+    files = None
+    if ARTICLE_LIST != 'all':
+        with open(ARTICLE_LIST, 'r') as f:
+            files = [line.strip() for line in f.read().splitlines() if line.strip()]
+
+    names = read_names(SURNAMES)
+    if AUTHORS is None:
+        names += [normalize_name(name) for names_list in AUTHOR_LISTS.values() for name in names_list]
+    elif AUTHORS != 'none':
+        names += read_names(AUTHORS)
+
+    skipped, too_long = count_citations(JSTOR_HOME, OUTPUT_PATH, names, files)
+
+    print('Counted {} authors; left out {} names of more than two words'.format(len(set(names)) - len(too_long), len(too_long)))
+    if skipped:
+        LOG_FILE = join(OUTPUT_PATH, 'citation_count.log')
+        with open(LOG_FILE, 'w') as log_file:
+            log_file.writelines(file + '\n' for file in skipped)
+        print('One or more files are skipped because of an error occurred when processing them. Check {} for these files.'.format(LOG_FILE))
@@ -1,6 +1,10 @@
 """
-ARGUMENTS: python3 combine_ngram_result.py <path-to-ngram-results> <total-number-of-parts>
+ARGUMENTS: python3 combine_ngram_result.py <path-to-ngram-results> <total-number-of-parts> [<format>]
+    <format>: 'hdf' (default) or 'parquet', as passed to 'parse_ngram_files'.
 USAGE: combines all parts of n-gram results for all three types of n-gram.
+OUTPUT: 'ngram_combined.h5' in <path-to-ngram-results>, indexed on 'file_name', in HDF5 table format; with format
+    'parquet', 'ngram_combined.parquet'. From either, notebooks (and 'engagement') can read just the columns they need,
+    e.g. pd.read_hdf('ngram_combined.h5', columns=['ngram_1_count', 'culture_1_count']).
 """
 
 import pandas as pd
@@ -8,32 +12,30 @@ import sys
 
 from os.path import join
 
+import instrumentation
+from result_store import FORMATS, arrow_table, read_parts
 
-if len(sys.argv) != 3:
+instrumentation.setup('ngram_combine') # before reading sys.argv: removes --metrics/--profile/--sample
+
+
+if len(sys.argv) not in (3, 4):
     print(__doc__)
     exit()
 
 PATH = sys.argv[1]
 NUM_PARTS = int(sys.argv[2])
+FORMAT = sys.argv[3] if len(sys.argv) == 4 else 'hdf'
+assert FORMAT in FORMATS, f"Unknown format {FORMAT!r}; options are: {', '.join(FORMATS)}"
 
-unigram = pd.DataFrame(columns=['ngram_1_count', 'culture_1_count', 'demographic_1_count', 'relational_1_count'])
-unigram.index.name = 'file_name'
-
-for i in range(1, NUM_PARTS + 1):
-    unigram = unigram.append(pd.read_hdf(join(PATH, 'ngram1_part{}.h5').format(i)), ignore_index=True)
-
-bigram = pd.DataFrame(columns=['ngram_2_count', 'culture_2_count', 'demographic_2_count', 'relational_2_count'])
-bigram.index.name = 'file_name'
-
-for i in range(1, NUM_PARTS + 1):
-    bigram = bigram.append(pd.read_hdf(join(PATH, 'ngram2_part{}.h5').format(i)), ignore_index=True)
-
-trigram = pd.DataFrame(columns=['ngram_3_count', 'culture_3_count', 'demographic_3_count', 'relational_3_count'])
-trigram.index.name = 'file_name'
-
-for i in range(1, NUM_PARTS + 1):
-    trigram = trigram.append(pd.read_hdf(join(PATH, 'ngram3_part{}.h5').format(i)), ignore_index=True)
+# Read every part of each n-gram type at once, rather than appending them one by one
+unigram = read_parts(PATH, 'ngram', NUM_PARTS, FORMAT, ngram=1)
+bigram = read_parts(PATH, 'ngram', NUM_PARTS, FORMAT, ngram=2)
+trigram = read_parts(PATH, 'ngram', NUM_PARTS, FORMAT, ngram=3)
 
 combined = unigram.join(bigram).join(trigram)
 
-combined.to_hdf(join(PATH, 'ngram_combined.h5'), key='ngram', mode='w')
+if FORMAT == 'parquet':
+    import pyarrow.parquet as pq
+    pq.write_table(arrow_table(combined), join(PATH, 'ngram_combined.parquet'))
+else:
+    combined.to_hdf(join(PATH, 'ngram_combined.h5'), key='ngram', mode='w', format='table') # readable by column
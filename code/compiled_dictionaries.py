@@ -0,0 +1,188 @@
+'''
+@description: Compiled dictionaries, built once by `build_dictionaries.py` (or on first use by `load_dictionaries()`)
+instead of every counting script re-reading and re-normalizing the dictionary files. Compiling reads every dictionary
+under a dictionaries folder, normalizes its terms (commas and spaces between words become underscores, trailing
+commas are dropped), removes the terms in the blacklist (e.g. '../article_data/expanded_dict_blacklist.csv') and saves
+one versioned pickle holding, for every dictionary set:
+
+    terms:        {perspective: [term, ...]} in file order, e.g. ['avoidance_inspection', ...]
+    ngram_terms:  {perspective: {n: frozenset of n-gram keys}}, keys with spaces between words as in the n-gram files
+    term_index:   {n: {n-gram key: (perspective, ...)}}, the perspectives each term belongs to
+
+plus a fingerprint of the content, which changes whenever any term, set or the blacklist does. Loading is a single
+unpickle with nothing left to parse, and the loaded object (or any of its maps) can be handed to pool workers as is.
+
+Dictionary sets follow the folder layout: 'original/cultural_original.csv' is perspective 'cultural' of set
+'original', 'core/orgs.csv' is perspective 'orgs' of set 'core', 'expanded_decades/cultural_1971_1981.txt' is
+perspective 'cultural' of set 'expanded_1971_1981' (as in `dict_count_sets.py`), and files directly in the folder
+(e.g. 'Culture.csv' in the pipeline's 'Dictionaries/') form set 'main'.
+
+@usage:
+    dictionaries = load_dictionaries('compiled_dictionaries.pkl', DICTS_HOME, BLACKLIST) # rebuilt if stale
+    dem = dictionaries.terms('expanded_2004_2014', 'demographic')
+    culture_bigrams = dictionaries.ngram_terms('main', 'Culture', 2)
+'''
+
+import hashlib
+import json
+import os
+import pickle
+import re
+from os.path import basename, dirname, exists, getmtime, join, relpath, splitext
+
+
+FORMAT_VERSION = 1 # bump when the layout of the saved object changes; older files are then rebuilt
+NGRAM_VALUES = (1, 2, 3)
+EXTENSIONS = ('.csv', '.txt')
+MAIN_SET = 'main' # set name for dictionaries directly in the dictionaries folder
+SET_PREFIXES = {'expanded_decades': 'expanded'} # folder -> set name prefix, for files with a suffix (e.g. a decade)
+
+
+def normalize_term(line:str):
+    '''Term with underscores between words, e.g. 'avoidance,inspection' or 'dimaggio_powell,,' -> 'avoidance_inspection',
+    'dimaggio_powell'.'''
+    return re.sub('[, ]+', '_', line.strip().strip(','))
+
+
+def read_terms(path:str):
+    '''Normalized, non-empty terms of a dictionary file, in file order (a term listed twice is kept twice).'''
+
+    with open(path, 'r') as f:
+        terms = [normalize_term(line) for line in f.read().splitlines()]
+    return [term for term in terms if term]
+
+
+def set_name(DICTS_HOME:str, path:str):
+    '''Dictionary set and perspective of a dictionary file, from its folder and name (see the module description).'''
+
+    folder = dirname(relpath(path, DICTS_HOME))
+    perspective, _, suffix = splitext(basename(path))[0].partition('_')
+    if not folder:
+        return (suffix or MAIN_SET), perspective
+    if not suffix or suffix == folder:
+        return folder, perspective
+    return '{}_{}'.format(SET_PREFIXES.get(folder, folder), suffix), perspective
+
+
+def dictionary_files(DICTS_HOME:str):
+    '''Every dictionary file under DICTS_HOME, in sorted order.'''
+
+    return sorted(join(root, file) for root, _, files in os.walk(DICTS_HOME) for file in files
+                  if splitext(file)[1] in EXTENSIONS)
+
+
+class CompiledDictionaries:
+    '''Every dictionary set under a dictionaries folder, normalized, with blacklisted terms removed.'''
+
+    def __init__(self, content:dict):
+        assert content.get('version') == FORMAT_VERSION, \
+            'Compiled dictionaries have format {}, expected {}; rebuild them.'.format(content.get('version'), FORMAT_VERSION)
+
+        self.content = content
+        self.fingerprint = content['fingerprint']
+        self.sets = content['sets']
+
+    def set_names(self):
+        return list(self.sets)
+
+    def perspectives(self, set_name:str):
+        return list(self.sets[set_name]['terms'])
+
+    def terms(self, set_name:str, perspective:str):
+        '''Terms of one dictionary in file order, words separated by underscores.'''
+        return list(self.sets[set_name]['terms'][perspective])
+
+    def ngram_terms(self, set_name:str, perspective:str, ngram_value:int):
+        '''Terms of one dictionary with ngram_value words, as n-gram keys (words separated by spaces).'''
+        return self.sets[set_name]['ngram_terms'][perspective][ngram_value]
+
+    def term_index(self, set_name:str, ngram_value:int):
+        '''{n-gram key: (perspective, ...)} for the terms of one set with ngram_value words.'''
+        return self.sets[set_name]['term_index'][ngram_value]
+
+    def perspective_map(self, set_name:str):
+        '''{term: perspective} for one set (underscored terms); a term in several dictionaries maps to the last one.'''
+        return {term: perspective for perspective, terms in self.sets[set_name]['terms'].items() for term in terms}
+
+    def dict_sets(self, set_names:list=None):
+        '''{set_name: {perspective: [term, ...]}}, as `ngram_counting.generate_dict_set_counts()` takes them.'''
+        return {name: {perspective: list(terms) for perspective, terms in self.sets[name]['terms'].items()}
+                for name in (set_names if set_names is not None else self.sets)}
+
+    def save(self, path:str):
+        '''Writes the compiled dictionaries to path, replacing it only once it is complete.'''
+
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.content, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path:str):
+        with open(path, 'rb') as f:
+            return cls(pickle.load(f))
+
+
+def compile_dictionaries(DICTS_HOME:str, blacklist_path:str=None):
+    '''Reads and normalizes every dictionary under DICTS_HOME and removes the terms in the blacklist.
+
+    Args:
+        DICTS_HOME (str): dictionaries folder, e.g. '../dictionaries'
+        blacklist_path (str): file with one term to drop per line, e.g. '../article_data/expanded_dict_blacklist.csv'
+
+    Returns:
+        dictionaries (CompiledDictionaries): every set found, in sorted order of their files
+    '''
+
+    blacklist = set(read_terms(blacklist_path)) if blacklist_path else set()
+
+    sets = {}
+    for path in dictionary_files(DICTS_HOME):
+        name, perspective = set_name(DICTS_HOME, path)
+        terms = read_terms(path)
+        entry = sets.setdefault(name, {'terms': {}, 'removed': {}})
+        entry['terms'][perspective] = [term for term in terms if term not in blacklist]
+        entry['removed'][perspective] = sorted(set(terms) & blacklist)
+
+    for entry in sets.values():
+        entry['ngram_terms'] = {perspective: {n: frozenset(term.replace('_', ' ') for term in terms
+                                                           if len(term.split('_')) == n) for n in NGRAM_VALUES}
+                                for perspective, terms in entry['terms'].items()}
+        term_index = {n: {} for n in NGRAM_VALUES}
+        for perspective, terms in entry['terms'].items():
+            for term in dict.fromkeys(terms): # once per dictionary, even if listed twice
+                n, key = len(term.split('_')), term.replace('_', ' ')
+                if n in term_index:
+                    term_index[n][key] = term_index[n].get(key, ()) + (perspective,)
+        entry['term_index'] = term_index
+
+    fingerprint = hashlib.sha1(json.dumps([{name: entry['terms'] for name, entry in sets.items()}, sorted(blacklist)])
+                               .encode('utf-8')).hexdigest()
+    return CompiledDictionaries({'version': FORMAT_VERSION, 'fingerprint': fingerprint, 'sets': sets,
+                                 'sources': _sources(DICTS_HOME, blacklist_path)})
+
+
+def _sources(DICTS_HOME:str, blacklist_path:str=None):
+    return {'dictionaries': os.path.abspath(DICTS_HOME),
+            'blacklist': os.path.abspath(blacklist_path) if blacklist_path else None}
+
+
+def load_dictionaries(path:str, DICTS_HOME:str=None, blacklist_path:str=None):
+    '''Loads compiled dictionaries from path. If DICTS_HOME is given, first (re)builds them when path is missing, has
+    an older format, was compiled from other files, or is older than any dictionary file or the blacklist, and saves
+    the result to path.'''
+
+    if DICTS_HOME is None:
+        return CompiledDictionaries.load(path)
+
+    sources = dictionary_files(DICTS_HOME) + ([blacklist_path] if blacklist_path else [])
+    if exists(path) and getmtime(path) >= max((getmtime(source) for source in sources), default=0):
+        with open(path, 'rb') as f:
+            content = pickle.load(f)
+        if content.get('version') == FORMAT_VERSION and content.get('sources') == _sources(DICTS_HOME, blacklist_path):
+            return CompiledDictionaries(content)
+
+    os.makedirs(dirname(os.path.abspath(path)), exist_ok=True)
+    dictionaries = compile_dictionaries(DICTS_HOME, blacklist_path)
+    dictionaries.save(path)
+    return dictionaries
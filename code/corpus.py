@@ -0,0 +1,306 @@
+'''
+@description: Readers for the JSTOR n-gram corpus. Counting scripts ask a corpus object for an article's n-grams
+instead of opening `journal-article-*-ngram{N}.txt` files themselves, so the same code runs against any layout:
+
+    TextCorpus:     the extracted text files, `{JSTOR_HOME}/ngram{N}/{article_id}-ngram{N}.txt`
+    ArchiveCorpus:  the raw JSTOR receipt archives (.zip or uncompressed .tar), read member by member without
+                    extracting them; JSTOR_HOME is one archive or a folder of archives
+    NgramStore:     the packed binary store written by `build_ngram_store.py` (interned vocabulary, sharded
+                    memory-mapped (term_id, count) arrays plus an offsets index)
+
+`open_corpus(JSTOR_HOME)` picks the right reader for a path. All readers share this interface:
+
+    corpus.articles(ngram_value)                   -> list of article ids
+    corpus.read_ngrams(article_id, ngram_value)    -> iterator of (term, count), terms use spaces between words
+    corpus.encode(ngram_value, term_map)           -> term_map re-keyed by what `read_keys()` yields
+    corpus.read_keys(article_id, ngram_value)      -> iterator of (key, count); keys are terms for text files and
+                                                      integer term ids for the store, so dictionary lookups never
+                                                      have to decode the vocabulary
+    corpus.source_key(article_id, ngram_value)     -> (source, signature) identifying the file and its contents,
+                                                      used as the key of `result_cache`
+
+TextCorpus and ArchiveCorpus also list and open the metadata XML files (the store holds n-grams only):
+
+    corpus.metadata_files()                        -> list of metadata file names (paths, for extracted files)
+    corpus.open_metadata(name)                     -> binary file object for one of those names
+'''
+
+import errno
+import json
+import os
+import re
+import tarfile
+import zipfile
+from os.path import isdir, isfile, join
+
+import numpy as np
+
+import instrumentation
+
+
+STORE_MANIFEST = 'store.json'
+STORE_VERSION = 1
+ARCHIVE_EXTENSIONS = ('.zip', '.tar')
+
+
+def is_archive(path:str):
+    return isfile(path) and path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def open_corpus(JSTOR_HOME:str):
+    '''Returns an NgramStore if JSTOR_HOME holds a packed store, an ArchiveCorpus if it is an archive or a folder of
+    archives (and no extracted 'ngram1' or 'metadata' folder), otherwise a TextCorpus over extracted files.'''
+
+    if isfile(join(JSTOR_HOME, STORE_MANIFEST)):
+        return NgramStore(JSTOR_HOME)
+    if is_archive(JSTOR_HOME):
+        return ArchiveCorpus([JSTOR_HOME])
+    if isdir(JSTOR_HOME) and not isdir(join(JSTOR_HOME, 'ngram1')) and not isdir(join(JSTOR_HOME, 'metadata')):
+        archives = sorted(join(JSTOR_HOME, file) for file in os.listdir(JSTOR_HOME) if is_archive(join(JSTOR_HOME, file)))
+        if archives:
+            return ArchiveCorpus(archives)
+    return TextCorpus(JSTOR_HOME)
+
+
+def read_article_list(path:str):
+    '''Article ids in a text file with one id per line (e.g. written by `build_allowlist.py`), in file order; blank
+    lines are skipped, and the last line needs no trailing newline.'''
+
+    with open(path, 'r') as f:
+        return [line.strip() for line in f.read().splitlines() if line.strip()]
+
+
+def parse_ngram_lines(text:str):
+    '''Yields (term, count) from the contents of an n-gram file.'''
+    for line in text.splitlines():
+        term, count = line.split('\t')
+        yield term, int(count)
+
+
+class TextCorpus:
+    '''Extracted JSTOR n-gram text files, one tab-separated "term<TAB>count" line per n-gram.'''
+
+    def __init__(self, JSTOR_HOME:str):
+        self.JSTOR_HOME = JSTOR_HOME
+
+    def path(self, article_id:str, ngram_value:int):
+        return join(self.JSTOR_HOME, f'ngram{ngram_value}', f'{article_id}-ngram{ngram_value}.txt')
+
+    def articles(self, ngram_value:int):
+        suffix = f'-ngram{ngram_value}.txt'
+        path, dirs, files = next(os.walk(join(self.JSTOR_HOME, f'ngram{ngram_value}')))
+        return [file[:-len(suffix)] for file in files if file.endswith(suffix)]
+
+    def read_ngrams(self, article_id:str, ngram_value:int):
+        with open(self.path(article_id, ngram_value), 'r') as f:
+            text = f.read()
+            instrumentation.add(files=1, bytes_read=os.fstat(f.fileno()).st_size, lines=text.count('\n'))
+        yield from parse_ngram_lines(text)
+
+    def encode(self, ngram_value:int, term_map:dict):
+        return term_map
+
+    read_keys = read_ngrams
+
+    def source_key(self, article_id:str, ngram_value:int):
+        path = self.path(article_id, ngram_value)
+        stat = os.stat(path)
+        return path, f'{stat.st_size}:{stat.st_mtime_ns}'
+
+    def metadata_files(self):
+        path, dirs, files = next(os.walk(join(self.JSTOR_HOME, 'metadata/')))
+        return [(path + file) for file in files] # Add folder name "path" as prefix to file
+
+    def open_metadata(self, name:str):
+        f = open(name, 'rb')
+        instrumentation.add(files=1, bytes_read=os.fstat(f.fileno()).st_size)
+        return f
+
+
+class ArchiveCorpus:
+    '''JSTOR receipt archives (.zip or uncompressed .tar), read in place.
+
+    Members are found by their file names wherever they sit in the archive, e.g.
+    'receipt-id-989431-part-001/ngram2/journal-article-10.2307_2065002-ngram2.txt' or
+    'receipt-id-989431-part-001/metadata/journal-article-10.2307_2065002.xml'. Only the archives' member lists are
+    read up front (the zip central directory, or the tar headers); each member is then read straight from its
+    offset when it is asked for, so nothing is extracted to disk. Each process opens its own handles, so a corpus
+    (and its member index, built once) can be passed to worker processes instead of reopened there. Compressed tars can't be read at random offsets; convert them to .zip or
+    decompress them to .tar first.
+    '''
+
+    NGRAM_MEMBER = re.compile(r'(?:^|/)ngram([123])/(journal-article-.+)-ngram\1\.txt$')
+    METADATA_MEMBER = re.compile(r'(?:^|/)metadata/(journal-article-.+\.xml)$')
+
+    def __init__(self, archives:list):
+        self.archives = [os.path.abspath(archive) for archive in archives]
+        self._handles = (None, {}) # (process id, {archive index: open archive})
+
+        self._ngrams = {} # (ngram_value, article_id) -> (archive index, member)
+        self._metadata = {} # 'archive::member' -> (archive index, member)
+        for i in range(len(self.archives)):
+            for member in self.members(i):
+                name = member.filename if isinstance(member, zipfile.ZipInfo) else member.name
+                match = self.NGRAM_MEMBER.search(name)
+                if match:
+                    self._ngrams[(int(match.group(1)), match.group(2))] = (i, member)
+                elif self.METADATA_MEMBER.search(name):
+                    self._metadata[f'{self.archives[i]}::{name}'] = (i, member)
+
+    def __getstate__(self): # pickled for spawned workers: send the member index, not the open handles
+        return dict(self.__dict__, _handles=(None, {}))
+
+    def archive(self, i:int):
+        '''Returns this process' open handle to archive i.'''
+        pid, handles = self._handles
+        if pid != os.getpid(): # handles (and their file positions) must not be shared with forked workers
+            handles = {}
+            self._handles = (os.getpid(), handles)
+        if i not in handles:
+            path = self.archives[i]
+            handles[i] = zipfile.ZipFile(path) if zipfile.is_zipfile(path) else tarfile.open(path, 'r:')
+        return handles[i]
+
+    def members(self, i:int):
+        archive = self.archive(i)
+        if isinstance(archive, zipfile.ZipFile):
+            return [member for member in archive.infolist() if not member.is_dir()]
+        return [member for member in archive.getmembers() if member.isfile()]
+
+    def read_member(self, i:int, member):
+        archive = self.archive(i)
+        if isinstance(archive, zipfile.ZipFile):
+            return archive.read(member)
+        return archive.extractfile(member).read()
+
+    def member(self, article_id:str, ngram_value:int):
+        if (ngram_value, article_id) not in self._ngrams: # behave like opening a missing text file
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), f'{article_id}-ngram{ngram_value}')
+        return self._ngrams[(ngram_value, article_id)]
+
+    def path(self, article_id:str, ngram_value:int):
+        i, member = self.member(article_id, ngram_value)
+        name = member.filename if isinstance(member, zipfile.ZipInfo) else member.name
+        return f'{self.archives[i]}::{name}'
+
+    def articles(self, ngram_value:int):
+        return [article_id for value, article_id in self._ngrams if value == ngram_value]
+
+    def read_ngrams(self, article_id:str, ngram_value:int):
+        data = self.read_member(*self.member(article_id, ngram_value))
+        instrumentation.add(files=1, bytes_read=len(data), lines=data.count(b'\n'))
+        yield from parse_ngram_lines(data.decode('utf-8'))
+
+    def encode(self, ngram_value:int, term_map:dict):
+        return term_map
+
+    read_keys = read_ngrams
+
+    def source_key(self, article_id:str, ngram_value:int):
+        i, member = self.member(article_id, ngram_value)
+        if isinstance(member, zipfile.ZipInfo):
+            return self.path(article_id, ngram_value), f'{member.file_size}:{member.CRC}'
+        return self.path(article_id, ngram_value), f'{member.size}:{member.mtime}'
+
+    def metadata_files(self):
+        return list(self._metadata)
+
+    def open_metadata(self, name:str):
+        i, member = self._metadata[name]
+        archive = self.archive(i)
+        instrumentation.add(files=1, bytes_read=member.file_size if isinstance(member, zipfile.ZipInfo) else member.size)
+        if isinstance(archive, zipfile.ZipFile):
+            return archive.open(member)
+        return archive.extractfile(member)
+
+
+class NgramStore:
+    '''Packed binary n-gram corpus, memory-mapped on first access.
+
+    Layout of a store directory:
+        store.json                      manifest: version, ngram values, number of shards per ngram value
+        articles.txt                    article ids, one per line; line number = article index
+        ngram{N}_vocab.txt              interned terms, one per line; line number = term id
+        ngram{N}_index.npy              int64 (num_articles, 3): shard, start, end of each article's rows
+                                        (shard -1 = the article has no ngram{N} file)
+        ngram{N}_shard{S}_terms.npy     uint32 term ids of every article in shard S, concatenated
+        ngram{N}_shard{S}_counts.npy    uint32 counts, aligned with the term ids
+    '''
+
+    def __init__(self, path:str):
+        with open(join(path, STORE_MANIFEST), 'r') as f:
+            self.manifest = json.load(f)
+        assert self.manifest['version'] == STORE_VERSION, f"Unsupported n-gram store version {self.manifest['version']} in {path}; rebuild it with build_ngram_store.py."
+
+        self.path = path
+        with open(join(path, 'articles.txt'), 'r', newline='\n') as f:
+            self.article_ids = f.read().split('\n')[:-1]
+        self.article_idx = {article_id: i for i, article_id in enumerate(self.article_ids)}
+
+        self._index = {}
+        self._shards = {}
+        self._vocab = {}
+
+    def __getstate__(self): # pickled for spawned workers: each one maps the arrays again instead of copying them
+        return dict(self.__dict__, _index={}, _shards={})
+
+    def index(self, ngram_value:int):
+        if ngram_value not in self._index:
+            self._index[ngram_value] = np.load(join(self.path, f'ngram{ngram_value}_index.npy'), mmap_mode='r')
+        return self._index[ngram_value]
+
+    def shard(self, ngram_value:int, shard:int):
+        key = (ngram_value, shard)
+        if key not in self._shards:
+            prefix = join(self.path, f'ngram{ngram_value}_shard{shard:04d}')
+            self._shards[key] = (np.load(prefix + '_terms.npy', mmap_mode='r'),
+                                 np.load(prefix + '_counts.npy', mmap_mode='r'))
+        return self._shards[key]
+
+    def vocab(self, ngram_value:int):
+        '''Returns the list of interned terms (loaded once; only needed to decode term ids).'''
+        if ngram_value not in self._vocab:
+            with open(join(self.path, f'ngram{ngram_value}_vocab.txt'), 'r', newline='\n') as f:
+                self._vocab[ngram_value] = f.read().split('\n')[:-1] # terms never contain '\n', but may contain '\r'
+        return self._vocab[ngram_value]
+
+    def articles(self, ngram_value:int):
+        index = self.index(ngram_value)
+        return [article_id for article_id, shard in zip(self.article_ids, index[:, 0]) if shard >= 0]
+
+    def read(self, article_id:str, ngram_value:int):
+        '''Returns (term_ids, counts) arrays for one article, without copying them out of the shard.'''
+
+        idx = self.article_idx.get(article_id)
+        shard, start, end = self.index(ngram_value)[idx] if idx is not None else (-1, 0, 0)
+        if shard < 0: # behave like opening a missing text file
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), f'{article_id}-ngram{ngram_value}')
+
+        term_ids, counts = self.shard(ngram_value, int(shard))
+        return term_ids[start:end], counts[start:end]
+
+    def read_keys(self, article_id:str, ngram_value:int):
+        term_ids, counts = self.read(article_id, ngram_value)
+        instrumentation.add(files=1, bytes_read=term_ids.nbytes + counts.nbytes, lines=len(term_ids))
+        return zip(term_ids.tolist(), counts.tolist())
+
+    def read_ngrams(self, article_id:str, ngram_value:int):
+        vocab = self.vocab(ngram_value)
+        return ((vocab[term_id], count) for term_id, count in self.read_keys(article_id, ngram_value))
+
+    def source_key(self, article_id:str, ngram_value:int):
+        idx = self.article_idx.get(article_id)
+        shard, start, end = self.index(ngram_value)[idx] if idx is not None else (-1, 0, 0)
+        built = os.stat(join(self.path, STORE_MANIFEST)).st_mtime_ns # term ids change whenever the store is rebuilt
+        return f'{os.path.abspath(self.path)}/{article_id}-ngram{ngram_value}', f'{built}:{shard}:{start}:{end}'
+
+    def encode(self, ngram_value:int, term_map:dict):
+        '''Re-keys term_map by term id, streaming the vocabulary file instead of loading it.'''
+
+        encoded = {}
+        with open(join(self.path, f'ngram{ngram_value}_vocab.txt'), 'r', newline='\n') as f:
+            for term_id, term in enumerate(f):
+                term = term.rstrip('\n')
+                if term in term_map:
+                    encoded[term_id] = term_map[term]
+        return encoded
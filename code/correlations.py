@@ -0,0 +1,217 @@
+"""
+ARGUMENTS: python3 correlations.py <input-file> <output-prefix> [<method> [<bootstrap-samples> [<stratify-by> [<processes>]]]]
+    <input-file>: CSV (or Parquet, if it ends in '.parquet') with one row per article, e.g. 'counts_and_subject.csv'
+        joined with the embedding scores as in 'calculate_pearsons.ipynb'; every numeric column is correlated.
+    <method>: 'pearson' (default), 'spearman' or 'both'.
+    <bootstrap-samples>: number of bootstrap resamples for confidence intervals (default 0: none).
+    <stratify-by>: column to compute the matrices within each value of, e.g. 'primary_subject' (default 'none').
+    <processes>: worker processes for the bootstrap (default: number of cores, or PIPELINE_WORKERS).
+USAGE: Computes the full correlation matrix of the measures (word counts, Word2Vec, Doc2Vec, GloVe and InferSent
+    scores, ...) and the two-sided p-value of every coefficient in one matrix operation, instead of one
+    'stats.pearsonr' call per pair of columns. Rows with a missing value in any column are dropped first, as in
+    'calculate_pvalues'. Point-biserial correlations (as in 'cell_entries') are the Pearson correlations with a
+    boolean column, e.g. df['culture_author_count'] > 0.
+
+        from correlations import correlation_matrix, bootstrap_intervals, stratified
+        r, p = correlation_matrix(stats_df)
+        low, high = bootstrap_intervals(stats_df, samples=1000)
+        r_by_subject, p_by_subject = stratified(df, 'primary_subject', columns=measures)
+
+OUTPUT: '<output-prefix>_<method>_r.csv' and '<output-prefix>_<method>_p.csv' (coefficients and p-values), with
+    <bootstrap-samples>, '<output-prefix>_<method>_low.csv' and '<output-prefix>_<method>_high.csv' (95% percentile
+    intervals), and '<output-prefix>_describe.csv' (mean, std, min, median and max of every column). With
+    <stratify-by>, the rows of every matrix are indexed on (<stratify-by> value, column).
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from scheduler import run_tasks
+
+
+METHODS = ('pearson', 'spearman')
+
+
+def numeric_values(df:pd.DataFrame, columns:list=None):
+    '''The numeric (or boolean) columns of df as a float array, without rows that have a missing value.
+
+    Returns:
+        values (np.ndarray): rows x columns
+        columns (list): column names
+    '''
+
+    df = df[columns] if columns is not None else df.select_dtypes(include=['number', 'bool'])
+    df = df.dropna()
+    return df.to_numpy(dtype=np.float64), list(df.columns)
+
+
+def _ranks(values:np.ndarray):
+    '''Ranks of every column (ties get their average rank), for Spearman correlations.'''
+    return stats.rankdata(values, axis=0)
+
+
+def _coefficients(values:np.ndarray):
+    '''Pearson correlations of all pairs of columns, as one matrix product of the standardized columns.'''
+
+    centered = values - values.mean(axis=0)
+    norms = np.sqrt((centered ** 2).sum(axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'): # constant columns have no correlation (nan)
+        scaled = centered / norms
+        r = scaled.T @ scaled
+    return np.clip(r, -1.0, 1.0)
+
+
+def _pvalues(r:np.ndarray, n:int):
+    '''Two-sided p-values of correlations over n rows, from the t distribution with n - 2 degrees of freedom (as
+    'stats.pearsonr' and 'stats.spearmanr').'''
+
+    df = n - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = r * np.sqrt(df / ((1.0 - r) * (1.0 + r)))
+    return 2 * stats.t.sf(np.abs(t), df)
+
+
+def correlation_matrix(df:pd.DataFrame, method:str='pearson', columns:list=None):
+    '''Correlations and p-values of all pairs of columns at once.
+
+    Args:
+        df (pd.DataFrame): one row per article
+        method (str): 'pearson' or 'spearman'
+        columns (list): columns to correlate (default: every numeric or boolean column)
+
+    Returns:
+        r (pd.DataFrame): columns x columns correlation coefficients
+        p (pd.DataFrame): columns x columns two-sided p-values
+    '''
+
+    assert method in METHODS, f"Unknown method {method!r}; options are: {', '.join(METHODS)}"
+
+    values, columns = numeric_values(df, columns)
+    assert len(values) > 2, 'Need at least 3 rows without missing values, found {}.'.format(len(values))
+
+    r = _coefficients(_ranks(values) if method == 'spearman' else values)
+    p = _pvalues(r, len(values))
+    return pd.DataFrame(r, index=columns, columns=columns), pd.DataFrame(p, index=columns, columns=columns)
+
+
+def describe(df:pd.DataFrame, columns:list=None):
+    '''Mean, standard deviation, min, median and max of every column (the rows 'calculate_pearsons.ipynb' keeps from
+    describe()), over the same rows as correlation_matrix.'''
+
+    values, columns = numeric_values(df, columns)
+    summary = [values.mean(axis=0), values.std(axis=0, ddof=1), values.min(axis=0), np.median(values, axis=0),
+               values.max(axis=0)]
+    return pd.DataFrame(summary, index=['mean', 'std', 'min', 'median', 'max'], columns=columns)
+
+
+# Per-worker bootstrap data, set once by `_init_bootstrap()` rather than sent with every resample
+_values = None
+_method = None
+_seed = None
+
+def _init_bootstrap(values, method, seed):
+    global _values, _method, _seed
+    _values, _method, _seed = values, method, seed
+
+def _resample(replicate:int):
+    '''Correlations of one bootstrap resample; each replicate has its own random stream, so the intervals do not
+    depend on the number of processes.'''
+
+    rng = np.random.default_rng([_seed, replicate])
+    sample = _values[rng.integers(0, len(_values), len(_values))]
+    return _coefficients(_ranks(sample) if _method == 'spearman' else sample)
+
+
+def bootstrap_intervals(df:pd.DataFrame, method:str='pearson', samples:int=1000, confidence:float=0.95,
+                        columns:list=None, seed:int=0, processes:int=None):
+    '''Percentile bootstrap confidence intervals of all correlations, resampling articles (rows) with replacement.
+
+    Args:
+        df (pd.DataFrame): one row per article
+        method (str): 'pearson' or 'spearman'
+        samples (int): number of resamples
+        confidence (float): coverage of the intervals
+        columns (list): columns to correlate (default: every numeric or boolean column)
+        seed (int): random seed; the same seed gives the same intervals for any number of processes
+        processes (int): worker processes (default: see `scheduler.pool_size()`); 1 runs in this process
+
+    Returns:
+        low (pd.DataFrame): columns x columns lower bounds
+        high (pd.DataFrame): columns x columns upper bounds
+    '''
+
+    assert method in METHODS, f"Unknown method {method!r}; options are: {', '.join(METHODS)}"
+    assert 0 < confidence < 1, 'confidence must be between 0 and 1, not {}.'.format(confidence)
+
+    values, columns = numeric_values(df, columns)
+    replicates = np.empty((samples, len(columns), len(columns)))
+    for replicate, r in run_tasks(_resample, list(range(samples)), kind='cpu', processes=processes,
+                                  initializer=_init_bootstrap, initargs=(values, method, seed)):
+        replicates[replicate] = r
+
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+    return pd.DataFrame(low, index=columns, columns=columns), pd.DataFrame(high, index=columns, columns=columns)
+
+
+def stratified(df:pd.DataFrame, by:str, method:str='pearson', columns:list=None):
+    '''correlation_matrix within each value of column by (e.g. 'primary_subject').
+
+    Returns:
+        r (pd.DataFrame): rows indexed on (value of by, column), one columns x columns block per value
+        p (pd.DataFrame): p-values, indexed as r
+    '''
+
+    if columns is None:
+        columns = [col for col in df.select_dtypes(include=['number', 'bool']).columns if col != by]
+
+    results = {value: correlation_matrix(group, method, columns) for value, group in df.groupby(by, sort=True)
+               if len(group[columns].dropna()) > 2}
+    r = pd.concat({value: result[0] for value, result in results.items()}, names=[by, None])
+    p = pd.concat({value: result[1] for value, result in results.items()}, names=[by, None])
+    return r, p
+
+
+if __name__ == '__main__':
+    import instrumentation
+    instrumentation.setup('correlations') # before reading sys.argv: removes --metrics/--profile/--sample
+
+    if len(sys.argv) not in range(3, 8):
+        print(__doc__)
+        exit()
+
+    INFILE, PREFIX = sys.argv[1:3]
+    METHOD = sys.argv[3] if len(sys.argv) > 3 else 'pearson'
+    SAMPLES = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    BY = sys.argv[5] if len(sys.argv) > 5 else 'none'
+    PROCESSES = int(sys.argv[6]) if len(sys.argv) > 6 else None
+    assert METHOD in METHODS + ('both',), f"Unknown method {METHOD!r}; options are: {', '.join(METHODS)}, both"
+
+    data = pd.read_parquet(INFILE) if INFILE.endswith('.parquet') else pd.read_csv(INFILE)
+    measures = [col for col in data.select_dtypes(include=['number', 'bool']).columns if col != BY]
+
+    describe(data, measures).to_csv(PREFIX + '_describe.csv')
+
+    for method in (METHODS if METHOD == 'both' else [METHOD]):
+        if BY == 'none':
+            r, p = correlation_matrix(data, method, measures)
+        else:
+            r, p = stratified(data, BY, method, measures)
+        r.to_csv('{}_{}_r.csv'.format(PREFIX, method))
+        p.to_csv('{}_{}_p.csv'.format(PREFIX, method))
+
+        if SAMPLES > 0:
+            if BY == 'none':
+                low, high = bootstrap_intervals(data, method, SAMPLES, columns=measures, processes=PROCESSES)
+            else:
+                intervals = {value: bootstrap_intervals(group, method, SAMPLES, columns=measures, processes=PROCESSES)
+                             for value, group in data.groupby(BY, sort=True) if len(group[measures].dropna()) > 2}
+                low = pd.concat({value: result[0] for value, result in intervals.items()}, names=[BY, None])
+                high = pd.concat({value: result[1] for value, result in intervals.items()}, names=[BY, None])
+            low.to_csv('{}_{}_low.csv'.format(PREFIX, method))
+            high.to_csv('{}_{}_high.csv'.format(PREFIX, method))
+
+    print('Correlated {} columns'.format(len(measures)))
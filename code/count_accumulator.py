@@ -0,0 +1,152 @@
+'''
+@description: Preallocated, typed table for per-article counts. Rows are written into NumPy arrays sized up front
+(from the length of the article manifest) and the DataFrame is built once at the end, instead of copying the whole
+frame on every `counts_df.append(row)` or `df.loc[file_name, :] = ...`. Optionally, filled rows are flushed to
+numbered CSV chunk files so memory stays bounded on very long runs; the chunks double as checkpoints, which a
+restarted run picks up with `resume()`.
+
+@usage:
+    acc = CountsAccumulator(columns=['culture_count', 'relational_count'], size=len(files))
+    for file in files:
+        acc.add(file, [3, 5])        # adds into the row for `file`, creating it on first sight
+    counts_df = acc.to_frame()       # index named 'article_id', int64 columns
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class CountsAccumulator:
+    '''Columnar accumulator of counts keyed by article.'''
+
+    def __init__(self, columns:list, size:int, key_name:str='article_id', dtype=np.int64,
+                 chunk_rows:int=None, chunk_prefix:str=None):
+        '''
+        Args:
+            columns (list): names of count columns
+            size (int): expected number of articles, e.g. len(files); the arrays grow if this is exceeded
+            key_name (str): name of the index in the output DataFrame
+            dtype: NumPy dtype of the counts
+            chunk_rows (int): if set, flush to disk whenever this many rows are held in memory
+            chunk_prefix (str): path prefix for chunk files, written as '{chunk_prefix}_{chunk:05d}.csv';
+                required with chunk_rows
+        '''
+
+        assert (chunk_rows is None) == (chunk_prefix is None), 'chunk_rows and chunk_prefix must be given together.'
+
+        self.columns = list(columns)
+        self.col_idx = {col: i for i, col in enumerate(self.columns)}
+        self.key_name = key_name
+        self.dtype = dtype
+        self.chunk_rows = chunk_rows
+        self.chunk_prefix = chunk_prefix
+        self.num_chunks = 0
+
+        capacity = max(min(size, chunk_rows) if chunk_rows else size, 1)
+        self.values = np.zeros((capacity, len(self.columns)), dtype=dtype)
+        self.keys = []
+        self.rows = {} # key -> row position in self.values
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _row(self, key):
+        '''Returns the row position for key, allocating a row (and flushing or growing the arrays) if needed.'''
+
+        row = self.rows.get(key)
+        if row is not None:
+            return row
+
+        if len(self.keys) == self.values.shape[0]:
+            if self.chunk_rows:
+                self.flush()
+            else: # manifest was too short; double capacity
+                self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+
+        row = len(self.keys)
+        self.keys.append(key)
+        self.rows[key] = row
+        return row
+
+    def add(self, key, values, columns:list=None):
+        '''Adds values into the row for key.
+
+        Args:
+            key: article identifier
+            values (sequence of int): counts, in the order of `columns`
+            columns (list): subset of column names that values refer to; defaults to all columns
+        '''
+
+        row = self._row(key)
+        if columns is None:
+            self.values[row] += values
+        else:
+            self.values[row, [self.col_idx[col] for col in columns]] += values
+
+    def _frame(self):
+        '''Returns the rows currently held in memory as a DataFrame.'''
+        df = pd.DataFrame(self.values[:len(self.keys)], columns=self.columns)
+        df.index = pd.Index(self.keys, name=self.key_name)
+        return df
+
+    def flush(self):
+        '''Writes the rows held in memory to the next chunk file and clears them.'''
+
+        assert self.chunk_prefix, 'Cannot flush without chunk_prefix.'
+        if not self.keys:
+            return
+
+        path = f'{self.chunk_prefix}_{self.num_chunks:05d}.csv'
+        self._frame().to_csv(path + '.tmp')
+        os.replace(path + '.tmp', path) # a chunk file is either complete or absent, even if the run is killed
+        self.num_chunks += 1
+        self.values[:] = 0
+        self.keys = []
+        self.rows = {}
+
+    def resume(self):
+        '''Picks up the chunk files left by an earlier run with the same chunk_prefix (e.g. one that was interrupted),
+        so they are included in `to_frame()` and new chunks are numbered after them.
+
+        Returns:
+            keys (set): keys that already have rows in those chunk files
+        '''
+
+        assert self.chunk_prefix, 'Cannot resume without chunk_prefix.'
+
+        keys = set()
+        while os.path.isfile(f'{self.chunk_prefix}_{self.num_chunks:05d}.csv'):
+            chunk = pd.read_csv(f'{self.chunk_prefix}_{self.num_chunks:05d}.csv', dtype={self.key_name: str})
+            assert list(chunk.columns) == [self.key_name] + self.columns, f'Columns of {self.chunk_prefix}_{self.num_chunks:05d}.csv do not match; remove the old chunk files to start over.'
+            keys.update(chunk[self.key_name])
+            self.num_chunks += 1
+
+        return keys
+
+    def chunk_files(self):
+        '''Returns the paths of the chunk files written so far.'''
+        return [f'{self.chunk_prefix}_{chunk:05d}.csv' for chunk in range(self.num_chunks)]
+
+    def to_frame(self):
+        '''Builds the DataFrame of all counts, reading back any chunk files.
+
+        Returns:
+            df (pd.DataFrame): index named key_name, one typed column per count; an article whose counts were
+                split across chunks is summed into a single row
+        '''
+
+        if not self.chunk_rows:
+            return self._frame()
+
+        self.flush()
+        chunks = [pd.read_csv(path, index_col=self.key_name, dtype={col: self.dtype for col in self.columns})
+                  for path in self.chunk_files()]
+        if not chunks:
+            return self._frame()
+
+        df = pd.concat(chunks)
+        if df.index.has_duplicates:
+            df = df.groupby(level=0, sort=False).sum()
+        return df
@@ -8,7 +8,7 @@
 @contact: jhaber@berkeley.edu
 @inputs: list of authors OR list of terms per perspective, list of article filepaths 
 @outputs: count of authors ((citations_by_persp|dicts)_count_{thisdate}.csv), where 'thisdate' is in mmddyy format 
-@usage: run `python3 dict_count_all.py` from within `dictionary_methods/code`
+@usage: run `python3 dict_count_all.py [<article-list>]` from within `dictionary_methods/code`; with <article-list> (one article id per line, e.g. from `build_allowlist.py`), only the listed articles are opened
 @description: Counts mentions of perspectives--summed over individual words or authors--in articles by using ngram files ACROSS ALL YEARS OF DATA. To count a new list of terms or author names in the ngram files, change the list of words in the 'Update Words' section and/or change the word type to count (between 'citations' and 'terms', i.e. dictionaries), then run the script. 
 '''
 
@@ -24,11 +24,17 @@ import csv
 import pandas as pd
 import numpy as np
 import re
+import shutil
 import sys
 from datetime import date
 from tqdm import tqdm # Shows progress over iterations, including in pandas via `df.progress_apply`
 from multiprocessing import Pool, cpu_count; cores = cpu_count() # count cores
 from functools import partial
+from ngram_counting import generate_article_counts
+from corpus import read_article_list
+from compiled_dictionaries import load_dictionaries
+import instrumentation
+instrumentation.setup('dict_count_all') # before reading sys.argv: removes --metrics/--profile/--sample
 
 
 ###############################################
@@ -42,12 +48,21 @@ DATA_HOME = join(root, 'dictionary_methods/article_data')
 JSTOR_HOME = join(root, 'jstor_data')
 METADATA = join(root, 'models_storage/metadata/metadata_cleaned_02142023.pkl')
 INDICES_HOME = join(root, 'models_storage/article_lists_jstor')
+BLACKLIST = join(DATA_HOME, 'expanded_dict_blacklist.csv') # terms removed from every dictionary
+COMPILED_DICTS = join(root, 'models_storage/dictionaries/compiled_dictionaries.pkl') # rebuilt when a dictionary changes
+CACHE = join(root, 'models_storage/cache/dict_count_hits.db') # per-article term hits, reused across runs
+CHECKPOINT = join(root, 'models_storage/checkpoints/dict_count_all') # finished articles, for resuming an interrupted run
 INDICES = join(INDICES_HOME, "filtered_enchant_orgdict_index_files_ALL_59098_203.csv")
 
 with open(INDICES, 'r') as f:
     files = f.read().split('\n')[1:-1]
     files = [fp.split(',')[1] for fp in files]
 
+# Optional article list (e.g. written by 'build_allowlist'): count only the articles in it
+if len(sys.argv) > 1:
+    allowed = set(read_article_list(sys.argv[1]))
+    files = [file for file in files if file in allowed]
+
     
 ###############################################
 #                Update words                 #
@@ -70,13 +85,11 @@ ALL_WORDS_COUNTS = [(re.sub(" ", "_", word) + "_count") for word in list(ALL_WOR
 
 words_type = 'dicts'
 
-# Load expanded dictionaries for 2004-2014
-dem = pd.read_csv(join(DICTS_HOME, 'expanded_decades/demographic_2004_2014.txt'), delimiter = '\n', 
-                  header=None)[0].apply(lambda x: x.replace(',', ' ')).tolist()
-relt = pd.read_csv(join(DICTS_HOME, 'expanded_decades/relational_2004_2014.txt'), delimiter = '\n', 
-                   header=None)[0].apply(lambda x: x.replace(',', ' ')).tolist()
-cult = pd.read_csv(join(DICTS_HOME, 'expanded_decades/cultural_2004_2014.txt'), delimiter = '\n', 
-                   header=None)[0].apply(lambda x: x.replace(',', ' ')).tolist()
+# Load expanded dictionaries for 2004-2014 (compiled once: normalized, blacklisted terms removed)
+dictionaries = load_dictionaries(COMPILED_DICTS, DICTS_HOME, BLACKLIST)
+dem = dictionaries.terms('expanded_2004_2014', 'demographic')
+relt = dictionaries.terms('expanded_2004_2014', 'relational')
+cult = dictionaries.terms('expanded_2004_2014', 'cultural')
 
 ALL_WORDS = dem + relt + cult # full list of words in dictionaries; note underscores to separate ngrams
 ALL_DICTS = [dem, relt, cult] # list of dictionaries
@@ -92,64 +105,6 @@ assert len(ALL_DICTS) == len(DICT_NAMES), f'Must have same number of dictionarie
 #WORDS_PERSPECTIVES_DICT = {word: persp for word, persp in list(zip(ALL_WORDS, ALL_WORDS_PERSPECTIVES))}
 
 
-###############################################
-#          Define counting functions          #
-###############################################
-
-def generate_ngram_counts(ngram_value:int, files:list, 
-                          ALL_WORDS:list, ALL_DICTS:list, DICT_NAMES:list, 
-                          JSTOR_HOME:str):
-    '''Generates ngram counts by parsing through JSTOR article files, and collecting and storing the word counts 
-    for the words used in the JSTOR article. 
-    
-    Args: 
-        ngram_value (int): how many words to count: 1 = unigram, 2 = bigram, 3 = trigram
-        files (list): list of all article filepaths
-        ALL_WORDS (list): list of all words to count (regardless of whether unigram, bigram, etc.)
-        ALL_DICTS (list): list of lists, each list is a dictionary (list of str) for a perspective
-        DICT_NAMES (list): list of strings, each of which references a perspective (same order as previous two params)
-        JSTOR_HOME (str): path to top-level folder, under which are folders with ngram data
-    
-    Returns:
-        counts_df (pd.DataFrame): DataFrame with columns for words, values for counts
-    '''
-    
-    # Check that ngram_value between 1 and 3
-    assert (ngram_value>=1 and ngram_value<=3), f"Unable to count entries of {ngram_value} length. Please limit the word number to 1-3."
-        
-    # Filter ALL_WORDS to length of ngram_value (to improve counting speed)
-    terms = [term for term in ALL_WORDS if len(term.split('_'))==ngram_value] # underscores separate words
-    
-    # Initialize DataFrame to store counting results
-    counts_df = pd.DataFrame(columns=['article_id']+[(dict_name+'_count') for dict_name in DICT_NAMES])
-    
-    folder = join(JSTOR_HOME, f'ngram{ngram_value}')
-
-    for file in tqdm(files):
-        with open(join(folder, f'{file}-ngram{ngram_value}.txt'), 'r') as f:
-
-            file_dict = {} # initialize dict for relevant vocab from article
-            
-            # Add to file_dict the count for each word from ALL_WORDS that are of length ngram_value
-            for line in f.read().splitlines():
-                word, count = line.split('\t')
-                word = word.replace(' ', '_') # to match dictionary format, use underscores to separate words
-                if word in terms:
-                    file_dict[word] = int(count)
-            
-            # Sum word frequencies for each perspective/dict
-            term_sums = [sum([file_dict.get(term, 0) for term in DICT]) for DICT in ALL_DICTS] 
-            
-            # Create dict for row, with article id:file and dict:count
-            row = {"article_id": file}
-            for i in range(len(ALL_DICTS)): # for each perspective/dictionary...
-                row[DICT_NAMES[i] + '_count'] = term_sums[i] # assign total term count as value
-                    
-            counts_df = counts_df.append(row, ignore_index=True) # add row for article to DF
-    
-    return counts_df
-
-        
 ################################################
 #                 Count words                  #
 ################################################
@@ -157,22 +112,10 @@ def generate_ngram_counts(ngram_value:int, files:list,
 assert words_type in ['dicts', 'citations_by_persp'], "Wrong 'words_type' specified as counting target. Options are 'citations_by_persp' or 'dicts'."
 print(f'Counting {words_type}...')
 
-trigram_counts_df = generate_ngram_counts(3, files=files, ALL_WORDS=ALL_WORDS, 
-                                          ALL_DICTS=ALL_DICTS, DICT_NAMES=DICT_NAMES, 
-                                          JSTOR_HOME=JSTOR_HOME) # Count trigrams
-
-bigram_counts_df = generate_ngram_counts(2, files=files, ALL_WORDS=ALL_WORDS, 
-                                         ALL_DICTS=ALL_DICTS, DICT_NAMES=DICT_NAMES, 
-                                         JSTOR_HOME=JSTOR_HOME) # Count bigrams
-counts_df = pd.concat([trigram_counts_df, bigram_counts_df], axis=0) # merge bigram + trigram counts
-
-unigram_counts_df = generate_ngram_counts(1, files=files, ALL_WORDS=ALL_WORDS, 
-                                          ALL_DICTS=ALL_DICTS, DICT_NAMES=DICT_NAMES, 
-                                          JSTOR_HOME=JSTOR_HOME) # Count unigrams
-counts_df = pd.concat([counts_df, unigram_counts_df], axis=0) # merge unigram counts with the rest
-
-counts_df = counts_df.loc[:,~counts_df.columns.duplicated()] # remove duplicate columns, e.g. 'article_id'
-counts_df = counts_df.groupby('article_id').sum().reset_index(drop=False) # add up all ngrams for each article
+# Count unigrams, bigrams and trigrams in a single pass, one row per article
+counts_df = generate_article_counts(files=files, ALL_DICTS=ALL_DICTS, DICT_NAMES=DICT_NAMES, 
+                                    JSTOR_HOME=JSTOR_HOME, processes=cores, cache_path=CACHE, 
+                                    checkpoint_dir=CHECKPOINT)
 
 
 ################################################
@@ -204,4 +147,6 @@ counts_df.to_csv(join(DATA_HOME, f'{words_type}_count_ALL_{thisday}.csv'), index
 
 print(f"Saved counts to file.")
 
+shutil.rmtree(CHECKPOINT) # run is complete, so its checkpoint is no longer needed
+
 sys.exit() # Close script to be safe
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+'''
+@authors: Jaren Haber, PhD, Dartmouth College; Zekai Fan, UC Berkeley; Deepak Ragu, UC Berkeley
+@PI: Prof. Heather Haveman, UC Berkeley
+@contact: jhaber@berkeley.edu
+@inputs: named sets of dictionaries (lists of terms or authors per perspective), list of article filepaths
+@outputs: wide table of counts per dictionary set (dict_sets_count_ALL_{thisdate}.csv), where 'thisdate' is in mmddyy format
+@usage: run `python3 dict_count_sets.py [<article-list>]` from within `dictionary_methods/code`; with <article-list> (one article id per line, e.g. from `build_allowlist.py`), only the listed articles are opened
+@description: Counts mentions of perspectives for MANY dictionary sets at once--each decade's expanded dictionaries, the original and core dictionaries, and the author lists for citations--reading each article's ngram files only once. Columns are namespaced by dictionary set, e.g. 'expanded_1971_1981_cultural_count' or 'citations_relational_count'. To add or drop a dictionary set, edit `DICT_SETS` in the 'Update words' section, then run the script.
+'''
+
+
+###############################################
+#                  Initialize                 #
+###############################################
+
+# import packages
+from os import getcwd
+from os.path import join
+import shutil
+import sys
+from datetime import date
+from multiprocessing import cpu_count; cores = cpu_count() # count cores
+from ngram_counting import generate_dict_set_counts
+from corpus import read_article_list
+from compiled_dictionaries import load_dictionaries
+import instrumentation
+instrumentation.setup('dict_count_sets') # before reading sys.argv: removes --metrics/--profile/--sample
+
+
+###############################################
+#              Define file paths              #
+###############################################
+
+cwd = getcwd()
+root = str.replace(cwd, 'dictionary_methods/code', '')
+DICTS_HOME = join(root, 'dictionary_methods/dictionaries')
+DATA_HOME = join(root, 'dictionary_methods/article_data')
+JSTOR_HOME = join(root, 'jstor_data')
+INDICES_HOME = join(root, 'models_storage/article_lists_jstor')
+BLACKLIST = join(DATA_HOME, 'expanded_dict_blacklist.csv') # terms removed from every dictionary
+COMPILED_DICTS = join(root, 'models_storage/dictionaries/compiled_dictionaries.pkl') # rebuilt when a dictionary changes
+CACHE = join(root, 'models_storage/cache/dict_count_hits.db') # per-article term hits, reused across runs
+CHECKPOINT = join(root, 'models_storage/checkpoints/dict_count_sets') # finished articles, for resuming an interrupted run
+INDICES = join(INDICES_HOME, "filtered_enchant_orgdict_index_files_ALL_59098_203.csv")
+
+with open(INDICES, 'r') as f:
+    files = f.read().split('\n')[1:-1]
+    files = [fp.split(',')[1] for fp in files]
+
+# Optional article list (e.g. written by 'build_allowlist'): count only the articles in it
+if len(sys.argv) > 1:
+    allowed = set(read_article_list(sys.argv[1]))
+    files = [file for file in files if file in allowed]
+
+
+###############################################
+#                Update words                 #
+###############################################
+
+DECADES = ['1971_1981', '1982_1992', '1993_2003', '2004_2014']
+PERSPECTIVES = ['demographic', 'relational', 'cultural']
+
+DICT_SETS = {} # {set_name: {perspective: list of terms}}; terms use underscores to separate words
+dictionaries = load_dictionaries(COMPILED_DICTS, DICTS_HOME, BLACKLIST) # normalized, blacklisted terms removed
+
+# Expanded dictionaries for each decade
+for decade in DECADES:
+    DICT_SETS[f'expanded_{decade}'] = {persp: dictionaries.terms(f'expanded_{decade}', persp) for persp in PERSPECTIVES}
+
+# Original and core dictionaries
+DICT_SETS['original'] = {persp: dictionaries.terms('original', persp) for persp in PERSPECTIVES}
+DICT_SETS['core'] = {persp: dictionaries.terms('core', persp) for persp in PERSPECTIVES}
+DICT_SETS['core']['orgs'] = dictionaries.terms('core', 'orgs')
+
+# Author citations
+demographic_authors = ['hannan freeman', 'barnett carroll', 'barron west', 'brüderl schüssler', 'carrol hannan',
+                       'freeman carrol', 'fichman levinthal', 'carrol']
+relational_authors = ['pfeffer salancik', 'burt christman', 'pfeffer nowak', 'pfeffer']
+cultural_authors = ['meyer rowan', 'dimaggio powell', 'powell dimaggio', 'oliver', 'powell', 'scott', 'weick']
+
+DICT_SETS['citations'] = {'demographic': [author.replace(' ', '_') for author in demographic_authors],
+                          'relational': [author.replace(' ', '_') for author in relational_authors],
+                          'cultural': [author.replace(' ', '_') for author in cultural_authors]}
+
+
+################################################
+#                 Count words                  #
+################################################
+
+print(f'Counting {len(DICT_SETS)} dictionary sets in one pass: {", ".join(DICT_SETS)}...')
+
+counts_df = generate_dict_set_counts(files=files, DICT_SETS=DICT_SETS, JSTOR_HOME=JSTOR_HOME, processes=cores, 
+                                     cache_path=CACHE, checkpoint_dir=CHECKPOINT)
+counts_df['doi'] = counts_df['article_id'].apply(lambda fname: fname.split('-')[-1]) # get DOI from file name, e.g. 'journal-article-10.2307_2065002' -> '10.2307_2065002'
+
+
+#################################################
+#                Save output file               #
+#################################################
+
+thisday = date.today().strftime("%m%d%y") # get current date
+counts_df.to_csv(join(DATA_HOME, f'dict_sets_count_ALL_{thisday}.csv'), index=False)
+
+print(f"Saved counts to file.")
+
+shutil.rmtree(CHECKPOINT) # run is complete, so its checkpoint is no longer needed
+
+sys.exit() # Close script to be safe
@@ -0,0 +1,66 @@
+"""
+USAGE: Compiled lookup table mapping dictionary terms to the perspectives (subjects) they belong to.
+    Build it once per process (e.g. once per worker) and query it for every line of every n-gram file:
+
+        matcher = DictionaryMatcher.from_dataframe(dataFrame_dictionary)
+        matcher.match('ngram2', 'resource dependence') # -> ('Relational',)
+
+MATCH MODES:
+    'exact': a line matches a perspective if the n-gram is one of its dictionary terms.
+    'substring': a line matches a perspective if the n-gram occurs anywhere inside one of its dictionary terms.
+        This reproduces the old `selected_dictionary['Words'].str.contains(words).any()` check; every substring
+        of every term is indexed up front, so lookups stay O(1) per line. The match is literal: `str.contains`
+        treated the n-gram as a regular expression, so n-grams with regex characters (e.g. '.', '(' or '+') can
+        differ from the old results, and ones that were not valid patterns no longer raise.
+"""
+
+MATCH_MODES = ('exact', 'substring')
+
+
+class DictionaryMatcher:
+    """Hash table keyed by (ngram_type, term) whose values are the perspectives that term belongs to."""
+
+    def __init__(self, entries, mode='exact'):
+        """
+        Args:
+            entries (iterable): (ngram_type, term, perspective) triples, e.g. ('ngram1', 'coalition', 'Relational')
+            mode (str): 'exact' or 'substring' (see module docstring)
+        """
+        assert mode in MATCH_MODES, f"Unknown match mode '{mode}'; options are: {', '.join(MATCH_MODES)}"
+
+        self.mode = mode
+        self.perspectives = [] # perspectives in order of first appearance
+        table = {}
+
+        for ngram_type, term, perspective in entries:
+            if perspective not in self.perspectives:
+                self.perspectives.append(perspective)
+            keys = [term] if mode == 'exact' else self._substrings(term)
+            for key in keys:
+                table.setdefault((ngram_type, key), set()).add(perspective)
+
+        # Freeze perspective sets as tuples in a stable order so results are deterministic
+        order = {perspective: i for i, perspective in enumerate(self.perspectives)}
+        self.table = {key: tuple(sorted(found, key=order.get)) for key, found in table.items()}
+
+    @staticmethod
+    def _substrings(term):
+        '''Returns every substring of term, including the empty string (which `str.contains('')` matches).'''
+        found = {''}
+        for i in range(len(term)):
+            for j in range(i + 1, len(term) + 1):
+                found.add(term[i:j])
+        return found
+
+    @classmethod
+    def from_dataframe(cls, dataFrame_dictionary, mode='exact'):
+        '''Compiles a matcher from a DataFrame with 'Subject', 'N-Gram' and 'Words' columns.'''
+        entries = zip(dataFrame_dictionary['N-Gram'], dataFrame_dictionary['Words'], dataFrame_dictionary['Subject'])
+        return cls(entries, mode=mode)
+
+    def match(self, ngram_type, words):
+        '''Returns the tuple of perspectives whose dictionary for ngram_type matches words (empty if none).'''
+        return self.table.get((ngram_type, words), ())
+
+    def __len__(self):
+        return len(self.table)
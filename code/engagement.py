@@ -0,0 +1,186 @@
+"""
+ARGUMENTS: python3 engagement.py <ngram-combined> <metadata-combined> <output-file> [<first-year> [<last-year> [<subjects> [<article-types>]]]]
+    <ngram-combined>: 'ngram_combined.h5' or 'ngram_combined.parquet', as written by 'combine_ngram_result'.
+    <metadata-combined>: 'metadata_combined.h5' or the Parquet dataset folder, as written by 'merge_metadata_result'.
+    <output-file>: ends in '.parquet' for a Parquet file; anything else is written as HDF5.
+    <first-year>, <last-year>: years to keep, inclusive (default 1971 and 2015, as in
+        'Combine_Meta_Ngram_Data_into_Visual'); 'none' for no bound.
+    <subjects>: comma-separated primary subjects to keep (default 'Sociology,Management & Organizational Behavior');
+        'all' also keeps 'Other'.
+    <article-types>: comma-separated article types to keep (default 'research-article'); 'all' keeps every type.
+USAGE: Computes each article's engagement with the three perspectives (its culture, demographic and relational
+    dictionary counts, over all n-gram sizes, divided by its unigram count, as in 'Combine_Meta_Ngram_Data_into_Visual')
+    and sums articles, words, dictionary counts and ratios by primary subject, journal and year in one grouped pass.
+    Only the columns used are read from Parquet inputs and from 'ngram_combined.h5' (HDF5 table format), and with
+    Parquet inputs the subject filter is applied while reading. 'metadata_combined.h5' holds the author lists, which
+    only HDF5 fixed format can store, so it is read whole: run the pipeline with format 'parquet' to avoid that.
+    Plotting notebooks load the table in place of the combined results:
+
+        from engagement import load_engagement, rollup
+        by_subject = rollup(load_engagement('engagement.parquet'), ['year', 'primary_subject'])
+        by_subject.unstack()[['culture_ratio', 'demographic_ratio', 'relational_ratio']].plot()
+
+OUTPUT: <output-file>, one row per (primary_subject, journal_title, year) with columns 'articles', 'words' (unigram
+    count), '<perspective>_count' and '<perspective>_ratio' (mean over the articles of the group).
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from journal_subjects import FOCAL_SUBJECTS, clean_years
+from result_store import KEY_NAME, typed
+
+
+PERSPECTIVES = ('culture', 'demographic', 'relational')
+NGRAMS = (1, 2, 3)
+GROUP_KEYS = ['primary_subject', 'journal_title', 'year']
+METADATA_COLUMNS = ['primary_subject', 'journal_title', 'year', 'type']
+WORDS_COLUMN = 'ngram_1_count' # denominator of the ratios (unigrams, so that words are not counted three times)
+
+
+def read_table(path:str, columns:list, filters:list=None):
+    '''Reads columns of a combined result, indexed on file_name: HDF5 if path ends in '.h5', else Parquet (a file or
+    a partitioned dataset folder), from which only these columns (and, with filters, row groups) are read. HDF5 in
+    table format is read by column too; fixed format can only be read whole.'''
+
+    if path.endswith('.h5'):
+        with pd.HDFStore(path, 'r') as store:
+            key = store.keys()[0]
+            if store.get_storer(key).is_table:
+                return store.select(key, columns=columns)
+            print('Reading all of {} (HDF5 fixed format); Parquet outputs are read by column'.format(path))
+            return typed(store.select(key)[columns], 'metadata')
+
+    df = pd.read_parquet(path, columns=[KEY_NAME] + columns, filters=filters)
+    return df.set_index(KEY_NAME)
+
+
+def load_articles(ngram_path:str, metadata_path:str, first_year:int=1971, last_year:int=2015,
+                  subjects:list=FOCAL_SUBJECTS, types:list=('research-article',)):
+    '''Joins the n-gram counts of the articles to their subject, journal and year, and keeps the selected ones.
+
+    Args:
+        ngram_path (str): 'ngram_combined.h5' or 'ngram_combined.parquet'
+        metadata_path (str): 'metadata_combined.h5' or its Parquet dataset folder
+        first_year (int): first year to keep, or None
+        last_year (int): last year to keep, or None
+        subjects (list): primary subjects to keep, or None for all
+        types (list): article types to keep, or None for all
+
+    Returns:
+        articles (pd.DataFrame): indexed on file_name; GROUP_KEYS, then the n-gram count columns
+    '''
+
+    filters = [('primary_subject', 'in', list(subjects))] if subjects is not None else None
+    metadata = read_table(metadata_path, METADATA_COLUMNS, filters)
+    count_columns = [WORDS_COLUMN] + ['{}_{}_count'.format(p, n) for p in PERSPECTIVES for n in NGRAMS]
+    counts = read_table(ngram_path, count_columns)
+
+    keep = pd.Series(True, index=metadata.index)
+    if subjects is not None:
+        keep &= metadata.primary_subject.isin(subjects)
+    if types is not None:
+        keep &= metadata.type.isin(types)
+
+    metadata = metadata.assign(year=clean_years(metadata.year))
+    if first_year is not None:
+        keep &= (metadata.year >= first_year).fillna(False)
+    if last_year is not None:
+        keep &= (metadata.year <= last_year).fillna(False)
+
+    articles = metadata.loc[keep, GROUP_KEYS].join(counts, how='inner')
+    articles[count_columns] = articles[count_columns].fillna(0) # articles missing from a part of one n-gram size
+    articles['year'] = articles.year.astype(np.int16)
+    return articles
+
+
+def engagement(articles:pd.DataFrame):
+    '''Perspective counts and ratios of every article, then their sums by GROUP_KEYS, in one grouped pass.
+
+    Articles without unigrams are left out, as they have no ratio.
+
+    Returns:
+        table (pd.DataFrame): one row per group, with GROUP_KEYS as columns, then 'articles', 'words',
+            '<perspective>_count' and '<perspective>_ratio' (mean over the group)
+    '''
+
+    articles = articles[articles[WORDS_COLUMN] > 0]
+    words = articles[WORDS_COLUMN].to_numpy(dtype=np.float64)
+
+    # Articles x perspectives x n-gram sizes, summed over n-gram sizes and divided by words for all articles at once
+    counts = articles[['{}_{}_count'.format(p, n) for p in PERSPECTIVES for n in NGRAMS]].to_numpy(dtype=np.float64)
+    counts = counts.reshape(len(articles), len(PERSPECTIVES), len(NGRAMS)).sum(axis=2)
+    ratios = counts / words[:, None]
+
+    values = pd.DataFrame(np.column_stack([np.ones(len(articles)), words, counts, ratios]), index=articles.index,
+                          columns=['articles', 'words'] + ['{}_count'.format(p) for p in PERSPECTIVES]
+                                  + ['{}_ratio'.format(p) for p in PERSPECTIVES])
+    keys = [articles[key].astype('category') if key != 'year' else articles[key] for key in GROUP_KEYS]
+    table = values.groupby(keys, observed=True, sort=True).sum()
+
+    for p in PERSPECTIVES: # sums of ratios to means
+        table['{}_ratio'.format(p)] /= table.articles
+    return compact(table.reset_index())
+
+
+def rollup(table:pd.DataFrame, keys:list):
+    '''Re-aggregates the engagement table to coarser groups (e.g. ['year', 'primary_subject']): counts are summed and
+    ratios averaged over all the articles of the new group, so the result equals a direct computation.'''
+
+    ratio_columns = ['{}_ratio'.format(p) for p in PERSPECTIVES]
+    weighted = table.assign(**{col: table[col] * table.articles for col in ratio_columns})
+    grouped = weighted.drop(columns=[key for key in GROUP_KEYS if key not in keys]).groupby(keys, observed=True).sum()
+    grouped[ratio_columns] = grouped[ratio_columns].div(grouped.articles, axis=0)
+    return grouped
+
+
+def compact(table:pd.DataFrame):
+    '''Smallest types that hold the table: categories for names, 16-bit years and integer counts.'''
+
+    table = table.astype({'primary_subject': 'category', 'journal_title': 'category', 'year': np.int16,
+                          'articles': np.int32, 'words': np.int64})
+    return table.astype({'{}_count'.format(p): np.int64 for p in PERSPECTIVES})
+
+
+def save_engagement(table:pd.DataFrame, path:str):
+    '''Writes the table as Parquet if path ends in '.parquet', else as HDF5 (table format, which keeps categories).'''
+
+    if path.endswith('.parquet'):
+        table.to_parquet(path, index=False)
+    else:
+        table.to_hdf(path, key='engagement', mode='w', format='table')
+
+
+def load_engagement(path:str):
+    '''Reads a table written by save_engagement.'''
+
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_hdf(path)
+
+
+if __name__ == '__main__':
+    import instrumentation
+    instrumentation.setup('engagement') # before reading sys.argv: removes --metrics/--profile/--sample
+
+    if len(sys.argv) not in range(4, 9):
+        print(__doc__)
+        exit()
+
+    NGRAM_FILE, METADATA_FILE, OUTFILE = sys.argv[1:4]
+    FIRST_YEAR = sys.argv[4] if len(sys.argv) > 4 else '1971'
+    LAST_YEAR = sys.argv[5] if len(sys.argv) > 5 else '2015'
+    SUBJECTS = sys.argv[6].split(',') if len(sys.argv) > 6 else FOCAL_SUBJECTS
+    TYPES = sys.argv[7].split(',') if len(sys.argv) > 7 else ['research-article']
+
+    articles = load_articles(NGRAM_FILE, METADATA_FILE,
+                             None if FIRST_YEAR == 'none' else int(FIRST_YEAR),
+                             None if LAST_YEAR == 'none' else int(LAST_YEAR),
+                             None if SUBJECTS == ['all'] else SUBJECTS,
+                             None if TYPES == ['all'] else TYPES)
+    table = engagement(articles)
+    save_engagement(table, OUTFILE)
+
+    print('{} articles in {} subject, journal and year groups'.format(table.articles.sum(), len(table)))
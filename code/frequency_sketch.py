@@ -0,0 +1,225 @@
+'''
+@description: Approximate term-frequency summary in bounded memory, built by `ngram_agg.py` in 'sketch' mode as an
+alternative to the exact (multi-GB) `ngram{N}_agg.txt` tables. It holds three structures, all updated with one
+hash per term:
+
+    - a Count-Min sketch (`depth` rows of `width` counters): the estimated count of any term is never below its true
+      count, and exceeds it by more than e / width * total with probability at most exp(-depth);
+    - the `top_k` heavy hitters by estimated count;
+    - the exact counts of a uniform sample of distinct terms, chosen by hash (a term is in the sample whenever its hash
+      is below the current limit, so its counts from every article are kept). The sample gives the distribution of
+      counts over distinct terms, i.e. where a term falls among all terms, with a Dvoretzky-Kiefer-Wolfowitz bound.
+
+Sketches with the same parameters can be merged, e.g. the partial sketches of parallel workers.
+
+@usage:
+    sketch = FrequencySketch.load('ngram1_sketch.pkl')
+    sketch.count('culture')    # (estimate, max_error): the true count is in [estimate - max_error, estimate]
+    sketch.quantile('culture') # (q, low, high): share of distinct terms counted at most as often, and its bounds
+    sketch.top(20)             # [(term, estimated count), ...]
+'''
+
+import hashlib
+import math
+import pickle
+
+import numpy as np
+
+
+class FrequencySketch:
+    '''Count-Min sketch with top-K heavy hitters and a hash sample of exact counts.'''
+
+    def __init__(self, width:int=2 ** 18, depth:int=5, top_k:int=10000, max_sample:int=100000, seed:int=0):
+        '''
+        Args:
+            width (int): counters per row; the count error is at most e / width * total (w.p. 1 - exp(-depth))
+            depth (int): number of rows (independent hashes)
+            top_k (int): number of heavy hitters kept
+            max_sample (int): maximum number of distinct terms in the sample; the sampling rate halves when exceeded
+            seed (int): hash seed; sketches can only be merged if built with the same seed
+        '''
+
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.max_sample = max_sample
+        self.seed = seed
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0 # sum of all counts added
+        self.heavy = set() # candidates for the top_k; trimmed back to top_k when twice as big
+        self.floor = 0 # estimated count of the smallest heavy hitter at the last trim
+        self.sample = {} # {term: exact count} for terms whose sampling hash is below the limit
+        self.level = 0 # sampling rate is 2 ** -level
+        self._sorted_sample = None # sorted sample counts, cached for quantile queries
+
+    def _hash(self, terms:list):
+        '''Three 64-bit hashes per term: two for the Count-Min columns, one for sampling.'''
+
+        key = str(self.seed).encode()
+        digests = b''.join(hashlib.blake2b(term.encode('utf-8'), digest_size=24, key=key).digest() for term in terms)
+        return np.frombuffer(digests, dtype='<u8').reshape(-1, 3)
+
+    def _columns(self, hashes:np.ndarray):
+        '''Column of each term in each row (double hashing), shape (depth, terms).'''
+
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((hashes[:, 0] + rows * (hashes[:, 1] | np.uint64(1))) % np.uint64(self.width)).astype(np.int64)
+
+    def _estimate(self, columns:np.ndarray):
+        return self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+
+    def _in_sample(self, hashes:np.ndarray):
+        return (hashes[:, 2] >> np.uint64(1)) < np.uint64(2 ** 63 >> self.level)
+
+    def update(self, term_counts:dict):
+        '''Adds the counts in term_counts ({term: count}, e.g. the n-grams of one article).'''
+
+        if not term_counts:
+            return
+
+        terms = list(term_counts)
+        counts = np.fromiter(term_counts.values(), dtype=np.int64, count=len(terms))
+        hashes = self._hash(terms)
+        columns = self._columns(hashes)
+
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts) # terms may share a column
+        self.total += int(counts.sum())
+
+        # Terms that may now be among the top_k
+        for i in np.flatnonzero(self._estimate(columns) > self.floor):
+            self.heavy.add(terms[i])
+        if len(self.heavy) >= 2 * self.top_k:
+            self._trim()
+
+        for i in np.flatnonzero(self._in_sample(hashes)):
+            self.sample[terms[i]] = self.sample.get(terms[i], 0) + int(counts[i])
+        if len(self.sample) > self.max_sample:
+            self._subsample()
+        self._sorted_sample = None
+
+    def _trim(self):
+        '''Keeps the top_k heavy hitters by current estimate.'''
+
+        terms = list(self.heavy)
+        estimates = self._estimate(self._columns(self._hash(terms)))
+        if len(terms) > self.top_k:
+            keep = np.argpartition(-estimates, self.top_k - 1)[:self.top_k]
+            terms, estimates = [terms[i] for i in keep], estimates[keep]
+            self.floor = int(estimates.min()) # estimates only grow, so terms at or below this can't enter the top_k
+        self.heavy = set(terms)
+
+    def _subsample(self):
+        '''Halves the sampling rate until the sample fits in max_sample terms.'''
+
+        while len(self.sample) > self.max_sample:
+            self.level += 1
+            terms = list(self.sample)
+            keep = self._in_sample(self._hash(terms))
+            self.sample = {term: self.sample[term] for term, kept in zip(terms, keep) if kept}
+
+    def merge(self, other:'FrequencySketch'):
+        '''Adds the counts of other, a sketch built with the same parameters, to this one.'''
+
+        assert (self.width, self.depth, self.top_k, self.max_sample, self.seed) == \
+            (other.width, other.depth, other.top_k, other.max_sample, other.seed), \
+            'Only sketches with the same parameters can be merged.'
+
+        self.table += other.table
+        self.total += other.total
+
+        self.heavy |= other.heavy
+        self.floor = max(self.floor, other.floor)
+        self._trim()
+
+        # A term below the lower of the two limits is in both samples (if seen), with all its counts
+        self.level = max(self.level, other.level)
+        sample = {}
+        for part in (self.sample, other.sample):
+            terms = list(part)
+            for term, kept in zip(terms, self._in_sample(self._hash(terms))):
+                if kept:
+                    sample[term] = sample.get(term, 0) + part[term]
+        self.sample = sample
+        self._subsample()
+        self._sorted_sample = None
+        return self
+
+    @property
+    def epsilon(self):
+        '''Count-Min error, as a share of the total count.'''
+        return math.e / self.width
+
+    @property
+    def delta(self):
+        '''Probability that a count estimate exceeds the error bound.'''
+        return math.exp(-self.depth)
+
+    def count(self, term:str):
+        '''Approximate count of term.
+
+        Returns:
+            estimate (int): estimated count, never below the true count
+            max_error (int): the true count is at least estimate - max_error (with probability 1 - delta); 0 if the
+                term is in the hash sample, whose counts are exact
+        '''
+
+        hashes = self._hash([term])
+        if self._in_sample(hashes)[0]: # sampled terms are counted exactly, and unseen ones are 0
+            return self.sample.get(term, 0), 0
+
+        estimate = int(self._estimate(self._columns(hashes))[0])
+        return estimate, min(estimate, math.ceil(self.epsilon * self.total))
+
+    def sample_counts(self):
+        '''Sorted exact counts of the sampled terms: a uniform sample of the counts of all distinct terms.'''
+
+        if self._sorted_sample is None:
+            self._sorted_sample = np.sort(np.fromiter(self.sample.values(), dtype=np.int64, count=len(self.sample)))
+        return self._sorted_sample
+
+    def quantile(self, term:str, alpha:float=0.05):
+        '''Position of term in the distribution of counts over all distinct terms.
+
+        Args:
+            term (str): term to locate
+            alpha (float): the bounds hold with probability 1 - alpha (and 1 - delta for the count)
+
+        Returns:
+            q (float): estimated share of distinct terms whose count is at most the term's count
+            low (float): lower bound of q
+            high (float): upper bound of q
+        '''
+
+        counts = self.sample_counts()
+        if len(counts) == 0:
+            return 0.0, 0.0, 1.0
+
+        estimate, max_error = self.count(term)
+        dkw = math.sqrt(math.log(2 / alpha) / (2 * len(counts))) # Dvoretzky-Kiefer-Wolfowitz
+        share = lambda x: float(np.searchsorted(counts, x, side='right') / len(counts))
+
+        q = share(estimate)
+        return q, max(0.0, share(estimate - max_error) - dkw), min(1.0, q + dkw)
+
+    def top(self, n:int=None):
+        '''The n (default top_k) terms with the highest estimated counts, as (term, estimate) pairs, highest first.'''
+
+        terms = list(self.heavy)
+        estimates = self._estimate(self._columns(self._hash(terms))) if terms else []
+        ranked = sorted(zip(terms, (int(x) for x in estimates)), key=lambda kv: (-kv[1], kv[0]))
+        return ranked[:n or self.top_k]
+
+    def distinct(self):
+        '''Estimated number of distinct terms (exact while nothing has been dropped from the sample).'''
+        return len(self.sample) * 2 ** self.level
+
+    def save(self, path:str):
+        self._sorted_sample = None
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path:str):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,172 @@
+"""
+ARGUMENTS: python3 generate_corpus.py <output-path> <number-of-articles> [<vocabulary-size> [<zipf-exponent> [<mean-article-length> [<seed>]]]]
+    <vocabulary-size>: number of distinct words (default 50000).
+    <zipf-exponent>: exponent of the Zipfian word frequencies, word of rank r drawn with probability ~ r ** -exponent
+        (default 1.1).
+    <mean-article-length>: mean number of words per article (default 3000); lengths are log-normally distributed.
+    <seed>: random seed (default 0); the same arguments and seed always give the same corpus.
+USAGE: Writes a synthetic corpus in the layout of the JSTOR data, so that the pipeline can be run and timed (see
+    'benchmark.py') without the real data. Each article is a random word sequence: words are drawn from a Zipfian
+    vocabulary into which the dictionary words are mixed, and a few multi-word dictionary terms are inserted, so the
+    dictionaries match at realistic rates. The n-gram files hold the actual 1-, 2- and 3-grams of that sequence.
+    Metadata files follow the JSTOR article XML schema read by 'ParseMetaFilesUpdated', with journals drawn from the
+    journal list in 'article_data' (mostly Sociology and Management & Organizational Behavior journals).
+OUTPUT: in <output-path>:
+    'jstor_data/metadata/journal-article-*.xml' and 'jstor_data/ngram{1,2,3}/journal-article-*-ngram{1,2,3}.txt'
+    'Dictionaries/{Culture,Demographic,Relational}.csv': copies of the original dictionaries, for 'split_dictionary'
+    'journals.csv': the journal list, for 'merge_metadata_result'
+"""
+
+import os
+import shutil
+import string
+import sys
+import xml.etree.ElementTree as ET
+from os.path import dirname, join
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+
+if len(sys.argv) not in range(3, 8):
+    print(__doc__)
+    exit()
+
+OUTPUT_PATH = sys.argv[1]
+NUM_ARTICLES = int(sys.argv[2])
+VOCAB_SIZE = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+ZIPF_EXPONENT = float(sys.argv[4]) if len(sys.argv) > 4 else 1.1
+MEAN_LENGTH = int(sys.argv[5]) if len(sys.argv) > 5 else 3000
+SEED = int(sys.argv[6]) if len(sys.argv) > 6 else 0
+
+REPO = dirname(dirname(os.path.abspath(__file__)))
+DICTIONARIES = {'Culture': 'cultural_original.csv', 'Demographic': 'demographic_original.csv',
+                'Relational': 'relational_original.csv'}
+JOURNAL_FILE = join(REPO, 'article_data', 'journal_titles_subjects_101519_.csv')
+FOCAL_SUBJECTS = ['Sociology', 'Management & Organizational Behavior']
+FOCAL_SHARE = 0.7 # share of articles in journals of the focal subjects
+PHRASES_PER_ARTICLE = 2 # mean number of multi-word dictionary terms inserted into each article
+LENGTH_SIGMA = 0.6 # sigma of the log-normal article length
+
+rng = np.random.default_rng(SEED)
+
+JSTOR_HOME = join(OUTPUT_PATH, 'jstor_data')
+for folder in ('metadata', 'ngram1', 'ngram2', 'ngram3'):
+    os.makedirs(join(JSTOR_HOME, folder), exist_ok=True)
+os.makedirs(join(OUTPUT_PATH, 'Dictionaries'), exist_ok=True)
+
+
+# Dictionaries: copied as they are, and their terms mixed into the vocabulary
+terms = []
+for name, file in DICTIONARIES.items():
+    shutil.copy(join(REPO, 'dictionaries', 'original', file), join(OUTPUT_PATH, 'Dictionaries', name + '.csv'))
+    with open(join(REPO, 'dictionaries', 'original', file), 'r') as f:
+        terms += [line.rstrip(',').split(',') for line in f.read().splitlines() if line.strip(',')]
+
+shutil.copy(JOURNAL_FILE, join(OUTPUT_PATH, 'journals.csv'))
+
+
+def random_words(n):
+    '''n distinct random lowercase words of 2 to 10 letters.'''
+
+    words = {} # a dict rather than a set, so the order (and the corpus) doesn't depend on string hashing
+    while len(words) < n:
+        lengths = rng.integers(2, 11, size=n - len(words))
+        letters = rng.choice(list(string.ascii_lowercase), size=lengths.sum())
+        words.update(dict.fromkeys(''.join(w) for w in np.split(letters, np.cumsum(lengths)[:-1])))
+    return list(words)
+
+
+# Vocabulary in rank order: random words, with each dictionary word at a random rank among the first tenth
+dictionary_words = list(dict.fromkeys(word for term in terms for word in term))
+vocab = [word for word in random_words(VOCAB_SIZE) if word not in dictionary_words][:VOCAB_SIZE - len(dictionary_words)]
+for word in dictionary_words:
+    vocab.insert(int(rng.integers(0, max(1, VOCAB_SIZE // 10))), word)
+vocab = np.array(vocab)
+word_id = {word: i for i, word in enumerate(vocab)}
+phrases = [np.array([word_id[word] for word in term]) for term in terms if len(term) > 1]
+
+probs = np.arange(1, len(vocab) + 1, dtype=float) ** -ZIPF_EXPONENT
+probs /= probs.sum()
+
+
+def count_ngrams(tokens, n):
+    '''Counts the n-grams of a token id sequence, most frequent first (as in the JSTOR files).'''
+
+    if len(tokens) < n:
+        return []
+    grams = np.stack([tokens[i:len(tokens) - n + 1 + i] for i in range(n)], axis=1)
+    grams, counts = np.unique(grams, axis=0, return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    return [(' '.join(vocab[gram]), count) for gram, count in zip(grams[order], counts[order])]
+
+
+# Journals: mostly from the focal subjects, so most articles are kept by 'merge_metadata_result'
+journals = pd.read_csv(JOURNAL_FILE)
+focal = journals[journals.primary_subject.isin(FOCAL_SUBJECTS)]
+other = journals[~journals.primary_subject.isin(FOCAL_SUBJECTS)]
+
+
+def sub(parent, tag, text=None, **attrib):
+    elem = ET.SubElement(parent, tag, attrib)
+    elem.text = None if text is None else str(text)
+    return elem
+
+
+def write_metadata(article_id, journal, num):
+    '''Writes one article's metadata file, in the JSTOR article XML schema.'''
+
+    article = ET.Element('article', {'article-type': 'research-article', 'xmlns:xlink': 'http://www.w3.org/1999/xlink'})
+    front = sub(article, 'front')
+
+    journal_meta = sub(front, 'journal-meta')
+    sub(journal_meta, 'journal-id', str(journal.title_url).rstrip('/').split('/')[-1], **{'journal-id-type': 'jstor'})
+    sub(sub(journal_meta, 'journal-title-group'), 'journal-title', journal.publication_title)
+    sub(journal_meta, 'issn', journal.print_identifier, **{'pub-type': 'ppub'})
+
+    meta = sub(front, 'article-meta')
+    sub(meta, 'article-id', article_id.replace('_', '/'), **{'pub-id-type': 'doi'})
+    sub(sub(meta, 'title-group'), 'article-title', ' '.join(rng.choice(vocab[:2000], size=6)).capitalize())
+    contribs = sub(meta, 'contrib-group')
+    for _ in range(int(rng.integers(1, 4))):
+        name = sub(sub(contribs, 'contrib', **{'contrib-type': 'author'}), 'string-name')
+        sub(name, 'given-names', rng.choice(vocab[:5000]).capitalize())
+        sub(name, 'surname', rng.choice(vocab[:5000]).capitalize())
+
+    date = sub(meta, 'pub-date', **{'pub-type': 'ppub'})
+    sub(date, 'day', int(rng.integers(1, 29)))
+    sub(date, 'month', int(rng.integers(1, 13)))
+    sub(date, 'year', int(rng.integers(1970, 2017)))
+    sub(meta, 'volume', int(rng.integers(1, 60)))
+    sub(meta, 'issue', int(rng.integers(1, 5)))
+    sub(meta, 'issue-id', 'i{}'.format(num))
+    fpage = int(rng.integers(1, 500))
+    sub(meta, 'fpage', fpage)
+    sub(meta, 'lpage', fpage + int(rng.integers(5, 40)))
+    sub(meta, 'self-uri', **{'xlink:href': 'http://www.jstor.org/stable/{}'.format(article_id.split('_')[-1])})
+    if rng.random() < 0.8:
+        sub(sub(meta, 'abstract'), 'p', ' '.join(rng.choice(vocab[:5000], size=80)))
+
+    ET.ElementTree(article).write(join(JSTOR_HOME, 'metadata', 'journal-article-{}.xml'.format(article_id)),
+                                  encoding='utf-8', xml_declaration=True)
+
+
+mean_log = np.log(MEAN_LENGTH) - LENGTH_SIGMA ** 2 / 2 # so the mean length is MEAN_LENGTH
+
+for num in tqdm(range(NUM_ARTICLES)):
+    article_id = '10.2307_{}'.format(1000000 + num)
+
+    length = max(3, int(rng.lognormal(mean_log, LENGTH_SIGMA)))
+    tokens = rng.choice(len(vocab), size=length, p=probs)
+    for _ in range(rng.poisson(PHRASES_PER_ARTICLE) if phrases else 0):
+        tokens = np.insert(tokens, int(rng.integers(0, len(tokens))), phrases[int(rng.integers(0, len(phrases)))])
+
+    for n in (1, 2, 3):
+        with open(join(JSTOR_HOME, 'ngram{}'.format(n), 'journal-article-{}-ngram{}.txt'.format(article_id, n)), 'w') as f:
+            f.writelines('{}\t{}\n'.format(gram, count) for gram, count in count_ngrams(tokens, n))
+
+    journals_of_subject = focal if rng.random() < FOCAL_SHARE else other
+    write_metadata(article_id, journals_of_subject.iloc[int(rng.integers(0, len(journals_of_subject)))], num)
+
+print('Wrote {} articles to {}'.format(NUM_ARTICLES, OUTPUT_PATH))
@@ -0,0 +1,242 @@
+'''
+@description: Per-stage metrics and profiling for the pipeline scripts, switched on from the command line without
+editing code. Every script calls `setup()` before reading its arguments; it removes these options from sys.argv:
+
+    --metrics PATH   record metrics for this run (or set the PIPELINE_METRICS environment variable)
+    --profile PATH   profile the main process with cProfile; read with `pstats.Stats(PATH)`
+    --sample PATH    sample the main process' stack every few milliseconds and write the counts as folded stacks
+                     ('frame;frame;frame count' lines, e.g. for flamegraph.pl or speedscope)
+
+Metrics are counted with `add()` where the work happens (e.g. `corpus.py` counts the files, bytes and lines it
+reads), in the main process and in every worker process. Each process adds to its own slot of a shared memory
+array, so workers report nothing themselves and nothing is lost when a pool is terminated. When the script exits,
+one record per process (main and workers) plus a total are written to PATH: appended as JSON lines, so several
+stages can share one file, or, if PATH ends in '.prom', as a Prometheus text file (for the node exporter's
+textfile collector; use one file per stage).
+
+Recorded per process: wall time, files per second, peak resident memory and the counters in COUNTERS. Peak memory
+is read at most every RSS_INTERVAL seconds while a process counts (and once more for the main process at exit), so
+a worker's last second of growth may be missed.
+To profile the work itself rather than the main process waiting on a pool, run with PIPELINE_WORKERS=1
+(see `scheduler.py`) or a single part, so the work runs in the main process.
+
+@usage:
+    import instrumentation
+    instrumentation.setup('parse_ngram_files') # before reading sys.argv
+    instrumentation.label(ngram=NGRAM, part=NUM)
+    ...
+    instrumentation.add(files=1, lines=lines_read, dictionary_hits=hits)
+'''
+
+import atexit
+import cProfile
+import json
+import multiprocessing
+import os
+import resource
+import signal
+import sys
+import time
+from collections import Counter
+
+
+COUNTERS = ('files', 'bytes_read', 'lines', 'dictionary_hits', 'cache_hits', 'cache_partial', 'cache_misses', 'errors')
+FIELDS = ('pid', 'start', 'last', 'peak_rss_kb') + COUNTERS # one slot per process in the shared array
+MAX_PROCESSES = 512 # slots; further worker processes share the last one
+METRICS_ENV = 'PIPELINE_METRICS'
+SAMPLE_INTERVAL = 0.005 # seconds of CPU time between stack samples
+RSS_INTERVAL = 1.0 # seconds between peak memory readings in `add()`, to keep the syscall off the hot path
+
+_FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+
+_stage = None
+_labels = {}
+_main_pid = None
+_metrics_path = None
+_shared = None # multiprocessing.RawArray of MAX_PROCESSES * len(FIELDS) doubles, or None if metrics are off
+_next_slot = None # shared counter of claimed slots
+_slot_lock = None
+_slot = 0 # this process' slot
+_next_rss = 0. # time of this process' next peak memory reading
+_profiler = None
+_sample_path = None
+_samples = Counter()
+
+
+def _pop_option(argv:list, name:str):
+    '''Removes '--name VALUE' or '--name=VALUE' from argv and returns VALUE (None if absent).'''
+
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            value = argv[i + 1]
+            del argv[i:i + 2]
+            return value
+        if arg.startswith(name + '='):
+            del argv[i]
+            return arg[len(name) + 1:]
+    return None
+
+
+def setup(stage:str):
+    '''Reads and removes the instrumentation options from sys.argv, and starts recording what they ask for.
+
+    Args:
+        stage (str): name of the pipeline stage, e.g. the script name
+    '''
+
+    global _stage, _main_pid, _metrics_path, _shared, _next_slot, _slot_lock, _profiler, _sample_path
+
+    _stage = stage
+    _main_pid = os.getpid()
+    _metrics_path = _pop_option(sys.argv, '--metrics') or os.environ.get(METRICS_ENV)
+    profile_path = _pop_option(sys.argv, '--profile')
+    _sample_path = _pop_option(sys.argv, '--sample')
+
+    if _metrics_path:
+        _shared = multiprocessing.RawArray('d', MAX_PROCESSES * len(FIELDS))
+        _next_slot = multiprocessing.RawValue('i', 1)
+        _slot_lock = multiprocessing.Lock()
+        _claim_slot(0)
+        os.register_at_fork(after_in_child=_after_fork)
+
+    if profile_path:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+        atexit.register(_write_profile, profile_path)
+
+    if _sample_path:
+        signal.signal(signal.SIGPROF, _take_sample)
+        signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+        atexit.register(_write_samples)
+
+    if _metrics_path:
+        atexit.register(_write_metrics)
+
+
+def label(**labels):
+    '''Adds labels (e.g. ngram=2, part=7) to this stage's records, to tell apart runs of the same script.'''
+    _labels.update({name: str(value) for name, value in labels.items()})
+
+
+def add(**counts):
+    '''Adds to this process' counters (names from COUNTERS); does nothing unless metrics are on.'''
+
+    if _shared is None:
+        return
+
+    global _next_rss
+
+    base = _slot * len(FIELDS)
+    for name, value in counts.items():
+        _shared[base + _FIELD_INDEX[name]] += value
+    now = _shared[base + _FIELD_INDEX['last']] = time.time()
+    if now >= _next_rss: # the peak only grows, so skipped readings lose at most one interval's growth
+        _next_rss = now + RSS_INTERVAL
+        _shared[base + _FIELD_INDEX['peak_rss_kb']] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KiB on Linux
+
+
+def _claim_slot(slot:int):
+    global _slot, _next_rss
+    _slot = slot
+    _next_rss = 0. # read on the first `add()`
+    base = slot * len(FIELDS)
+    for i in range(len(FIELDS)):
+        _shared[base + i] = 0
+    _shared[base + _FIELD_INDEX['pid']] = os.getpid()
+    _shared[base + _FIELD_INDEX['start']] = _shared[base + _FIELD_INDEX['last']] = time.time()
+
+
+def _after_fork():
+    '''In a new worker process: counts go to a fresh slot, not the parent's.'''
+
+    global _profiler, _samples
+    _profiler = None # profiles and samples cover the main process only
+    _samples = Counter()
+
+    with _slot_lock:
+        slot = min(_next_slot.value, MAX_PROCESSES - 1)
+        _next_slot.value += 1
+    _claim_slot(slot)
+
+
+def _records():
+    '''One record per process that used a slot, then the total for the stage.'''
+
+    now = time.time()
+    records = []
+    for slot in range(min(_next_slot.value, MAX_PROCESSES)):
+        values = dict(zip(FIELDS, _shared[slot * len(FIELDS):(slot + 1) * len(FIELDS)]))
+        main = slot == 0
+        wall = (now if main else values['last']) - values['start']
+        record = {'stage': _stage, **_labels, 'process': 'main' if main else 'worker', 'pid': int(values['pid']),
+                  'wall_seconds': wall, 'files_per_second': values['files'] / wall if wall > 0 else 0.,
+                  'peak_rss_mb': values['peak_rss_kb'] / 1024}
+        record.update({name: int(values[name]) for name in COUNTERS})
+        records.append(record)
+
+    main = records[0]
+    main['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    total = {'stage': _stage, **_labels, 'process': 'all', 'pid': main['pid'], 'wall_seconds': main['wall_seconds'],
+             'peak_rss_mb': max(record['peak_rss_mb'] for record in records)}
+    total.update({name: sum(record[name] for record in records) for name in COUNTERS})
+    total['files_per_second'] = total['files'] / total['wall_seconds'] if total['wall_seconds'] > 0 else 0.
+    return records + [total]
+
+
+def prometheus_text(records:list):
+    '''Formats records as Prometheus text exposition, one metric family per field.'''
+
+    families = [('wall_seconds', 'gauge', 'Wall-clock time of the process.'),
+                ('files_per_second', 'gauge', 'Files read per second of wall-clock time.'),
+                ('peak_rss_mb', 'gauge', 'Peak resident memory, in megabytes.')]
+    families += [(name + '_total', 'counter', name.replace('_', ' ').capitalize() + '.') for name in COUNTERS]
+
+    lines = []
+    for name, kind, help_text in families:
+        lines.append(f'# HELP pipeline_{name} {help_text}')
+        lines.append(f'# TYPE pipeline_{name} {kind}')
+        for record in records:
+            labels = {key: value for key, value in record.items()
+                      if key not in ('wall_seconds', 'files_per_second', 'peak_rss_mb') + COUNTERS}
+            label_text = ','.join('{}="{}"'.format(key, str(value).replace('"', '\\"')) for key, value in labels.items())
+            lines.append(f'pipeline_{name}{{{label_text}}} {record[name[:-len("_total")] if kind == "counter" else name]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _write_metrics():
+    if os.getpid() != _main_pid:
+        return
+
+    records = _records()
+    if _metrics_path.endswith('.prom'):
+        tmp = _metrics_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(prometheus_text(records))
+        os.replace(tmp, _metrics_path) # the collector never sees a half-written file
+    else:
+        with open(_metrics_path, 'a') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+
+
+def _write_profile(path:str):
+    if os.getpid() == _main_pid and _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(path)
+
+
+def _take_sample(signum, frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    _samples[';'.join(reversed(stack))] += 1
+
+
+def _write_samples():
+    if os.getpid() != _main_pid:
+        return
+
+    signal.setitimer(signal.ITIMER_PROF, 0, 0)
+    with open(_sample_path, 'w') as f:
+        f.writelines(f'{stack} {count}\n' for stack, count in _samples.most_common())
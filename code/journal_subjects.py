@@ -0,0 +1,52 @@
+'''
+@description: The journal subject table and the rules for matching articles to it, shared by
+`merge_metadata_result.py` (which labels every article with its journal's primary subject) and
+`build_allowlist.py` (which lists the articles to count before any n-gram file is opened).
+'''
+
+import numpy as np
+import pandas as pd
+
+
+FOCAL_SUBJECTS = ['Sociology', 'Management & Organizational Behavior'] # other subjects are labeled 'Other'
+
+# Journals whose titles in the JSTOR metadata differ from the subject table
+TITLE_FIXES = {'Industrial and Labor Relations Review': 'ILR Review',
+               'Journal for East European Management Studies': 'Journal of East European Management Studies'}
+
+# Journals missing from the subject table
+EXTRA_JOURNALS = [
+    r'Max Weber Studies	1470-8078	https://www.jstor.org/journal/maxweberstudies	Sociology	2000-10-01 - 2018-01-01											10/1/00 0:00	2019			',
+    r'Review of Religious Research	0034-673X	https://www.jstor.org/journal/revirelirese	Religion	1959-06-01 - 2015-12-01											6/1/59 0:00	2015			',
+    r'The Polish Sociological Bulletin	0032-2997	https://www.jstor.org/journal/polisocibull	Sociology	1961-05-01 - 1992-12-01	Social Sciences 	 Sociology									5/1/61 0:00	1992	polisocirevi		',
+]
+
+
+def load_journals(JOURNAL_META_FILE:str):
+    '''Reads the journal subject table (e.g. 'journal titles & subjects 10-15 edited.csv') and adds EXTRA_JOURNALS.'''
+
+    journals = pd.read_csv(JOURNAL_META_FILE)
+
+    to_append = pd.DataFrame([s.split('\t') for s in EXTRA_JOURNALS], columns=journals.columns)
+    to_append = to_append.replace('', np.nan)
+
+    return pd.concat([journals, to_append], ignore_index=True)
+
+
+def fix_titles(data:pd.DataFrame):
+    '''Renames journal titles in parsed metadata (column 'journal_title') to their names in the subject table.'''
+
+    data['journal_title'] = data.journal_title.map(lambda title: TITLE_FIXES.get(title, title)) # also for categories
+    return data
+
+
+def clean_years(years:pd.Series):
+    '''Publication years as integers, from the first four characters of the metadata 'year' field (missing if they
+    are not a number), parsed for the whole column at once. Years parsed already (integers) are kept as they are.'''
+
+    if pd.api.types.is_numeric_dtype(years):
+        return years.astype('Int64')
+
+    years = years.astype(str).str[0:4]
+    valid = years.str.fullmatch(r'\s*[+-]?\d+\s*')
+    return pd.to_numeric(years.where(valid), errors='coerce').astype('Int64')
@@ -1,32 +1,35 @@
-import numpy as np
+"""
+ARGUMENTS: python3 merge_metadata_result.py <path-to-metadata-results> <total-number-of-parts> <journal-metadata-file> <output-file> [<format>]
+    <format>: 'hdf' (default) or 'parquet', as passed to 'ParseMetaFilesUpdated'.
+USAGE: combines all parts of metadata results and adds each journal's primary subject.
+OUTPUT: <output-file> in HDF5 format, indexed on 'file_name'; with format 'parquet', <output-file> is a Parquet dataset
+    folder partitioned by 'primary_subject', so notebooks can read just the subjects and columns they need.
+"""
+
 import pandas as pd
 import sys
 
 from os.path import join
 
+import instrumentation
+from journal_subjects import FOCAL_SUBJECTS, fix_titles, load_journals
+from result_store import FORMATS, arrow_table, hdf_frame, read_parts
 
-METADATA_HOME, NUM_PARTS, JOURNAL_META_FILE, OUTFILE = sys.argv[1:]
-
-data = pd.DataFrame()
+instrumentation.setup('metadata_merge') # before reading sys.argv: removes --metrics/--profile/--sample
 
-for i in range(1, int(NUM_PARTS) + 1):
-    df = pd.read_hdf(join(METADATA_HOME, 'part{}.h5'.format(i)))
-    #df = pd.read_pickle(join(METADATA_HOME, 'part{}.pickle'.format(i))) # note file format
-    data = data.append(df)
 
-data.loc[data.journal_title == 'Industrial and Labor Relations Review', 'journal_title'] = 'ILR Review'
-data.loc[data.journal_title == 'Journal for East European Management Studies', 'journal_title'] = 'Journal of East European Management Studies'
+if len(sys.argv) not in (5, 6):
+    print(__doc__)
+    exit()
 
-journals = pd.read_csv(JOURNAL_META_FILE)
+METADATA_HOME, NUM_PARTS, JOURNAL_META_FILE, OUTFILE = sys.argv[1:5]
+FORMAT = sys.argv[5] if len(sys.argv) == 6 else 'hdf'
+assert FORMAT in FORMATS, f"Unknown format {FORMAT!r}; options are: {', '.join(FORMATS)}"
 
-s1 = r'Max Weber Studies	1470-8078	https://www.jstor.org/journal/maxweberstudies	Sociology	2000-10-01 - 2018-01-01											10/1/00 0:00	2019			'
-s2 = r'Review of Religious Research	0034-673X	https://www.jstor.org/journal/revirelirese	Religion	1959-06-01 - 2015-12-01											6/1/59 0:00	2015			'
-s3 = r'The Polish Sociological Bulletin	0032-2997	https://www.jstor.org/journal/polisocibull	Sociology	1961-05-01 - 1992-12-01	Social Sciences 	 Sociology									5/1/61 0:00	1992	polisocirevi		'
+data = read_parts(METADATA_HOME, 'metadata', int(NUM_PARTS), FORMAT) # all parts at once, rather than appending one by one
 
-to_append = pd.DataFrame([s1.split('\t'), s2.split('\t'), s3.split('\t')], columns=journals.columns)
-to_append = to_append.replace('', np.nan)
-
-journals = journals.append(to_append, ignore_index=True)
+data = fix_titles(data) # use the subject table's names for renamed journals
+journals = load_journals(JOURNAL_META_FILE)
 
 merged = data.reset_index().merge(
     journals.loc[:, ['publication_title', 'primary_subject']],
@@ -36,7 +39,12 @@ merged = data.reset_index().merge(
 
 merged = merged.drop('publication_title', axis=1) # no longer need this column
 merged = merged[~merged.primary_subject.isnull()] # drop if has no journal, or journal has no primary subject
-merged.loc[~merged.primary_subject.isin(['Sociology', 'Management & Organizational Behavior']), 'primary_subject'] = 'Other' # rename primary subject as "other" if not in sociology/OB
-
-merged.to_hdf(OUTFILE, key='metadata', mode='w')
+merged.loc[~merged.primary_subject.isin(FOCAL_SUBJECTS), 'primary_subject'] = 'Other' # rename primary subject as "other" if not in sociology/OB
+
+if FORMAT == 'parquet':
+    import pyarrow.dataset as ds
+    ds.write_dataset(arrow_table(merged), OUTFILE, format='parquet', partitioning=['primary_subject'],
+                     partitioning_flavor='hive', existing_data_behavior='delete_matching')
+else:
+    hdf_frame(merged).to_hdf(OUTFILE, key='metadata', mode='w')
 #merged.to_pickle(OUTFILE)
\ No newline at end of file
@@ -1,36 +1,201 @@
+"""
+ARGUMENTS: python3 ngram_agg.py [sketch] <path-to-jstor-data> <which-ngram> <article-list> <output-path> [<memory-budget-mb> [<processes>]]
+    sketch: if given as the first argument, the counts are summarized in a fixed-size frequency sketch instead
+        (approximate counts, top n-grams and quantile positions; see 'frequency_sketch.py'). The sketch has a fixed
+        size, so <memory-budget-mb> must then be 'none' or 0.
+    <which-ngram>: 1, 2, or 3.
+    <article-list>: text file with one article id per line (e.g. 'journal-article-10.2307_2065002').
+    <memory-budget-mb>: if given (and not 'none' or 0), counts are held in memory only up to about this many
+        megabytes; beyond that they are sorted and spilled to disk and merged at the end (see 'spill_counter.py'),
+        and the output is sorted by n-gram. Without it, all counts are held in memory and the output lists n-grams in
+        order of first appearance.
+    <processes>: number of worker processes (default 1). Each worker sums a contiguous slice of <article-list> and
+        routes every n-gram, by a hash of it, to one of <processes> partitions, writing one sorted run per partition
+        (and more if it spills within its share of <memory-budget-mb>). Each partition is then merged by one worker
+        into its own sorted output slice, and the slices are merged by n-gram, so no process ever holds the counts
+        of the whole corpus. The output is sorted by n-gram, identical to a single process with <memory-budget-mb>.
+        With 'sketch', the partial sketches are merged pairwise instead.
+USAGE: Sums the counts of every n-gram over all articles in <article-list>, e.g.
+    python3 ngram_agg.py jstor_data 2 articles.txt results 4096 8
+    python3 ngram_agg.py sketch jstor_data 2 articles.txt results none 8
+OUTPUT: '<output-path>/ngram<which-ngram>_agg.txt', one 'n-gram count' line per distinct n-gram; with 'sketch',
+    '<output-path>/ngram<which-ngram>_sketch.pkl' (load with `FrequencySketch.load()`).
+"""
+
+import heapq
 import os
+import shutil
 import sys
+import zlib
 from collections import Counter
+from multiprocessing import Pool
 
 from tqdm import tqdm
 
+import instrumentation
+from corpus import open_corpus, read_article_list
+from frequency_sketch import FrequencySketch
+from scheduler import split_parts
+from spill_counter import SpillingCounter
 
-JSTOR_HOME, NGRAM, INDICES, OUTPUT_PATH = sys.argv[1:]
-NGRAM = int(NGRAM)
+def aggregate(files, c, corpus, ngram_value:int):
+    '''Adds the n-gram counts of every file in files to c (a Counter, SpillingCounter or FrequencySketch), skipping
+    unreadable files.'''
 
-folder = os.path.join(JSTOR_HOME, 'ngram{}'.format(NGRAM))
+    for file in files:
+        try:
+            d = {}
+            for k, v in corpus.read_ngrams(file, ngram_value):
+                d[k] = v
+            c.update(d)
+        except:
+            print('Encountered an error when processing', file)
+            instrumentation.add(errors=1)
+    return c
 
-with open(INDICES, 'r') as f:
-    files = f.read().split('\n')[:-1]
 
-c = Counter()
+def partition(term:str, num_partitions:int):
+    '''Partition of a term; the same in every process (unlike `hash()` of a str, which is salted per process).'''
+    return zlib.crc32(term.encode('utf-8')) % num_partitions
 
-print('Begin processing.')
 
-for file in tqdm(files):
-    try:
-        with open(os.path.join(folder, '{}-ngram{}.txt'.format(file, NGRAM)), 'r') as f:
-            d = {}
-            for line in f.read().splitlines():
-                k, v = line.split('\t')
-                d[k] = int(v)
-            c.update(d)
-    except:
-        print('Encountered an error when processing', file)
+class PartitionedCounter:
+    '''Routes the counts of each term to one of several SpillingCounters, by `partition()` of the term.'''
+
+    def __init__(self, counters:list):
+        self.counters = counters
+
+    def update(self, term_counts:dict):
+        parts = [{} for _ in self.counters]
+        for term, count in term_counts.items():
+            parts[partition(term, len(parts))][term] = count
+        for counter, part in zip(self.counters, parts):
+            if part:
+                counter.update(part)
+
+    def spill(self):
+        '''Writes what is left in memory; returns the sorted run files of every partition.'''
+
+        for counter in self.counters:
+            counter.spill()
+        return [counter.runs for counter in self.counters]
+
+
+# Per-worker state, set once by `_init_worker()`: workers started by spawn import this module without running the script
+_worker_args = None
+
+def _init_worker(corpus, ngram_value, mode, memory_mb, processes, run_dir):
+    global _worker_args
+    _worker_args = (corpus, ngram_value, mode, memory_mb, processes, run_dir)
+
+
+def map_slice(num_files):
+    '''Map step (in a worker): sums the counts of one (num, files) slice; in 'exact' mode, writes them as sorted
+    runs, one or more per partition, and returns their paths.'''
+
+    num, files = num_files
+    corpus, ngram_value, mode, memory_mb, processes, run_dir = _worker_args
+    if mode == 'sketch':
+        return aggregate(files, FrequencySketch(), corpus, ngram_value)
+
+    budget = memory_mb / processes ** 2 if memory_mb else float('inf') # the worker's share, split among partitions
+    c = PartitionedCounter([SpillingCounter(os.path.join(run_dir, 'worker{}'.format(num), 'partition{}'.format(r)),
+                                            budget) for r in range(processes)])
+    aggregate(files, c, corpus, ngram_value)
+    return c.spill()
+
+
+def reduce_partition(r, runs_per_worker):
+    '''Reduce step (in a worker): merges the runs of partition r from every worker and writes the summed counts,
+    sorted by n-gram, to the partition's own output slice.'''
+
+    corpus, ngram_value, mode, memory_mb, processes, run_dir = _worker_args
+    budget = memory_mb / processes if memory_mb else float('inf')
+    c = SpillingCounter(os.path.join(run_dir, 'partition{}'.format(r)), budget)
+    for runs in runs_per_worker:
+        c.add_runs(runs)
+
+    path = os.path.join(run_dir, 'ngram{}_agg_part{}.txt'.format(ngram_value, r))
+    with open(path, 'w') as f:
+        for x in c.items():
+            f.write('{} {}\n'.format(x[0], x[1]))
+    return path
+
+
+def merge_pair(left, right):
+    '''Reduce step of 'sketch' mode (in a worker): merges sketch right into left.'''
+    return left.merge(right)
+
+
+if __name__ == '__main__':
+    instrumentation.setup('ngram_aggregate') # before reading sys.argv: removes --metrics/--profile/--sample
+
+    MODE = 'exact'
+    if len(sys.argv) > 1 and sys.argv[1] == 'sketch':
+        MODE = sys.argv.pop(1)
+
+    if len(sys.argv) not in (5, 6, 7):
+        print(__doc__)
+        exit()
+
+    JSTOR_HOME, NGRAM, INDICES, OUTPUT_PATH = sys.argv[1:5]
+    NGRAM = int(NGRAM)
+    MEMORY_MB = sys.argv[5] if len(sys.argv) >= 6 else 'none'
+    MEMORY_MB = None if MEMORY_MB.lower() == 'none' or float(MEMORY_MB) == 0 else float(MEMORY_MB)
+    PROCESSES = int(sys.argv[6]) if len(sys.argv) == 7 else 1
+    assert MODE == 'exact' or MEMORY_MB is None, \
+        "A 'sketch' has a fixed size; pass 'none' (or 0) as <memory-budget-mb>."
+    instrumentation.label(ngram=NGRAM, mode=MODE)
+    RUN_DIR = os.path.join(OUTPUT_PATH, 'ngram{}_agg_runs'.format(NGRAM))
+
+    corpus = open_corpus(JSTOR_HOME) # extracted text files, receipt archives or packed n-gram store
+
+    files = read_article_list(INDICES)
+
+    print('Begin processing.')
+
+    if PROCESSES == 1:
+        if MODE == 'sketch':
+            c = FrequencySketch()
+        else:
+            c = SpillingCounter(RUN_DIR, MEMORY_MB) if MEMORY_MB else Counter()
+        c = aggregate(tqdm(files), c, corpus, NGRAM)
+
+    else:
+        slices = split_parts(files, PROCESSES) # contiguous, in file order
+        settings = (corpus, NGRAM, MODE, MEMORY_MB, PROCESSES, RUN_DIR)
+
+        if MODE == 'sketch':
+            with Pool(PROCESSES, initializer=_init_worker, initargs=settings) as pool:
+                partials = list(tqdm(pool.imap(map_slice, slices.items()), total=PROCESSES))
+                while len(partials) > 1: # tree reduction of the fixed-size sketches, halving their number at each level
+                    merged = pool.starmap(merge_pair, zip(partials[0::2], partials[1::2]))
+                    partials = merged + partials[-1:] if len(partials) % 2 else merged
+            c = partials[0]
+
+        else:
+            with Pool(PROCESSES, initializer=_init_worker, initargs=settings) as pool:
+                worker_runs = list(tqdm(pool.imap(map_slice, slices.items()), total=PROCESSES)) # run file paths only
+                partition_runs = [[runs[r] for runs in worker_runs] for r in range(PROCESSES)]
+                outputs = pool.starmap(reduce_partition, enumerate(partition_runs))
+
+            # The partitions hold disjoint n-grams, each slice sorted: merge them into one sorted file, like
+            # `SpillingCounter` does
+            parts = [open(path, 'r', newline='\n') for path in outputs] # terms may contain '\r'
+            with open(os.path.join(OUTPUT_PATH, 'ngram{}_agg.txt'.format(NGRAM)), 'w') as f:
+                f.writelines(heapq.merge(*parts, key=lambda line: line.rsplit(' ', 1)[0]))
+            for part in parts:
+                part.close()
+            shutil.rmtree(RUN_DIR, ignore_errors=True)
+
+    if MODE == 'sketch':
+        c.save(os.path.join(OUTPUT_PATH, 'ngram{}_sketch.pkl'.format(NGRAM)))
+        print('Total count {}, about {} distinct n-grams; top 10:'.format(c.total, c.distinct()), c.top(10))
 
-to_write = ''
-for x in c.items():
-    to_write += '{} {}\n'.format(x[0], x[1])
+    elif PROCESSES == 1: # stream the output, rather than building it up as one string
+        with open(os.path.join(OUTPUT_PATH, 'ngram{}_agg.txt'.format(NGRAM)), 'w') as f:
+            for x in c.items():
+                f.write('{} {}\n'.format(x[0], x[1]))
 
-with open(os.path.join(OUTPUT_PATH, 'ngram{}_agg.txt'.format(NGRAM)), 'w') as f:
-    f.write(to_write)
+        if MEMORY_MB:
+            c.close()
@@ -0,0 +1,294 @@
+'''
+@description: Single-pass counting engine shared by `dict_count_all.py` and `dict_count_decades.py`. Each article
+is handled by one task that opens its ngram1, ngram2 and ngram3 files in turn, reads each file once, and returns
+the perspective counts already summed over all three n-gram sizes. This replaces running one full pass over the
+article list per n-gram size followed by a concat + `groupby('article_id').sum()`. Several named dictionary sets
+(e.g. every decade's expanded dictionaries plus the original and core ones) can be counted in the same read of
+each file with `generate_dict_set_counts()`. Articles are read through `corpus.open_corpus()`, so JSTOR_HOME may be
+either the extracted text files or a packed store built by `build_ngram_store.py`. With a checkpoint directory,
+finished rows are written to disk every few thousand articles, and a restarted run skips the articles already there.
+'''
+
+import hashlib
+import json
+import os
+import re
+from multiprocessing import Pool, cpu_count
+
+from tqdm import tqdm
+
+import instrumentation
+from corpus import open_corpus
+from count_accumulator import CountsAccumulator
+from result_cache import CacheReader, ResultCache
+
+
+NGRAM_VALUES = (1, 2, 3)
+CACHE_WRITE_BATCH = 5000 # cache entries written per transaction
+CHECKPOINT_MANIFEST = 'checkpoint.json'
+
+
+def load_dictionary(path:str):
+    '''Reads a dictionary file with one term per line, normalizing word separators (commas, spaces) to underscores.
+
+    Args:
+        path (str): path to dictionary file, e.g. '../dictionaries/original/cultural_original.csv'
+
+    Returns:
+        terms (list of str): terms in file order, e.g. ['avoidance_inspection', ...]
+    '''
+
+    with open(path, 'r') as f:
+        terms = [line.strip() for line in f.read().splitlines()]
+
+    return [re.sub('[, ]+', '_', term) for term in terms if term]
+
+
+def compile_term_index(ALL_DICTS:list):
+    '''Maps each dictionary term to the dictionaries it belongs to, split by n-gram size.
+
+    Args:
+        ALL_DICTS (list): list of lists, each list is a dictionary (list of str) for a perspective;
+            words within a term are separated by underscores
+
+    Returns:
+        term_index (dict): {ngram_value: {term: [dict_idx, ...]}}; a term listed twice in a dictionary
+            keeps both entries, matching the old per-dictionary sums
+    '''
+
+    term_index = {ngram_value: {} for ngram_value in NGRAM_VALUES}
+    for dict_idx, DICT in enumerate(ALL_DICTS):
+        for term in DICT:
+            ngram_value = len(term.split('_')) # underscores separate words
+            if ngram_value in term_index:
+                term_index[ngram_value].setdefault(term, []).append(dict_idx)
+
+    return term_index
+
+
+def encode_term_index(term_index:dict, corpus):
+    '''Re-keys a term index by the corpus' own keys (terms with spaces between words, or store term ids).'''
+    return {ngram_value: corpus.encode(ngram_value, {term.replace('_', ' '): dict_idxs for term, dict_idxs in terms.items()})
+            for ngram_value, terms in term_index.items()}
+
+
+def count_article(file:str, term_index:dict, num_dicts:int, corpus):
+    '''Counts dictionary terms in all n-gram files of one article, reading each file once.
+
+    Args:
+        file (str): article file name without n-gram suffix, e.g. 'journal-article-10.2307_2065002'
+        term_index (dict): output of `encode_term_index()` for this corpus
+        num_dicts (int): number of dictionaries (length of the returned list)
+        corpus: reader returned by `corpus.open_corpus()`
+
+    Returns:
+        term_sums (list of int): total count of terms per dictionary, summed over unigrams, bigrams and trigrams
+    '''
+
+    term_sums = [0] * num_dicts
+
+    for ngram_value in NGRAM_VALUES:
+        terms = term_index[ngram_value]
+        if not terms: # nothing to count at this length, skip reading the file
+            continue
+
+        for key, count in corpus.read_keys(file, ngram_value):
+            dict_idxs = terms.get(key)
+            if dict_idxs:
+                for dict_idx in dict_idxs:
+                    term_sums[dict_idx] += count
+
+    instrumentation.add(dictionary_hits=sum(term_sums))
+    return term_sums
+
+
+def count_article_cached(file:str, term_index:dict, num_dicts:int, corpus, cache):
+    '''Like `count_article()`, but serves unchanged n-gram files from a result cache.
+
+    Args:
+        file, term_index, num_dicts, corpus: as in `count_article()`
+        cache (CacheReader): read-only view of the result cache
+
+    Returns:
+        term_sums (list of int): as in `count_article()`
+        cache_log (dict): 'outcomes' (one per n-gram file), 'updates' and 'touched' to pass to `ResultCache.apply()`
+    '''
+
+    term_sums = [0] * num_dicts
+    cache_log = {'outcomes': [], 'updates': [], 'touched': []}
+
+    for ngram_value in NGRAM_VALUES:
+        terms = term_index[ngram_value]
+        if not terms:
+            continue
+
+        term_keys = frozenset(terms)
+        source, signature = corpus.source_key(file, ngram_value)
+        outcome, hits, known = cache.lookup(source, signature, term_keys)
+
+        if outcome == 'hits':
+            cache_log['touched'].append(source)
+        else: # count only the terms the cached entry doesn't know about
+            missing = term_keys - known
+            for key, count in corpus.read_keys(file, ngram_value):
+                if key in missing:
+                    hits[key] = hits.get(key, 0) + count
+            cache_log['updates'].append((source, signature, known | term_keys, hits))
+        cache_log['outcomes'].append(outcome)
+        instrumentation.add(**{'cache_' + outcome: 1}) # cache_hits, cache_partial or cache_misses
+
+        for key, count in hits.items():
+            for dict_idx in terms.get(key, ()): # cached hits may include terms dropped from the dictionaries
+                term_sums[dict_idx] += count
+
+    instrumentation.add(dictionary_hits=sum(term_sums))
+    return term_sums, cache_log
+
+
+# Per-worker state, set once by `_init_worker()` so the term index isn't re-sent with every task
+_worker_args = None
+_worker_cache = None
+
+def _init_worker(term_index, num_dicts, corpus, cache_path=None):
+    global _worker_args, _worker_cache
+    _worker_args = (term_index, num_dicts, corpus) # the parent's corpus: archives aren't re-listed in every worker
+    _worker_cache = CacheReader(cache_path) if cache_path else None
+
+def _count_article_worker(file):
+    if _worker_cache is None:
+        return count_article(file, *_worker_args), None
+    return count_article_cached(file, *_worker_args, _worker_cache)
+
+
+def open_checkpoint(checkpoint_dir:str, files:list, ALL_DICTS:list, DICT_NAMES:list, JSTOR_HOME:str, checkpoint_rows:int):
+    '''Opens (or starts) a checkpoint of per-article counts in checkpoint_dir.
+
+    Args:
+        checkpoint_dir (str): folder holding the checkpoint chunks ('counts_{chunk:05d}.csv') and a manifest
+        files, ALL_DICTS, DICT_NAMES, JSTOR_HOME: as in `generate_article_counts()`; a checkpoint only
+            resumes a run with the same inputs
+        checkpoint_rows (int): number of finished articles per checkpoint chunk
+
+    Returns:
+        counts (CountsAccumulator): accumulator that flushes to checkpoint_dir, including earlier chunks
+        done (set): articles already counted in earlier chunks
+    '''
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    inputs = json.dumps([os.path.abspath(JSTOR_HOME), DICT_NAMES, ALL_DICTS, files])
+    manifest = {'fingerprint': hashlib.sha1(inputs.encode('utf-8')).hexdigest(), 'num_articles': len(files)}
+
+    manifest_path = os.path.join(checkpoint_dir, CHECKPOINT_MANIFEST)
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, 'r') as f:
+            assert json.load(f) == manifest, f'Checkpoint in {checkpoint_dir} is from a run with other articles, dictionaries or data; delete it to start over.'
+    else:
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+    counts = CountsAccumulator(columns=[(dict_name + '_count') for dict_name in DICT_NAMES], size=len(files),
+                               chunk_rows=checkpoint_rows, chunk_prefix=os.path.join(checkpoint_dir, 'counts'))
+    return counts, counts.resume()
+
+
+def generate_article_counts(files:list, ALL_DICTS:list, DICT_NAMES:list, JSTOR_HOME:str,
+                            processes:int=None, chunksize:int=64, cache_path:str=None, cache_max_entries:int=1000000,
+                            checkpoint_dir:str=None, checkpoint_rows:int=5000):
+    '''Counts perspective terms for every article in one pass over the corpus.
+
+    Args:
+        files (list): list of all article file names
+        ALL_DICTS (list): list of lists, each list is a dictionary (list of str) for a perspective
+        DICT_NAMES (list): list of strings, each of which references a perspective (same order as ALL_DICTS)
+        JSTOR_HOME (str): path to top-level folder, under which are folders with ngram data
+        processes (int): number of worker processes; defaults to the number of cores, 1 disables multiprocessing
+        chunksize (int): number of articles handed to a worker at a time
+        cache_path (str): path to a `result_cache` database; if set, unchanged n-gram files are served from it
+            and a cache report is printed at the end
+        cache_max_entries (int): maximum number of cached n-gram files before LRU eviction
+        checkpoint_dir (str): if set, finished rows are written to this folder every checkpoint_rows articles,
+            and a rerun with the same inputs skips the articles already there; delete the folder once the
+            output is saved
+        checkpoint_rows (int): number of finished articles per checkpoint
+
+    Returns:
+        counts_df (pd.DataFrame): one row per article, with 'article_id' and one '{dict_name}_count' column
+            per dictionary, sorted by article_id
+    '''
+
+    assert len(ALL_DICTS) == len(DICT_NAMES), f'Must have same number of dictionaries (currently {str(len(ALL_DICTS))}) and dictionary names (currently {str(len(DICT_NAMES))}).'
+
+    corpus = open_corpus(JSTOR_HOME)
+    term_index = encode_term_index(compile_term_index(ALL_DICTS), corpus)
+    num_dicts = len(ALL_DICTS)
+    processes = processes or cpu_count()
+
+    if checkpoint_dir:
+        counts, done = open_checkpoint(checkpoint_dir, files, ALL_DICTS, DICT_NAMES, JSTOR_HOME, checkpoint_rows)
+        if done:
+            print(f'Resuming from checkpoint in {checkpoint_dir}: {len(done)} of {len(files)} articles already counted.')
+            files = [file for file in files if file not in done]
+    else:
+        counts = CountsAccumulator(columns=[(dict_name + '_count') for dict_name in DICT_NAMES], size=len(files))
+    cache = ResultCache(cache_path, max_entries=cache_max_entries) if cache_path else None
+    updates, touched = [], []
+
+    def collect(file, term_sums, cache_log):
+        counts.add(file, term_sums)
+        if cache_log is not None:
+            for outcome in cache_log['outcomes']:
+                cache.count(outcome)
+            updates.extend(cache_log['updates'])
+            touched.extend(cache_log['touched'])
+            if len(updates) + len(touched) >= CACHE_WRITE_BATCH:
+                cache.apply(updates, touched)
+                updates.clear(), touched.clear()
+
+    if processes == 1:
+        _init_worker(term_index, num_dicts, corpus, cache_path)
+        for file in tqdm(files):
+            collect(file, *_count_article_worker(file))
+    else:
+        with Pool(processes, initializer=_init_worker, initargs=(term_index, num_dicts, corpus, cache_path)) as pool:
+            results = pool.imap(_count_article_worker, files, chunksize=chunksize)
+            for file, (term_sums, cache_log) in zip(files, tqdm(results, total=len(files))):
+                collect(file, term_sums, cache_log)
+
+    if cache is not None:
+        cache.apply(updates, touched)
+        print(cache.report())
+        cache.close()
+
+    return counts.to_frame().sort_index().reset_index(drop=False)
+
+
+def generate_dict_set_counts(files:list, DICT_SETS:dict, JSTOR_HOME:str, processes:int=None, chunksize:int=64,
+                             cache_path:str=None, cache_max_entries:int=1000000,
+                             checkpoint_dir:str=None, checkpoint_rows:int=5000):
+    '''Counts several named dictionary sets in one read of each n-gram file.
+
+    Args:
+        files (list): list of all article file names
+        DICT_SETS (dict): {set_name: {dict_name: list of terms}}, e.g.
+            {'expanded_1971_1981': {'demographic': [...], 'relational': [...], 'cultural': [...]}, 'core': {...}}
+        JSTOR_HOME (str): path to top-level folder, under which are folders with ngram data
+        processes (int): number of worker processes; defaults to the number of cores
+        chunksize (int): number of articles handed to a worker at a time
+        cache_path (str), cache_max_entries (int): result cache options, as in `generate_article_counts()`
+        checkpoint_dir (str), checkpoint_rows (int): checkpoint options, as in `generate_article_counts()`
+
+    Returns:
+        counts_df (pd.DataFrame): one row per article, with 'article_id' and one '{set_name}_{dict_name}_count'
+            column per dictionary in each set
+    '''
+
+    ALL_DICTS, DICT_NAMES = [], []
+    for set_name, dicts in DICT_SETS.items():
+        for dict_name, terms in dicts.items():
+            ALL_DICTS.append(terms)
+            DICT_NAMES.append(f'{set_name}_{dict_name}') # namespace columns by dictionary set
+
+    return generate_article_counts(files=files, ALL_DICTS=ALL_DICTS, DICT_NAMES=DICT_NAMES, JSTOR_HOME=JSTOR_HOME,
+                                   processes=processes, chunksize=chunksize,
+                                   cache_path=cache_path, cache_max_entries=cache_max_entries,
+                                   checkpoint_dir=checkpoint_dir, checkpoint_rows=checkpoint_rows)
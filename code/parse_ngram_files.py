@@ -1,18 +1,29 @@
 """
-ARGUMENTS: python3 parse_ngram_files.py <path-to-dictionaries> <path-to-jstor-data> <which-ngram> <which-part> <how-many-parts> <output-path>
+ARGUMENTS: python3 parse_ngram_files.py <path-to-dictionaries> <path-to-jstor-data> <which-ngram> <which-part> <how-many-parts> <output-path> [<format> [<article-list>]]
+    <path-to-dictionaries>: folder of dictionaries split by 'split_dictionary', or a file compiled by
+        'build_dictionaries' from the unsplit dictionaries ('Culture.csv', 'Demographic.csv', 'Relational.csv').
     <which-ngram>: 1, 2, or 3.
     <how-many-parts>: for parallel processing, this should be the number of workers available to run the program; 1 if not running in parallel.
     <which-part>: for parallel processing, this should be a unique number for each worker, from 1 to <how-many-parts>; 1 if not running in parallel.
+        'all' processes every part in this one program: files are served in small batches from a shared queue to a pool of
+        worker processes (see 'scheduler.py'), and the same <how-many-parts> part files (and logs) are written as by
+        separate runs for parts 1 to <how-many-parts>.
+    <format>: 'hdf' (default) or 'parquet'; see OUTPUT.
+    <article-list>: optional text file with one article id per line, e.g. written by 'build_allowlist'; only these
+        articles are split into parts and counted, and the n-gram files of all others are never opened.
 USAGE: This program takes already-split dictionaries and reads in a batch of JSTOR article n-gram files to count the number of appearances of each n-gram in the dictionaries.
 INPUT: 
-    1. Dictionaries for Culture, Demographic, and Relational for <which-ngram>, split by the 'split_dictionary' program. 
-    2. JSTOR n-gram files for <which-ngram>.
+    1. Dictionaries for Culture, Demographic, and Relational for <which-ngram>, split by the 'split_dictionary' program
+       (or compiled by 'build_dictionaries'). 
+    2. JSTOR n-gram files for <which-ngram> at <path-to-jstor-data>: extracted, inside the JSTOR receipt archives (a .zip/.tar
+       archive or a folder of them), or in a packed n-gram store built by 'build_ngram_store'.
 OUTPUT: A table in HDF5 format, indexed on 'file_name', consisting of the following columns:
     'ngram_<which-ngram>_count', 'culture_<which-ngram>_count', 'demographic_<which-ngram>_count', 'relational_<which-ngram>_count'.
-ERROR LOG: contains the path to all files that the program skipped because of an error, if such files exist.
+    With format 'parquet', the same table is written to a partitioned Parquet dataset instead, as
+    '<output-path>/ngram_parts/ngram=<which-ngram>/part=<which-part>/data.parquet' (see 'result_store.py').
+ERROR LOG: contains the article id of all files that the program skipped because of an error, if such files exist.
 """
 
-import math
 import os
 import pandas as pd
 import re
@@ -20,79 +31,144 @@ import sys
 
 from tqdm import tqdm
 
+import instrumentation
+from compiled_dictionaries import MAIN_SET, load_dictionaries
+from corpus import open_corpus, read_article_list
+from count_accumulator import CountsAccumulator
+from result_store import write_part
+from scheduler import run_tasks, split_parts
+
+
+def count_file(file, corpus, ngram_value, culture, demographic, relational):
+    '''Counts all n-grams and dictionary n-grams in one article's n-gram file.
+
+    Args:
+        file (str): article id, e.g. 'journal-article-10.2307_2065002'
+        corpus: reader returned by `corpus.open_corpus()`
+        ngram_value (int): 1, 2 or 3
+        culture, demographic, relational (set): dictionary n-grams, re-keyed by `corpus.encode()`
+
+    Returns:
+        counts (list of int): ngram, culture, demographic and relational counts (up to the error, if one occurred)
+        lines_read (int): number of lines counted
+        failed (bool): True if reading the file raised an error
+    '''
+
+    lines_read = 0
+    ngram_count = 0
+    culture_count = 0
+    demographic_count = 0
+    relational_count = 0
+    failed = False
+    try:
+        for k, v in corpus.read_keys(file, ngram_value):
+            ngram_count += v
+            if k in culture:
+                culture_count += v
+            if k in demographic:
+                demographic_count += v
+            if k in relational:
+                relational_count += v
+            lines_read += 1
+    except:
+        failed = True
 
-if len(sys.argv) != 7:
-    print(__doc__)
-    exit()
+    instrumentation.add(dictionary_hits=culture_count + demographic_count + relational_count, errors=int(failed))
+    return [ngram_count, culture_count, demographic_count, relational_count], lines_read, failed
 
-DICT_HOME, JSTOR_HOME, NGRAM, NUM, CPU_COUNT, OUTPUT_PATH = sys.argv[1:]
-NGRAM, NUM, CPU_COUNT = int(NGRAM), int(NUM), int(CPU_COUNT)
 
-folder = os.path.join(JSTOR_HOME, 'ngram{}'.format(NGRAM))
+# Per-worker state, set once by `_init_worker()`: workers started by spawn import this module without running the script
+_worker_args = None
 
-path, dirs, files = next(os.walk(folder))
-files = [os.path.join(path, file) for file in files] # Add folder name "path" as prefix to file 
+def _init_worker(corpus, ngram_value, culture, demographic, relational):
+    global _worker_args
+    _worker_args = (corpus, ngram_value, culture, demographic, relational)
 
-NUM_EACH = math.ceil(len(files) / CPU_COUNT)
-LEFT = (NUM - 1) * NUM_EACH
-RIGHT = LEFT + NUM_EACH
+def _count_file_worker(file):
+    return count_file(file, *_worker_args)
 
-files = files[LEFT:RIGHT]
 
-LOG_FILE = os.path.join(OUTPUT_PATH, 'ngram{}_part{}.log'.format(NGRAM, NUM))
+if __name__ == '__main__':
+    instrumentation.setup('ngram_count') # before reading sys.argv: removes --metrics/--profile/--sample
 
-with open(os.path.join(DICT_HOME, 'Culture_{}.csv'.format(NGRAM)), 'r') as f:
-    culture = set(f.read().splitlines())
+    if len(sys.argv) not in (7, 8, 9):
+        print(__doc__)
+        exit()
 
-with open(os.path.join(DICT_HOME, 'Demographic_{}.csv'.format(NGRAM)), 'r') as f:
-    demographic = set(f.read().splitlines())
+    DICT_HOME, JSTOR_HOME, NGRAM, NUM, CPU_COUNT, OUTPUT_PATH = sys.argv[1:7]
+    FORMAT = sys.argv[7] if len(sys.argv) >= 8 else 'hdf'
+    ARTICLE_LIST = sys.argv[8] if len(sys.argv) == 9 else None
+    NGRAM, CPU_COUNT = int(NGRAM), int(CPU_COUNT)
+    instrumentation.label(ngram=NGRAM, part=NUM)
 
-with open(os.path.join(DICT_HOME, 'Relational_{}.csv'.format(NGRAM)), 'r') as f:
-    relational = set(f.read().splitlines())
+    corpus = open_corpus(JSTOR_HOME) # extracted text files or packed n-gram store
+    files = corpus.articles(NGRAM) # article ids, e.g. 'journal-article-10.2307_2065002'
 
-df = pd.DataFrame(columns=[
-        'file_name',
-        'ngram_{}_count'.format(NGRAM),
-        'culture_{}_count'.format(NGRAM),
-        'demographic_{}_count'.format(NGRAM),
-        'relational_{}_count'.format(NGRAM)]).set_index('file_name')
+    if ARTICLE_LIST is not None: # filter before splitting into parts, so the parts stay balanced
+        allowed = set(read_article_list(ARTICLE_LIST))
+        files = [file for file in files if file in allowed]
 
-log_file = open(LOG_FILE, 'w')
-logged = False
+    parts = split_parts(files, CPU_COUNT)
+    if NUM != 'all':
+        parts = {int(NUM): parts[int(NUM)]}
 
-for file in tqdm(files):
-    try:
-        with open(file, 'r') as f:
-            file_name = re.findall('journal-article-.+\.txt', file)[0][:-11]
-            ngram_count = 0
-            culture_count = 0
-            demographic_count = 0
-            relational_count = 0
-
-            for line in f.read().splitlines():
-                k, v = line.split('\t')
-                ngram_count += int(v)
-                if k in culture:
-                    culture_count += int(v)
-                if k in demographic:
-                    demographic_count += int(v)
-                if k in relational:
-                    relational_count += int(v)
-
-                df.loc[file_name, :] = [
-                    ngram_count,
-                    culture_count,
-                    demographic_count,
-                    relational_count]
-    except:
-        _ = log_file.write(file + '\n')
-        logged = True
+    if DICT_HOME.endswith('.pkl'): # compiled by 'build_dictionaries': terms of this length, words separated by spaces
+        dictionaries = load_dictionaries(DICT_HOME)
+        culture, demographic, relational = (dictionaries.ngram_terms(MAIN_SET, name, NGRAM)
+                                            for name in ('Culture', 'Demographic', 'Relational'))
+    else:
+        with open(os.path.join(DICT_HOME, 'Culture_{}.csv'.format(NGRAM)), 'r') as f:
+            culture = set(f.read().splitlines())
+
+        with open(os.path.join(DICT_HOME, 'Demographic_{}.csv'.format(NGRAM)), 'r') as f:
+            demographic = set(f.read().splitlines())
+
+        with open(os.path.join(DICT_HOME, 'Relational_{}.csv'.format(NGRAM)), 'r') as f:
+            relational = set(f.read().splitlines())
+
+    # Look dictionaries up by the corpus' own keys (terms, or term ids in a packed store)
+    culture = set(corpus.encode(NGRAM, dict.fromkeys(culture)))
+    demographic = set(corpus.encode(NGRAM, dict.fromkeys(demographic)))
+    relational = set(corpus.encode(NGRAM, dict.fromkeys(relational)))
+
+    # Count every file; a single part runs in this process, 'all' shares the files out to a pool as workers free up
+    part_files = [file for part in parts.values() for file in part]
+    results = {}
+    for file, result in tqdm(run_tasks(_count_file_worker, part_files, kind='io', processes=None if NUM == 'all' else 1,
+                                       initializer=_init_worker,
+                                       initargs=(corpus, NGRAM, culture, demographic, relational)),
+                             total=len(part_files)):
+        results[file] = result
+
+    # Write each part in its original file order, as a separate run for that part would
+    for num, files in parts.items():
+        LOG_FILE = os.path.join(OUTPUT_PATH, 'ngram{}_part{}.log'.format(NGRAM, num))
+
+        counts = CountsAccumulator(columns=[
+                'ngram_{}_count'.format(NGRAM),
+                'culture_{}_count'.format(NGRAM),
+                'demographic_{}_count'.format(NGRAM),
+                'relational_{}_count'.format(NGRAM)], size=len(files), key_name='file_name')
+
+        log_file = open(LOG_FILE, 'w')
+        logged = False
+
+        for file in files:
+            file_counts, lines_read, failed = results.pop(file)
+            if failed:
+                _ = log_file.write(file + '\n')
+                logged = True
+
+            # Record the file once, after its lines are counted (a file that failed part-way keeps the lines read before the error)
+            if lines_read > 0:
+                counts.add(file, file_counts)
 
-df.to_hdf(os.path.join(OUTPUT_PATH, 'ngram{}_part{}.h5'.format(NGRAM, NUM)), key='ngram', mode='w')
+        df = counts.to_frame()
+        write_part(df, OUTPUT_PATH, 'ngram', num, FORMAT, ngram=NGRAM)
 
-log_file.close()
+        log_file.close()
 
-if logged:
-    print('One or more files are skipped because of an error occurred when processing them. Check {} for these files.'.format(LOG_FILE))
-else:
-    os.remove(LOG_FILE) # remove log if it contains no message
+        if logged:
+            print('One or more files are skipped because of an error occurred when processing them. Check {} for these files.'.format(LOG_FILE))
+        else:
+            os.remove(LOG_FILE) # remove log if it contains no message
@@ -66,7 +66,11 @@ import sqlite3
 import logging
 
 import multiprocessing
+import queue
 from utils import *
+import instrumentation
+from dictionary_matcher import DictionaryMatcher
+from sqlite_writer import BatchedWriter
 
 
 ######################################################
@@ -78,6 +82,12 @@ Article Set List & Load Dictionary
 """
 # Load dictionary
 dataFrame_dictionary = create_dictionary_dataframe()
+# Compile dictionary into a (ngram_type, term) -> perspectives lookup; it is built once in the main process
+# and handed to each worker by `init_worker` when the pool starts.
+# Match mode, set with the NGRAM_MATCH_MODE environment variable: "substring" (default) reproduces the old
+# `str.contains` matching and its results, "exact" counts whole-term matches only (see dictionary_matcher.py)
+match_mode = os.environ.get("NGRAM_MATCH_MODE", "substring")
+dictionary_matcher = None
 # Set up logger
 logger = setup_logger("Mapping")
     
@@ -87,6 +97,15 @@ logger = setup_logger("Mapping")
 #                 Mapping Operations                 #
 ######################################################
 
+"""
+Pool initializer: stores the compiled dictionary in the worker, so it is sent once per worker rather than once per task
+"""
+def init_worker(matcher):
+    global dictionary_matcher
+    dictionary_matcher = matcher
+
+
+
 """
 Mapping words in the freq_list to the dictionaries and get the match rates
 @return: [Culture_Rate, Demographic_Rate, Relational_Rate]
@@ -118,12 +137,9 @@ def get_mapping_rate(file_path, ngram_type):
         for words_freq_pair in freq_list:
             words, freq = words_freq_pair
 
-            # Check Through Every Subject Dictionary
-            for subject in dictionary_name_list:
-                selected_dictionary = dataFrame_dictionary[(dataFrame_dictionary['Subject'] == subject) & 
-                                              (dataFrame_dictionary['N-Gram'] == ngram_type)]
-                if selected_dictionary['Words'].str.contains(words).any():
-                    match_counts[subject] += 1
+            # Look up every subject dictionary at once
+            for subject in dictionary_matcher.match(ngram_type, words):
+                match_counts[subject] += 1
 
         match_rates = [
             match_counts["Culture"] / len(freq_list),
@@ -176,19 +192,64 @@ def manage_file(file_id, file_set_id, file_set_path):
     return dataline
 
 
+
+def manage_files(file_ids, file_set_id, file_set_path):
+    return [manage_file(file_id, file_set_id, file_set_path) for file_id in file_ids]
+
+
+
+"""
+Streams results from the pool in completion order, keeping at most max_in_flight chunks of files submitted at once
+@param chunk_size: number of files handled by one task
+@param max_in_flight: maximum number of chunks submitted but not yet collected
+@return: generator of datalines (None for files that failed)
+"""
+def stream_results(pool, file_ids, file_set_id, file_set_path, chunk_size=64, max_in_flight=16):
+
+    # Finished chunks (or the exception that stopped one) are put here by the pool's result thread
+    finished = queue.Queue()
+    chunks = (file_ids[i:i + chunk_size] for i in range(0, len(file_ids), chunk_size))
+    in_flight = 0
+
+    while True:
+        # Top up the pool to max_in_flight chunks
+        for chunk in chunks:
+            pool.apply_async(manage_files, (chunk, file_set_id, file_set_path),
+                             callback=finished.put, error_callback=finished.put)
+            in_flight += 1
+            if in_flight == max_in_flight:
+                break
+
+        if in_flight == 0:
+            return
+
+        # Wait for whichever chunk finishes first
+        datalines = finished.get()
+        in_flight -= 1
+        if isinstance(datalines, Exception):
+            raise datalines
+        yield from datalines
+
+
     
 """
 The function runs the mapping algorithm and stores every result into the database
 @param break_point: the article_id of the last article the last time we finished running the function
+@param write_batch: number of results written to the database per transaction
+@param flush_seconds: maximum time (in seconds) results wait in memory before they are written
+@param chunk_size: number of files handled by one worker task
+@param max_in_flight: maximum number of tasks submitted but not yet collected (default: 2 per worker)
 """
-def create_mapping_operation(article_file_set_name, loaded_ids=[], cpu_count=8, log_batch=100):
+def create_mapping_operation(article_file_set_name, loaded_ids=[], cpu_count=8, log_batch=100,
+                             write_batch=1000, flush_seconds=5.0, chunk_size=64, max_in_flight=None):
     
     # Connect to the database "map_result_000.db"
     conn = sqlite3.connect(join(db_root, db_name))
-    # Create Cursor object so that we can execute SQL commands
-    cur = conn.cursor()
+    # Buffer rows and write them in batched transactions (WAL mode), rather than committing every row
+    writer = BatchedWriter(conn, "map_result", num_columns=15, batch_size=write_batch, flush_seconds=flush_seconds)
     
     logger.info("Processing Mapping")
+    pool = None
 
     # In case of non-closing database cursor which left db open
     try:
@@ -214,36 +275,25 @@ def create_mapping_operation(article_file_set_name, loaded_ids=[], cpu_count=8,
 
         logger.info("Async Processing")
 
-        # Init for multiprocessing 
-        pool = multiprocessing.Pool(cpu_count)
-        results = [pool.apply_async(manage_file, (file_id, file_set_id, file_set_path)) for file_id in file_ids]
+        # Init for multiprocessing; each worker receives the compiled dictionary once
+        matcher = DictionaryMatcher.from_dataframe(dataFrame_dictionary, mode=match_mode)
+        pool = multiprocessing.Pool(cpu_count, initializer=init_worker, initargs=(matcher,))
+        results = stream_results(pool, file_ids, file_set_id, file_set_path, chunk_size=chunk_size,
+                                 max_in_flight=max_in_flight or 2 * cpu_count)
 
         start = time.time()
         count, batch_count = 0, 1
 
         logger.info("Collecting Results")
-        for result in results:
+        for dataline in results:
 
-            dataline = result.get()
             if dataline is None:
                 continue
 
-            # Write the dataline into the database
-            insert_value = "insert into map_result values ('{set_id}', '{file_id}', "\
-                            "{n1_culture}, {n1_demographic}, {n1_relational}, "\
-                            "{n2_culture}, {n2_demographic}, {n2_relational}, "\
-                            "{n3_culture}, {n3_demographic}, {n3_relational}, "\
-                            "{culture_rate}, {demographic_rate}, {relational_rate}, "\
-                            "'{classification}')".format(set_id=dataline[0], file_id=dataline[1], 
-                                                         n1_culture=dataline[2], n1_demographic=dataline[3], 
-                                                         n1_relational=dataline[4], n2_culture=dataline[5], 
-                                                         n2_demographic=dataline[6], n2_relational=dataline[7],
-                                                         n3_culture=dataline[8], n3_demographic=dataline[9], 
-                                                         n3_relational=dataline[10], culture_rate=dataline[11], 
-                                                         demographic_rate=dataline[12], relational_rate=dataline[13], 
-                                                         classification=dataline[14])
-            cur.execute(insert_value)
-            conn.commit()
+            # Queue the dataline for the database:
+            # set_id, file_id, n1_culture, n1_demographic, n1_relational, n2_culture, n2_demographic, n2_relational,
+            # n3_culture, n3_demographic, n3_relational, culture_rate, demographic_rate, relational_rate, classification
+            writer.write(dataline)
 
             # Update Progress
             count += 1
@@ -259,13 +309,24 @@ def create_mapping_operation(article_file_set_name, loaded_ids=[], cpu_count=8,
                 
     except Exception as e:
         print("Error Message: {}\n".format(e))
-        cur.close()
-        conn.close()
+        if pool is not None:
+            pool.terminate()
+        try:
+            writer.close() # keep the results collected so far, so the next run can resume after them
+        except Exception as close_error: # e.g. a locked database; report it without hiding the error above
+            print("Could not write the remaining results: {}\n".format(close_error))
+        finally:
+            conn.close()
         return
         
-    # Close the database and cursor
-    cur.close()
-    conn.close()
+    pool.close()
+    pool.join()
+
+    # Write the remaining results and close the database, even if that last write fails
+    try:
+        writer.close()
+    finally:
+        conn.close()
     
     logger.info("Mission Complete")
     
@@ -274,6 +335,8 @@ def create_mapping_operation(article_file_set_name, loaded_ids=[], cpu_count=8,
         
 
 if __name__ == "__main__":
+    instrumentation.setup('parse_ngrams') # before reading sys.argv: removes --metrics/--profile/--sample
+
     # Load Arguments
     args = load_args()
     
@@ -0,0 +1,131 @@
+'''
+@description: Persistent, content-addressed cache of per-article dictionary hits for repeated counting runs.
+
+Each entry holds the hits (term -> count) found in one n-gram file, keyed by the file's identity (path, size and
+mtime; see `corpus.source_key()`), together with the set of dictionary terms that were probed for ("probe"). A
+probe is stored once and referenced by its fingerprint (SHA-1 of the sorted terms).
+
+On a rerun:
+    * unchanged file, no new dictionary terms     -> hit; served from the cache without opening the file
+    * unchanged file, some new dictionary terms   -> partial; the file is read again, but only the new terms are
+                                                     counted and merged into the entry (removed terms are ignored)
+    * new or modified file                        -> miss; counted from scratch
+
+The cache is bounded by `max_entries`; the least recently used entries are evicted first. Workers only read from
+the database; the process that owns the `ResultCache` applies writes and access times in batches.
+'''
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+class ResultCache:
+    '''SQLite-backed store of per-article, per-n-gram term hits.'''
+
+    def __init__(self, path:str, max_entries:int=1000000):
+        '''
+        Args:
+            path (str): path to the SQLite database, created if missing
+            max_entries (int): maximum number of cached n-gram files before LRU eviction
+        '''
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'partial': 0, 'misses': 0, 'evictions': 0}
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('pragma journal_mode=wal') # readers in worker processes don't block the writer
+        self.conn.execute('create table if not exists probes (fingerprint text primary key, terms text)')
+        self.conn.execute('create table if not exists entries (source text primary key, signature text, '
+                          'probe text, hits text, last_access real)')
+        self.conn.execute('create index if not exists entries_last_access on entries (last_access)')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def apply(self, updates:list, touched:list):
+        '''Writes results reported by `CacheReader.lookup()` callers, then evicts down to max_entries.
+
+        Args:
+            updates (list): (source, signature, probe_terms, hits) for every file that was (re)counted
+            touched (list): source of every entry that was served from the cache
+        '''
+
+        now = time.time()
+        for source, signature, probe_terms, hits in updates:
+            fingerprint = probe_fingerprint(probe_terms)
+            self.conn.execute('insert or ignore into probes values (?, ?)', (fingerprint, json.dumps(sorted(probe_terms))))
+            self.conn.execute('insert or replace into entries values (?, ?, ?, ?, ?)',
+                              (source, signature, fingerprint, json.dumps(list(hits.items())), now))
+        self.conn.executemany('update entries set last_access = ? where source = ?', [(now, source) for source in touched])
+        self.conn.commit()
+
+        num_entries = self.conn.execute('select count(*) from entries').fetchone()[0]
+        if num_entries > self.max_entries:
+            excess = num_entries - self.max_entries
+            self.conn.execute('delete from entries where source in '
+                              '(select source from entries order by last_access limit ?)', (excess,))
+            self.conn.execute('delete from probes where fingerprint not in (select distinct probe from entries)')
+            self.conn.commit()
+            self.stats['evictions'] += excess
+
+    def count(self, outcome:str):
+        '''Records one lookup outcome ('hits', 'partial' or 'misses').'''
+        self.stats[outcome] += 1
+
+    def report(self):
+        '''Returns a one-line summary of lookups and evictions in this run.'''
+        lookups = self.stats['hits'] + self.stats['partial'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / lookups if lookups else 0.
+        return ('Cache {path}: {lookups} lookups, {hits} hits ({hit_rate:.1%}), {partial} partial, {misses} misses, '
+                '{evictions} evictions'.format(path=self.path, lookups=lookups, hit_rate=hit_rate, **self.stats))
+
+
+def probe_fingerprint(terms):
+    '''Content fingerprint of a set of dictionary terms (or store term ids).'''
+    return hashlib.sha1(json.dumps(sorted(terms)).encode('utf-8')).hexdigest()
+
+
+class CacheReader:
+    '''Read-only view of a ResultCache, cheap to open in every worker process.'''
+
+    def __init__(self, path:str):
+        self.conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        self._probes = {} # fingerprint -> frozenset of terms
+
+    def probe_terms(self, fingerprint:str):
+        if fingerprint not in self._probes:
+            row = self.conn.execute('select terms from probes where fingerprint = ?', (fingerprint,)).fetchone()
+            self._probes[fingerprint] = frozenset(json.loads(row[0])) if row else frozenset()
+        return self._probes[fingerprint]
+
+    def lookup(self, source:str, signature:str, terms:frozenset):
+        '''Looks up the cached hits of one n-gram file for a set of dictionary terms.
+
+        Args:
+            source (str): identity of the n-gram file, e.g. its path
+            signature (str): size and mtime of the file (anything that changes when its contents do)
+            terms (frozenset): terms (or store term ids) being counted in this run
+
+        Returns:
+            outcome (str): 'hits', 'partial' or 'misses'
+            hits (dict): cached counts of every probed term found in the file (may include terms no longer
+                in `terms`; they are kept so the entry stays valid for earlier dictionaries)
+            known_terms (frozenset): terms whose counts are already known (the probe); only
+                `terms - known_terms` need counting from the file
+        '''
+
+        row = self.conn.execute('select signature, probe, hits from entries where source = ?', (source,)).fetchone()
+        if row is None or row[0] != signature:
+            return 'misses', {}, frozenset()
+
+        probe = self.probe_terms(row[1])
+        hits = {term: count for term, count in json.loads(row[2])}
+        return ('hits' if terms <= probe else 'partial'), hits, probe
@@ -0,0 +1,189 @@
+'''
+@description: Reads and writes the per-part results of `ParseMetaFilesUpdated.py` ('metadata') and
+`parse_ngram_files.py` ('ngram'), either as one HDF5 file per part (format 'hdf', the default) or as a partitioned
+Parquet dataset (format 'parquet', needs pyarrow). In the Parquet layout every part is one file in a Hive-style
+partition folder:
+
+    {OUTPUT_PATH}/ngram_parts/ngram={N}/part={NUM}/data.parquet
+    {OUTPUT_PATH}/metadata_parts/part={NUM}/data.parquet
+
+so the combine steps scan just the partitions (and columns) they need and concatenate the Arrow tables without
+copying, instead of appending DataFrames one part at a time.
+
+@usage (e.g. in notebooks, reading combined outputs written with format 'parquet'):
+    ngram = pd.read_parquet('ngram_combined.parquet', columns=['culture_1_count', 'ngram_1_count'])
+    metadata = pd.read_parquet('metadata_combined', columns=['journal_title', 'year'],
+                               filters=[('primary_subject', '!=', 'Other')])
+'''
+
+import os
+from os.path import join
+
+import pandas as pd
+
+
+FORMATS = ('hdf', 'parquet')
+KEY_NAME = 'file_name'
+LIST_COLUMNS = ('given_names', 'surname') # metadata columns holding one entry per author
+
+# Column types of the metadata results: categories for the fields shared by the articles of a journal, nullable
+# integers for the date and volume
+METADATA_DTYPES = {'type': 'category', 'journal_id': 'category', 'journal_title': 'category', 'issn': 'category',
+                   'day': 'Int16', 'month': 'Int16', 'year': 'Int16', 'volume': 'Int32'}
+
+
+def part_path(PATH:str, kind:str, num:int, fmt:str='hdf', ngram:int=None):
+    '''Path of one part file, e.g. 'ngram2_part7.h5' or 'ngram_parts/ngram=2/part=7/data.parquet' under PATH.'''
+
+    assert kind in ('ngram', 'metadata'), f"kind must be 'ngram' or 'metadata', not {kind!r}."
+    assert fmt in FORMATS, f"Unknown format {fmt!r}; options are: {', '.join(FORMATS)}"
+
+    if fmt == 'hdf':
+        return join(PATH, f'ngram{ngram}_part{num}.h5' if kind == 'ngram' else f'part{num}.h5')
+
+    return join(dataset_path(PATH, kind, ngram), f'part={num}', 'data.parquet')
+
+
+def dataset_path(PATH:str, kind:str, ngram:int=None):
+    '''Folder of the Parquet parts of one kind (and n-gram size); each n-gram size has its own columns.'''
+    return join(PATH, f'{kind}_parts', f'ngram={ngram}') if kind == 'ngram' else join(PATH, f'{kind}_parts')
+
+
+def arrow_table(df:pd.DataFrame):
+    '''Converts a results table (indexed on file_name) to Arrow with a fixed schema, so that parts with missing
+    values (e.g. no abstracts at all) still have the same column types as the others.'''
+
+    import pyarrow as pa
+
+    df = df.reset_index()
+    fields = []
+    for col, dtype in df.dtypes.items():
+        if col in LIST_COLUMNS:
+            fields.append(pa.field(col, pa.list_(pa.string())))
+        elif isinstance(dtype, pd.CategoricalDtype): # same index type in every part and chunk
+            fields.append(pa.field(col, pa.dictionary(pa.int32(), pa.string())))
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(dtype):
+            fields.append(pa.field(col, pa.from_numpy_dtype(dtype.numpy_dtype))) # nullable integers, e.g. 'Int16'
+        elif pd.api.types.is_numeric_dtype(dtype):
+            fields.append(pa.field(col, pa.from_numpy_dtype(dtype)))
+        else:
+            fields.append(pa.field(col, pa.string()))
+
+    return pa.Table.from_pandas(df, schema=pa.schema(fields), preserve_index=False)
+
+
+def hdf_frame(df:pd.DataFrame):
+    '''The table in types HDF5 fixed format can store: categories as their values, nullable integers as floats
+    (missing values as NaN). `typed()` converts them back.'''
+
+    converted = {}
+    for col, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            converted[col] = object
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(dtype):
+            converted[col] = 'float64'
+    return df.astype(converted) if converted else df
+
+
+def typed(df:pd.DataFrame, kind:str):
+    '''The table with the column types of its kind (METADATA_DTYPES for 'metadata'), e.g. after reading HDF5 or
+    concatenating parts whose categories differ.'''
+
+    dtypes = METADATA_DTYPES if kind == 'metadata' else {}
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
+
+class PartWriter:
+    '''Writes the results of one part in chunks of rows (DataFrames indexed on file_name), in order. With 'parquet',
+    every chunk is written as a row group as soon as it comes, so memory does not grow with the size of the part;
+    HDF5 fixed format can only be written whole, so with 'hdf' the chunks are kept until `close()`.'''
+
+    def __init__(self, PATH:str, kind:str, num:int, fmt:str='hdf', ngram:int=None):
+        '''
+        Args:
+            PATH (str): output folder
+            kind (str): 'ngram' or 'metadata'
+            num (int): part number
+            fmt (str): 'hdf' or 'parquet'
+            ngram (int): n-gram size (1, 2 or 3), for kind 'ngram'
+        '''
+
+        self.path = part_path(PATH, kind, num, fmt, ngram)
+        self.kind = kind
+        self.fmt = fmt
+        self.chunks = []
+        self.writer = None
+
+    def write(self, df:pd.DataFrame):
+        if self.fmt == 'hdf':
+            self.chunks.append(df)
+            return
+
+        import pyarrow.parquet as pq
+
+        table = arrow_table(df)
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.fmt == 'hdf':
+            df = self.chunks[0] if len(self.chunks) == 1 else typed(pd.concat(self.chunks), self.kind)
+            hdf_frame(df).to_hdf(self.path, key=self.kind, mode='w')
+            self.chunks = []
+        elif self.writer is not None:
+            self.writer.close()
+
+
+def write_part(df:pd.DataFrame, PATH:str, kind:str, num:int, fmt:str='hdf', ngram:int=None):
+    '''Writes the results of one part (indexed on file_name) in the given format.
+
+    Args:
+        df (pd.DataFrame): results of the part
+        PATH (str): output folder
+        kind (str): 'ngram' or 'metadata'
+        num (int): part number
+        fmt (str): 'hdf' or 'parquet'
+        ngram (int): n-gram size (1, 2 or 3), for kind 'ngram'
+    '''
+
+    writer = PartWriter(PATH, kind, num, fmt, ngram)
+    writer.write(df)
+    writer.close()
+
+
+def read_parts(PATH:str, kind:str, num_parts:int, fmt:str='hdf', ngram:int=None, columns:list=None):
+    '''Reads parts 1 to num_parts into one DataFrame, in part order.
+
+    Args:
+        PATH (str): folder the parts were written to
+        kind (str): 'ngram' or 'metadata'
+        num_parts (int): number of parts
+        fmt (str): 'hdf' or 'parquet'
+        ngram (int): n-gram size (1, 2 or 3), for kind 'ngram'
+        columns (list): columns to read (default all); with 'parquet', other columns are never read from disk
+
+    Returns:
+        df (pd.DataFrame): results of all parts, indexed on file_name
+    '''
+
+    if fmt == 'hdf':
+        parts = [pd.read_hdf(part_path(PATH, kind, num, fmt, ngram)) for num in range(1, num_parts + 1)]
+        df = typed(pd.concat(parts), kind)
+        return df if columns is None else df[columns]
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(dataset_path(PATH, kind, ngram), format='parquet', partitioning='hive')
+    names = [KEY_NAME] + (columns if columns is not None else
+                          [name for name in dataset.schema.names if name not in (KEY_NAME, 'part')])
+
+    # One lazy scan per part (partition pruning skips the other files), then a zero-copy concatenation
+    tables = [dataset.to_table(columns=names, filter=ds.field('part') == num) for num in range(1, num_parts + 1)]
+    df = pa.concat_tables(tables).to_pandas().set_index(KEY_NAME)
+    for col in LIST_COLUMNS:
+        if col in df.columns: # Arrow lists come back as arrays
+            df[col] = df[col].map(lambda names: None if names is None else list(names))
+    return typed(df, kind)
@@ -1,8 +1,4 @@
-for i in {1..44}
-do
-    nohup python3 ParseMetaFilesUpdated.py /vol_b/data/jstor_data $i 44 /vol_b/data/models_storage/metadata/temp/ &
-done
-
-wait
+# one run writes all 44 parts, sharing files out to a pool of workers as they free up (see scheduler.py)
+python3 ParseMetaFilesUpdated.py /vol_b/data/jstor_data all 44 /vol_b/data/models_storage/metadata/temp/
 
 python3 merge_metadata_result.py /vol_b/data/models_storage/metadata/temp/ 44 /vol_b/data/models_storage/metadata/journal_titles_subjects_h2.csv /vol_b/data/models_storage/metadata/metadata_combined_030921.h5
\ No newline at end of file
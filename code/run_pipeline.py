@@ -0,0 +1,263 @@
+"""
+ARGUMENTS: python3 run_pipeline.py <path-to-jstor-data> <path-to-dictionaries> <journal-metadata-file> <output-path> [<how-many-parts> [<workers> [<format> [<targets> [<article-filter>]]]]]
+    <how-many-parts>: number of parts (partitions) of the metadata and n-gram results (default 44).
+    <workers>: total number of processes to run at once, across all stages (default: number of cores).
+    <format>: 'hdf' (default) or 'parquet', as for 'ParseMetaFilesUpdated' and 'parse_ngram_files'.
+    <targets>: comma-separated final stages to build: 'metadata_combined', 'ngram_combined' or both (default).
+        Only the stages they depend on are run; <journal-metadata-file> is not read without 'metadata_combined'
+        (or an <article-filter>).
+    <article-filter>: 'none' (default) to count every article, 'subjects' to count only articles in Sociology and
+        Management & Organizational Behavior journals, or 'subjects:FIRST-LAST' to also keep only the years FIRST to
+        LAST (e.g. 'subjects:1971-2014'). The list of articles is built from the parsed metadata by
+        'build_allowlist', so n-gram counting then waits for metadata parsing, but never opens the other articles.
+USAGE: Runs the pipeline of 'run_all.sh' as a graph of tasks with declared inputs and outputs, instead of one stage
+    after another:
+
+        build_dictionaries ---> ngram{1,2,3}_part{1..P} ---> ngram_combined
+        metadata_part{1..P} ---------------------------------> metadata_combined
+
+    Every part of a stage is its own task (one 'ParseMetaFilesUpdated' or 'parse_ngram_files' run for that part),
+    and any task whose inputs are ready is started as long as fewer than <workers> processes are running, so metadata
+    parsing and unigram, bigram and trigram counting run side by side. A task is skipped if all its outputs exist and
+    are newer than its inputs (the outputs of the tasks it depends on, the script that runs it and the local modules
+    it imports, and the input data folders), so running the pipeline again after a failure only reruns the parts
+    that failed and what depends on them, and editing a module reruns every task that uses it. A failed task has
+    its partial outputs removed and is retried up to RETRIES times; tasks that depend on a task that still fails
+    are not run.
+    The dictionaries (<path-to-dictionaries>/Culture.csv, ...) are compiled once by 'build_dictionaries', which
+    normalizes their terms to n-gram keys and removes the terms in '../article_data/expanded_dict_blacklist.csv'.
+OUTPUT: in <output-path>: 'dicts/compiled_dictionaries.pkl', 'metadata_results/' (parts), 'metadata_combined.h5',
+    'ngram_results/' (parts and 'ngram_combined.h5'); with format 'parquet', the Parquet equivalents (see
+    'result_store.py'). The output of each task goes to 'logs/<task>.log'.
+"""
+
+import ast
+import os
+import shutil
+import subprocess
+import sys
+import time
+from multiprocessing import cpu_count
+from os.path import exists, getmtime, isdir, join
+
+from compiled_dictionaries import dictionary_files
+from journal_subjects import FOCAL_SUBJECTS
+from result_store import FORMATS, part_path
+from scheduler import WORKERS_ENV
+
+
+CODE_HOME = os.path.dirname(os.path.abspath(__file__))
+BLACKLIST = join(os.path.dirname(CODE_HOME), 'article_data', 'expanded_dict_blacklist.csv')
+TARGETS = ('metadata_combined', 'ngram_combined')
+RETRIES = 2 # further attempts of a failed task within one run
+POLL_SECONDS = 0.2
+
+
+def local_modules(script:str, found:set=None):
+    '''Paths of script and of every module in this folder it imports, directly or through other local modules.'''
+
+    found = set() if found is None else found
+    path = join(CODE_HOME, script)
+    if path in found or not exists(path):
+        return found
+    found.add(path)
+
+    with open(path, 'r') as f:
+        tree = ast.parse(f.read(), path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            local_modules(name.split('.')[0] + '.py', found)
+    return found
+
+
+class Task:
+    '''One run of a pipeline script, with the files it reads and writes.'''
+
+    def __init__(self, name:str, command:list, inputs:list, outputs:list, deps:list=(), workers:int=1):
+        '''
+        Args:
+            name (str): unique task name, e.g. 'ngram2_part7'
+            command (list): script (in this folder) and its arguments
+            inputs (list): files or folders read by the task besides the outputs of deps and its own code
+            outputs (list): files or folders written by the task
+            deps (list): tasks that must finish first
+            workers (int): processes the task uses, counted against the worker budget
+        '''
+
+        self.name = name
+        self.command = [str(arg) for arg in command]
+        self.deps = list(deps)
+        self.inputs = (list(inputs) + sorted(local_modules(command[0])) # the script and the local modules it imports
+                       + [path for dep in self.deps for path in dep.outputs])
+        self.outputs = list(outputs)
+        self.workers = workers
+        self.attempts = 0
+
+    def up_to_date(self):
+        '''True if every output exists and none is older than any input.'''
+
+        if not all(exists(path) for path in self.outputs):
+            return False
+        newest_input = max((getmtime(path) for path in self.inputs if exists(path)), default=0)
+        return min(getmtime(path) for path in self.outputs) >= newest_input
+
+    def remove_outputs(self):
+        '''Removes what a failed attempt may have left, so it is never taken for a finished output.'''
+
+        for path in self.outputs:
+            if isdir(path):
+                shutil.rmtree(path)
+            elif exists(path):
+                os.remove(path)
+
+
+def build_tasks(JSTOR_HOME:str, DICT_HOME:str, JOURNAL_META_FILE:str, OUTPUT_PATH:str, NUM_PARTS:int, FORMAT:str,
+                targets:list, article_filter:str='none'):
+    '''The tasks needed for targets, in a good starting order (short tasks that unblock others first).'''
+
+    dict_file = join(OUTPUT_PATH, 'dicts', 'compiled_dictionaries.pkl')
+    metadata_path = join(OUTPUT_PATH, 'metadata_results')
+    ngram_path = join(OUTPUT_PATH, 'ngram_results')
+    parts = range(1, NUM_PARTS + 1)
+    tasks = []
+
+    if 'ngram_combined' in targets:
+        compiled = [Task('dictionaries', ['build_dictionaries.py', DICT_HOME, dict_file, BLACKLIST],
+                         dictionary_files(DICT_HOME) + [BLACKLIST], [dict_file])]
+        tasks += compiled
+
+    if 'metadata_combined' in targets or article_filter != 'none':
+        metadata_parts = [Task('metadata_part{}'.format(num),
+                               ['ParseMetaFilesUpdated.py', JSTOR_HOME, num, NUM_PARTS, metadata_path, FORMAT],
+                               [join(JSTOR_HOME, 'metadata')], [part_path(metadata_path, 'metadata', num, FORMAT)])
+                          for num in parts]
+        tasks += metadata_parts
+
+    ngram_args, ngram_deps = [], []
+    if 'ngram_combined' in targets and article_filter != 'none':
+        years = article_filter.split(':')[1].split('-') if ':' in article_filter else ['none', 'none']
+        allowlist = join(OUTPUT_PATH, 'allowlist.txt')
+        ngram_deps = [Task('allowlist', ['build_allowlist.py', metadata_path, NUM_PARTS, JOURNAL_META_FILE, allowlist,
+                                         ','.join(FOCAL_SUBJECTS)] + years + [FORMAT],
+                           [JOURNAL_META_FILE], [allowlist], deps=metadata_parts)]
+        ngram_args = [allowlist]
+        tasks += ngram_deps
+
+    if 'ngram_combined' in targets:
+        ngram_parts = [Task('ngram{}_part{}'.format(n, num),
+                            ['parse_ngram_files.py', dict_file, JSTOR_HOME, n, num, NUM_PARTS, ngram_path, FORMAT]
+                            + ngram_args, [join(JSTOR_HOME, 'ngram{}'.format(n))],
+                            [part_path(ngram_path, 'ngram', num, FORMAT, ngram=n)], deps=compiled + ngram_deps)
+                       for num in parts for n in (1, 2, 3)]
+        tasks += ngram_parts
+
+    if 'metadata_combined' in targets:
+        merged = join(OUTPUT_PATH, 'metadata_combined' + ('.h5' if FORMAT == 'hdf' else ''))
+        tasks.append(Task('metadata_combined',
+                          ['merge_metadata_result.py', metadata_path, NUM_PARTS, JOURNAL_META_FILE, merged, FORMAT],
+                          [JOURNAL_META_FILE], [merged], deps=metadata_parts))
+
+    if 'ngram_combined' in targets:
+        combined = join(ngram_path, 'ngram_combined.h5' if FORMAT == 'hdf' else 'ngram_combined.parquet')
+        tasks.append(Task('ngram_combined', ['combine_ngram_result.py', ngram_path, NUM_PARTS, FORMAT], [], [combined],
+                          deps=ngram_parts))
+
+    return tasks
+
+
+def run_pipeline(tasks:list, workers:int, log_path:str):
+    '''Runs tasks as their dependencies finish, keeping at most workers processes busy.
+
+    Returns:
+        failed (list): names of tasks that failed (after retries) or could not run because a dependency failed
+    '''
+
+    pending = list(tasks)
+    running = {} # task name -> (task, process, log file)
+    done, failed = set(), []
+    env = dict(os.environ, **{WORKERS_ENV: '1'}) # each task is a single process
+
+    while pending or running:
+        busy = sum(task.workers for task, _, _ in running.values())
+
+        for task in list(pending):
+            if any(dep.name in failed for dep in task.deps):
+                pending.remove(task)
+                failed.append(task.name)
+                print('Not running {}: a task it depends on failed'.format(task.name))
+            elif all(dep.name in done for dep in task.deps):
+                if task.up_to_date():
+                    pending.remove(task)
+                    done.add(task.name)
+                    print('{} is up to date'.format(task.name))
+                elif busy + task.workers <= workers or not running:
+                    pending.remove(task)
+                    task.attempts += 1
+                    log = open(join(log_path, task.name + '.log'), 'w')
+                    try:
+                        process = subprocess.Popen([sys.executable] + task.command, cwd=CODE_HOME, env=env,
+                                                   stdout=log, stderr=subprocess.STDOUT)
+                    except BaseException:
+                        log.close()
+                        raise
+                    running[task.name] = (task, process, log)
+                    busy += task.workers
+                    print('Started {} (attempt {})'.format(task.name, task.attempts))
+
+        time.sleep(POLL_SECONDS)
+
+        for name, (task, process, log) in list(running.items()):
+            if process.poll() is None:
+                continue
+            del running[name]
+            log.close()
+
+            if process.returncode == 0 and all(exists(path) for path in task.outputs):
+                done.add(name)
+                print('Finished {}'.format(name))
+                continue
+
+            task.remove_outputs()
+            if task.attempts <= RETRIES:
+                pending.insert(0, task)
+                print('{} failed, retrying; see {}'.format(name, join(log_path, name + '.log')))
+            else:
+                failed.append(name)
+                print('{} failed {} times; see {}'.format(name, task.attempts, join(log_path, name + '.log')))
+
+    return failed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in range(5, 11):
+        print(__doc__)
+        exit()
+
+    JSTOR_HOME, DICT_HOME, JOURNAL_META_FILE, OUTPUT_PATH = sys.argv[1:5]
+    NUM_PARTS = int(sys.argv[5]) if len(sys.argv) > 5 else 44
+    WORKERS = int(sys.argv[6]) if len(sys.argv) > 6 else cpu_count()
+    FORMAT = sys.argv[7] if len(sys.argv) > 7 else 'hdf'
+    targets = sys.argv[8].split(',') if len(sys.argv) > 8 else list(TARGETS)
+    ARTICLE_FILTER = sys.argv[9] if len(sys.argv) > 9 else 'none'
+    assert FORMAT in FORMATS, f"Unknown format {FORMAT!r}; options are: {', '.join(FORMATS)}"
+    assert all(target in TARGETS for target in targets), f"Unknown target; options are: {', '.join(TARGETS)}"
+    assert ARTICLE_FILTER == 'none' or ARTICLE_FILTER.split(':')[0] == 'subjects', \
+        f"<article-filter> must be 'none', 'subjects' or 'subjects:FIRST-LAST', not {ARTICLE_FILTER!r}."
+
+    for folder in ('dicts', 'metadata_results', 'ngram_results', 'logs'):
+        os.makedirs(join(OUTPUT_PATH, folder), exist_ok=True)
+
+    tasks = build_tasks(JSTOR_HOME, DICT_HOME, JOURNAL_META_FILE, OUTPUT_PATH, NUM_PARTS, FORMAT, targets,
+                        ARTICLE_FILTER)
+    failed = run_pipeline(tasks, WORKERS, join(OUTPUT_PATH, 'logs'))
+
+    if failed:
+        print('Failed: {}'.format(', '.join(failed)))
+        sys.exit(1)
+    print('Finished all {} tasks'.format(len(tasks)))
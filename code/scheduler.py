@@ -0,0 +1,112 @@
+'''
+@description: Dynamic work queue for the batch stages of the pipeline (metadata parsing, n-gram counting). Instead of
+cutting the file list into one fixed slice per process up front--so that the slice with the biggest articles sets the
+runtime of the whole stage--files are served in small batches from a shared queue, and each worker takes the next
+batch as soon as it finishes its last one. The pool is sized for the kind of work: one process per core for
+CPU-bound stages (XML parsing), and several per core for I/O-bound stages (reading many small n-gram files), so
+workers waiting on the disk don't leave cores idle.
+
+`split_parts()` reproduces the old static `LEFT:RIGHT` slicing, so a single run can still write the same numbered
+part files that `merge_metadata_result.py` and `combine_ngram_result.py` expect.
+
+@usage:
+    for file, result in run_tasks(parse_file, files, kind='cpu'): # completion order, not file order
+        results[file] = result
+'''
+
+import math
+import os
+from multiprocessing import Pool, cpu_count
+
+
+IO_WORKERS_PER_CORE = 4 # processes per core for I/O-bound stages
+MAX_IO_WORKERS = 64
+MAX_BATCH_SIZE = 32 # files per batch; small batches keep the load balanced at the end of a stage
+BATCHES_PER_WORKER = 8 # aim for at least this many batches per worker on short file lists
+WORKERS_ENV = 'PIPELINE_WORKERS' # if set, fixes the pool size of every stage (e.g. to measure scaling, see benchmark.py)
+
+
+def pool_size(kind:str='cpu', num_tasks:int=None):
+    '''Number of worker processes for a stage.
+
+    Args:
+        kind (str): 'cpu' for CPU-bound work (one process per core) or 'io' for I/O-bound work (several per core);
+            the PIPELINE_WORKERS environment variable overrides both
+        num_tasks (int): number of files to process; the pool is never larger than this
+
+    Returns:
+        size (int): number of worker processes, at least 1
+    '''
+
+    assert kind in ('cpu', 'io'), f"kind must be 'cpu' or 'io', not {kind!r}."
+
+    cores = cpu_count()
+    size = cores if kind == 'cpu' else min(cores * IO_WORKERS_PER_CORE, MAX_IO_WORKERS)
+    if os.environ.get(WORKERS_ENV):
+        size = int(os.environ[WORKERS_ENV])
+    if num_tasks is not None:
+        size = min(size, num_tasks)
+    return max(size, 1)
+
+
+def split_parts(items:list, num_parts:int):
+    '''Splits items into the same numbered parts as the old static slicing, i.e. part NUM is
+    items[(NUM - 1) * ceil(len / num_parts) : NUM * ceil(len / num_parts)].
+
+    Returns:
+        parts (dict): {part number (1 to num_parts): list of items}; trailing parts may be empty
+    '''
+
+    num_each = math.ceil(len(items) / num_parts)
+    return {num: items[(num - 1) * num_each:num * num_each] for num in range(1, num_parts + 1)}
+
+
+def batches(items:list, batch_size:int):
+    '''Yields consecutive batches of at most batch_size items.'''
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+# Per-worker state, set once by `_init_worker()` so the task function isn't re-sent with every batch
+_task_func = None
+
+def _init_worker(func, initializer, initargs):
+    global _task_func
+    _task_func = func
+    if initializer is not None:
+        initializer(*initargs)
+
+def _run_batch(batch):
+    return [(item, _task_func(item)) for item in batch]
+
+
+def run_tasks(func, items:list, kind:str='cpu', processes:int=None, batch_size:int=None,
+              initializer=None, initargs:tuple=()):
+    '''Runs func on every item, serving small batches of items from a shared queue to a pool of workers.
+
+    Args:
+        func: function of one item, defined at module level (so workers can find it)
+        items (list): e.g. file paths or article ids
+        kind (str): 'cpu' or 'io'; sets the default pool size (see `pool_size()`)
+        processes (int): number of worker processes; defaults to `pool_size(kind)`, 1 runs in this process
+        batch_size (int): items per batch; defaults to a size that gives each worker several batches
+        initializer: optional function run once in each worker (and in this process if processes == 1)
+        initargs (tuple): arguments for initializer
+
+    Yields:
+        (item, result) pairs in order of completion
+    '''
+
+    processes = processes or pool_size(kind, len(items))
+    if batch_size is None:
+        batch_size = min(MAX_BATCH_SIZE, max(1, len(items) // (processes * BATCHES_PER_WORKER)))
+
+    if processes == 1:
+        _init_worker(func, initializer, initargs)
+        for item in items:
+            yield item, func(item)
+        return
+
+    with Pool(processes, initializer=_init_worker, initargs=(func, initializer, initargs)) as pool:
+        for results in pool.imap_unordered(_run_batch, batches(items, batch_size)):
+            yield from results
@@ -0,0 +1,115 @@
+'''
+@description: Counter with a fixed memory budget, for aggregating n-gram counts over the whole corpus (see
+`ngram_agg.py`). Counts are kept in an in-memory dict until its estimated size reaches the budget; the dict is then
+sorted by term and spilled to disk as a "run" file, and counting starts over with an empty dict. At the end, all runs
+(plus whatever is still in memory) are k-way merged with `heapq.merge`, summing the counts of equal terms, so peak
+memory depends on the budget and the number of runs being merged rather than on the size of the vocabulary.
+
+@usage:
+    c = SpillingCounter('/tmp/ngram3_runs', memory_mb=2000)
+    for file in files:
+        c.update(term_counts_of(file))
+    for term, count in c.items(): # sorted by term
+        ...
+    c.close() # removes the run files
+'''
+
+import heapq
+import os
+import shutil
+import sys
+from itertools import groupby
+from operator import itemgetter
+
+
+ENTRY_OVERHEAD = 100 # approximate bytes per dict entry besides the term itself (slot, hash, int object)
+MAX_FAN_IN = 128 # runs merged at once; more runs are first merged in passes, to bound open files
+
+
+class SpillingCounter:
+    '''Counts terms (str) within a memory budget, spilling sorted runs to disk.'''
+
+    def __init__(self, run_dir:str, memory_mb:float):
+        '''
+        Args:
+            run_dir (str): folder for the run files (created if missing; removed by `close()`)
+            memory_mb (float): budget for the in-memory counts, in megabytes
+        '''
+
+        os.makedirs(run_dir, exist_ok=True)
+        self.run_dir = run_dir
+        self.budget = memory_mb * 1024 ** 2
+        self.counts = {}
+        self.size = 0 # estimated bytes held by self.counts
+        self.runs = []
+        self.num_written = 0 # run files written so far, for unique names
+
+    def update(self, term_counts:dict):
+        '''Adds the counts in term_counts ({term: count}), spilling first if the budget is reached.'''
+
+        counts = self.counts
+        for term, count in term_counts.items():
+            if term in counts:
+                counts[term] += count
+            else:
+                counts[term] = count
+                self.size += sys.getsizeof(term) + ENTRY_OVERHEAD
+
+        if self.size >= self.budget:
+            self.spill()
+
+    def write_run(self, items):
+        '''Writes sorted (term, count) pairs to a new run file and returns its path.'''
+
+        path = os.path.join(self.run_dir, f'run{self.num_written:05d}.txt')
+        self.num_written += 1
+        with open(path, 'w', newline='\n') as f:
+            f.writelines(f'{term}\t{count}\n' for term, count in items) # terms never contain tabs or newlines
+        self.runs.append(path)
+        return path
+
+    def spill(self):
+        '''Sorts the in-memory counts by term and writes them to a run file.'''
+
+        if self.counts:
+            self.write_run(sorted(self.counts.items()))
+        self.counts = {}
+        self.size = 0
+
+    def add_runs(self, paths:list):
+        '''Adopts sorted run files written by other counters (e.g. in worker processes), to be merged by `items()`.'''
+        self.runs.extend(paths)
+
+    def read_run(self, path:str):
+        with open(path, 'r', newline='\n') as f:
+            for line in f:
+                term, count = line[:-1].split('\t')
+                yield term, int(count)
+
+    def merge(self, iterators):
+        '''Merges sorted (term, count) iterators into one, summing the counts of equal terms.'''
+        for term, group in groupby(heapq.merge(*iterators, key=itemgetter(0)), key=itemgetter(0)):
+            yield term, sum(count for _, count in group)
+
+    def items(self):
+        '''Yields every (term, total count), sorted by term.'''
+
+        if not self.runs: # everything fit in memory
+            yield from sorted(self.counts.items())
+            return
+
+        self.spill()
+
+        # Merge in passes until few enough runs are left to merge at once
+        while len(self.runs) > MAX_FAN_IN:
+            runs, self.runs = self.runs, []
+            for start in range(0, len(runs), MAX_FAN_IN):
+                batch = runs[start:start + MAX_FAN_IN]
+                self.write_run(self.merge([self.read_run(path) for path in batch]))
+                for path in batch:
+                    os.remove(path)
+
+        yield from self.merge([self.read_run(path) for path in self.runs])
+
+    def close(self):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
@@ -2,15 +2,23 @@ import sys
 
 from os.path import join
 
+import instrumentation
+from compiled_dictionaries import read_terms
+
+instrumentation.setup('dictionary_split') # before reading sys.argv: removes --metrics/--profile/--sample
+
 PATH = sys.argv[1]
 OUTPATH = sys.argv[2]
 DICT = sys.argv[3]
+instrumentation.label(dictionary=DICT)
 
 ngrams = ['', '', '']
 
-with open(join(PATH, '{}.csv'.format(DICT)), 'r') as f:
-    for line in f.read().splitlines():
-        ngrams[line.count(',')] += line + '\n'
+# Normalized terms ('avoidance,inspection' -> 'avoidance_inspection'), written as n-gram keys with spaces between words
+for term in read_terms(join(PATH, '{}.csv'.format(DICT))):
+    words = term.split('_')
+    if len(words) <= 3:
+        ngrams[len(words) - 1] += ' '.join(words) + '\n'
 
 for i in range(3):
     with open(join(OUTPATH, '{}_{}.csv'.format(DICT, i + 1)), 'w') as f:
@@ -0,0 +1,82 @@
+"""
+USAGE: Buffered, transactional row writer for SQLite result tables (e.g. `map_result` in `parse_ngrams.py`).
+    Rows are collected in memory and written with one parameterized `executemany` per transaction, instead of
+    formatting an `insert` string and committing once per row (which costs one disk sync per article):
+
+        with BatchedWriter(conn, "map_result", num_columns=15) as writer:
+            for dataline in datalines:
+                writer.write(dataline)  # flushed every `batch_size` rows or `flush_seconds` seconds
+
+    A batch is flushed when it reaches `batch_size` rows, or when a row arrives `flush_seconds` after the last flush
+    (so a slow run still persists its progress for resuming), and always on `close()` / leaving the `with` block.
+    The time limit is only checked in `write()`: there is no background timer (an sqlite3 connection can't be used
+    from another thread), so while the producer is stalled, queued rows stay in memory until the next row arrives
+    or the caller calls `flush()` itself.
+
+PRAGMAS: The connection is switched to WAL journal mode with `synchronous=NORMAL`, so a commit appends to the
+    write-ahead log without waiting for a sync of the main database file; a crash can lose at most the last
+    transactions, never corrupt the database.
+"""
+
+import time
+
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64000, # in KiB when negative, i.e. 64 MB
+}
+
+
+class BatchedWriter:
+    """Inserts rows into one table in batched transactions."""
+
+    def __init__(self, conn, table, num_columns, batch_size=1000, flush_seconds=5.0, pragmas=PRAGMAS):
+        """
+        Args:
+            conn (sqlite3.Connection): open connection to the database
+            table (str): name of the table to insert into
+            num_columns (int): number of values per row
+            batch_size (int): number of rows per transaction
+            flush_seconds (float): maximum time rows are held before being written, checked when a row arrives;
+                None to flush on size only
+            pragmas (dict): PRAGMA settings applied to the connection
+        """
+        self.conn = conn
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.insert = "insert into {table} values ({params})".format(table=table,
+                                                                     params=", ".join(["?"] * num_columns))
+
+        for pragma, value in pragmas.items():
+            self.conn.execute("pragma {pragma}={value}".format(pragma=pragma, value=value))
+
+        self.rows = []
+        self.num_written = 0
+        self.last_flush = time.time()
+
+    def write(self, row):
+        """Queues one row, flushing if the batch is full or the time threshold has passed."""
+        self.rows.append(tuple(row))
+        if len(self.rows) >= self.batch_size or \
+                (self.flush_seconds is not None and time.time() - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """Writes all queued rows in one transaction."""
+        rows, self.rows = self.rows, [] # a batch that fails is dropped, not retried on every later flush
+        if rows:
+            with self.conn: # commits, or rolls back the whole batch on error
+                self.conn.executemany(self.insert, rows)
+            self.num_written += len(rows)
+        self.last_flush = time.time()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
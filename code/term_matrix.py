@@ -0,0 +1,112 @@
+'''
+@description: Sparse article x term count matrix built by `build_term_matrix.py`. Once the matrix exists, counting a
+dictionary no longer needs a rescan of the corpus: every dictionary compiles to a sparse indicator vector over the
+vocabulary, so per-article perspective counts (as in `dict_count_all.py`) and per-term totals (as in
+`word_count_decades.py`) are each a single sparse matrix-vector product.
+
+@usage:
+    tm = TermMatrix('../term_matrix')
+    counts_df = tm.count_dictionaries(ALL_DICTS=[dem, relt, cult], DICT_NAMES=['demographic', 'relational', 'cultural'])
+    totals_df = tm.term_totals(dem + relt + cult)
+
+Dictionary terms use underscores to separate words (e.g. 'board_directors'), as in the other counting scripts.
+'''
+
+import json
+from os.path import join
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+MATRIX_FILE = 'term_matrix.npz'
+ARTICLES_FILE = 'articles.txt'
+VOCAB_FILE = 'vocab.txt'
+MANIFEST_FILE = 'term_matrix.json'
+
+
+class TermMatrix:
+    '''CSR matrix of n-gram counts, one row per article and one column per unigram, bigram or trigram.'''
+
+    def __init__(self, path:str):
+        with open(join(path, MANIFEST_FILE), 'r') as f:
+            self.manifest = json.load(f)
+        with open(join(path, ARTICLES_FILE), 'r', newline='\n') as f:
+            self.article_ids = f.read().split('\n')[:-1]
+        with open(join(path, VOCAB_FILE), 'r', newline='\n') as f:
+            self.vocab = f.read().split('\n')[:-1] # terms use spaces to separate words, as in the n-gram files
+
+        self.matrix = sparse.load_npz(join(path, MATRIX_FILE)).tocsr()
+        self.term_col = {term: col for col, term in enumerate(self.vocab)}
+
+        assert self.matrix.shape == (len(self.article_ids), len(self.vocab)), f'Term matrix in {path} does not match its article list and vocabulary; rebuild it with build_term_matrix.py.'
+
+    def rows(self, files:list=None):
+        '''Returns the row positions of files (all rows if None); articles missing from the matrix are skipped.'''
+        if files is None:
+            return np.arange(len(self.article_ids))
+        article_row = {article_id: row for row, article_id in enumerate(self.article_ids)}
+        return np.array([article_row[file] for file in files if file in article_row], dtype=np.int64)
+
+    def dictionary_vectors(self, ALL_DICTS:list):
+        '''Compiles dictionaries into a sparse (vocabulary x dictionaries) indicator matrix.
+
+        Args:
+            ALL_DICTS (list): list of lists, each list is a dictionary (list of str) for a perspective
+
+        Returns:
+            D (scipy.sparse.csc_matrix): D[col, i] is how often the term in column col is listed in dictionary i
+                (terms absent from the corpus are dropped, since they can't add to any count)
+        '''
+
+        cols, dict_idxs = [], []
+        for dict_idx, DICT in enumerate(ALL_DICTS):
+            for term in DICT:
+                col = self.term_col.get(term.replace('_', ' '))
+                if col is not None:
+                    cols.append(col)
+                    dict_idxs.append(dict_idx)
+
+        return sparse.csc_matrix((np.ones(len(cols), dtype=np.int64), (cols, dict_idxs)),
+                                 shape=(len(self.vocab), len(ALL_DICTS))) # duplicates are summed
+
+    def count_dictionaries(self, ALL_DICTS:list, DICT_NAMES:list, files:list=None):
+        '''Per-article perspective counts, summed over unigrams, bigrams and trigrams.
+
+        Args:
+            ALL_DICTS (list): list of lists, each list is a dictionary (list of str) for a perspective
+            DICT_NAMES (list): list of strings, each of which references a perspective (same order as ALL_DICTS)
+            files (list): article ids to keep; defaults to every article in the matrix
+
+        Returns:
+            counts_df (pd.DataFrame): 'article_id' and one '{dict_name}_count' column per dictionary
+        '''
+
+        assert len(ALL_DICTS) == len(DICT_NAMES), f'Must have same number of dictionaries (currently {str(len(ALL_DICTS))}) and dictionary names (currently {str(len(DICT_NAMES))}).'
+
+        rows = self.rows(files)
+        counts = (self.matrix[rows] @ self.dictionary_vectors(ALL_DICTS)).toarray()
+
+        counts_df = pd.DataFrame(counts, columns=[(dict_name + '_count') for dict_name in DICT_NAMES])
+        counts_df.insert(0, 'article_id', [self.article_ids[row] for row in rows])
+        return counts_df
+
+    def term_totals(self, terms:list, files:list=None):
+        '''Total count of each term across articles.
+
+        Args:
+            terms (list): terms to total, words separated by underscores
+            files (list): article ids to include; defaults to every article in the matrix
+
+        Returns:
+            totals_df (pd.DataFrame): columns 'term' and 'count', one row per unique term in order of first appearance
+        '''
+
+        terms = list(dict.fromkeys(terms))
+        matrix = self.matrix if files is None else self.matrix[self.rows(files)]
+        col_totals = np.asarray(matrix.sum(axis=0)).ravel() # ones-vector product over all articles
+
+        counts = [col_totals[self.term_col[term.replace('_', ' ')]] if term.replace('_', ' ') in self.term_col else 0
+                  for term in terms]
+        return pd.DataFrame({'term': terms, 'count': np.asarray(counts, dtype=np.int64)})
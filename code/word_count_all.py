@@ -8,7 +8,7 @@
 @contact: jhaber@berkeley.edu
 @inputs: list of authors OR list of terms, list of article filepaths 
 @outputs: count of authors (citation_and_expanded_dict_count_{thisdate}.csv), where 'thisdate' is in mmddyy format 
-@usage: python3 word_count_all.py
+@usage: python3 word_count_all.py [<article-list>] # with <article-list> (one article id per line, e.g. from `build_allowlist.py`), only the listed articles are opened
 @description: Counts mentions of individual words or authors--NOT separated by perspective as in previous versions--in articles by using ngram files ACROSS ALL YEARS OF DATA. To count a new list of terms or author names in the ngram files, change the list of words in the 'Update Words' section and/or change the word type to count (between 'citations' and 'terms', i.e. dictionaries), then run the script. 
 '''
 
@@ -28,6 +28,11 @@ from datetime import date
 from tqdm import tqdm # Shows progress over iterations, including in pandas via `df.progress_apply`
 from multiprocessing import Pool, cpu_count; cores = cpu_count() # count cores
 from functools import partial
+from count_accumulator import CountsAccumulator
+from corpus import open_corpus, read_article_list
+from compiled_dictionaries import load_dictionaries
+import instrumentation
+instrumentation.setup('word_count_all') # before reading sys.argv: removes --metrics/--profile/--sample
 
 
 ###############################################
@@ -38,11 +43,18 @@ cwd = os.getcwd()
 root = str.replace(cwd, 'dictionary_methods/code', '')
 JSTOR_HOME = root + "jstor_data"
 INDICES = "../article_data/filtered_length_index.csv"
+BLACKLIST = "../article_data/expanded_dict_blacklist.csv" # terms removed from every dictionary
+COMPILED_DICTS = root + "models_storage/dictionaries/compiled_dictionaries.pkl" # rebuilt when a dictionary changes
 
 with open(INDICES, 'r') as f:
     files = f.read().split('\n')[:-1]
     files = [fp.split(',')[1] for fp in files]
 
+# Optional article list (e.g. written by 'build_allowlist'): count only the articles in it
+if len(sys.argv) > 1:
+    allowed = set(read_article_list(sys.argv[1]))
+    files = [file for file in files if file in allowed]
+
     
 ###############################################
 #                Update words                 #
@@ -65,18 +77,11 @@ ALL_WORDS_COUNTS = [(re.sub(" ", "_", word) + "_count") for word in list(ALL_WOR
 
 words_type = 'terms'
 
-# Load original dictionaries
-cult_orig = pd.read_csv('../dictionaries/original/cultural_original.csv', delimiter = '\n', 
-                        header=None)[0].apply(lambda x: x.replace(',', ' '))
-cultural_terms = cult_orig.tolist()
-
-dem_orig = pd.read_csv('../dictionaries/original/demographic_original.csv', delimiter = '\n', 
-                       header=None)[0].apply(lambda x: x.replace(',', ' '))
-demographic_terms = dem_orig.tolist()
-
-relt_orig = pd.read_csv('../dictionaries/original/relational_original.csv', delimiter = '\n', 
-                        header=None)[0].apply(lambda x: x.replace(',', ' '))
-relational_terms = relt_orig.tolist()
+# Load original dictionaries (compiled once: normalized, blacklisted terms removed); n-gram files separate words with spaces
+dictionaries = load_dictionaries(COMPILED_DICTS, '../dictionaries', BLACKLIST)
+cultural_terms = [term.replace('_', ' ') for term in dictionaries.terms('original', 'cultural')]
+demographic_terms = [term.replace('_', ' ') for term in dictionaries.terms('original', 'demographic')]
+relational_terms = [term.replace('_', ' ') for term in dictionaries.terms('original', 'relational')]
 
 ALL_WORDS = list(set(demographic_terms + relational_terms + cultural_terms)) # full list of dictionaries
 ALL_WORDS_COUNTS = [(re.sub(" ", "_", word) + "_count") for word in list(ALL_WORDS)] # cleaned version
@@ -86,56 +91,48 @@ ALL_WORDS_COUNTS = [(re.sub(" ", "_", word) + "_count") for word in list(ALL_WOR
 #          Define counting functions          #
 ###############################################
 
-def generate_ngram_counts(ngram_value, counts_df, ALL_WORDS, JSTOR_HOME):
+def generate_ngram_counts(ngram_value, counts, ALL_WORDS, JSTOR_HOME):
     '''Generates ngram counts by parsing through JSTOR article files, and collecting and storing the word counts 
     for the words used in the JSTOR article. 
     
     Args: 
         ngram_value (int): how many words to count: 1 = unigram, 2 = bigram, 3 = trigram
-        counts_df (pd.DataFrame): the dataframe to update
-        ALL_WORDS (set): list of words to count
+        counts (CountsAccumulator): the per-article counts to update, one column per word in ALL_WORDS_COUNTS
+        ALL_WORDS (list): list of words to count
         JSTOR_HOME (str): path to top-level folder, under which are folders with ngram data
     
     Returns:
-        counts_df (pd.DataFrame): updated with columns for counts
+        counts (CountsAccumulator): updated with counts for this ngram_value
     '''
     
-    global ALL_WORDS_COUNTS, files # cleaned version of vocab; list of files
+    global files # list of files
     
     if (ngram_value > 3) or (ngram_value < 1):
         raise Exception(f"Unable to count entries of {ngram_value} length. Please limit the word number to 1-3.")
         sys.exit()
     
-    folder = os.path.join(JSTOR_HOME, 'ngram{}'.format(ngram_value))
+    corpus = open_corpus(JSTOR_HOME) # extracted text files or packed n-gram store
+    words_keys = corpus.encode(ngram_value, {word: word for word in ALL_WORDS}) # corpus key -> word, for fast lookups
 
     for file in tqdm(files):
-        with open(os.path.join(folder, '{}-ngram{}.txt'.format(file, ngram_value)), 'r') as f:
-
-            file_dict = {} # initialize dict for relevant vocab from article
-
-            for line in f.read().splitlines():
-                word, count = line.split('\t')
-                if word in ALL_WORDS:
-                    file_dict[word] = int(count)
-                    
-            # Create empty dict for row, with article id
-            row = {key: None for key in ALL_WORDS_COUNTS}
-            row['article_id'] = file #row = {"article_id": file}
-            
-            # For each word, assign counts to row
-            for word_idx in range(len(ALL_WORDS_COUNTS)):
-                row[ALL_WORDS_COUNTS[word_idx]] = file_dict.get(ALL_WORDS[word_idx], 0)
-            
-            counts_df = counts_df.append(row, ignore_index=True) # add row for article to DF
+        file_dict = {} # initialize dict for relevant vocab from article
+
+        for key, count in corpus.read_keys(file, ngram_value):
+            word = words_keys.get(key)
+            if word is not None:
+                file_dict[word] = count
+                
+        # Add counts for each word to the article's row (rows are summed across ngram values)
+        counts.add(file, [file_dict.get(word, 0) for word in ALL_WORDS])
     
-    return counts_df
+    return counts
 
         
 ################################################
 #                 Count words                  #
 ################################################
 
-counts_df = pd.DataFrame(columns=["article_id"]+ALL_WORDS_COUNTS)
+counts = CountsAccumulator(columns=ALL_WORDS_COUNTS, size=len(files)) # one preallocated row per article
 
 if not words_type:
     raise Exception("No type specified. Check the script to specify 'citations' or 'words' as counting target.")
@@ -143,13 +140,11 @@ if not words_type:
 
 print(f'Counting {words_type}...')
 
-counts_df = generate_ngram_counts(3, counts_df, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count trigrams
-
-counts_df = generate_ngram_counts(2, counts_df, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count bigrams
-counts_df = counts_df.groupby('article_id').sum().reset_index(drop = False) # collapse to save space
+counts = generate_ngram_counts(3, counts, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count trigrams
+counts = generate_ngram_counts(2, counts, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count bigrams
+counts = generate_ngram_counts(1, counts, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count unigrams
 
-counts_df = generate_ngram_counts(1, counts_df, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count unigrams
-counts_df = counts_df.groupby('article_id').sum().reset_index(drop = False) # collapse so one article = one row
+counts_df = counts.to_frame().sort_index().reset_index(drop = False) # one article = one row, already summed
                 
 #################################################
 #                Save output file               #
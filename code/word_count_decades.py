@@ -8,7 +8,7 @@
 @contact: jhaber@berkeley.edu
 @inputs: list of authors OR list of terms, list of decade-specific article filepaths 
 @outputs: count of authors (citation_and_expanded_dict_count_{thisdate}.csv), where 'thisdate' is in mmddyy format 
-@usage: python3 word_count_decades.py 1971-1981 # or: 1982-1992, 1993-2003, 2004-2014 (quotation marks optional)
+@usage: python3 word_count_decades.py 1971-1981 [<article-list>] # or: 1982-1992, 1993-2003, 2004-2014 (quotation marks optional); with <article-list> (one article id per line, e.g. from `build_allowlist.py`), only the listed articles are opened
 @description: Counts mentions of individual words or authors--NOT separated by perspective as in previous versions--in articles by using ngram files ACROSS A SINGLE DECADE. To count a new list of terms or author names in the ngram files for a specific decade, change the list of words in the 'Update Words' section, change the `DECADE` parameter below (under 'Define file paths' section), and/or change the word type to count (between 'citations' and 'terms', i.e. dictionaries), then run the script. 
 '''
 
@@ -29,6 +29,11 @@ from datetime import date
 from tqdm import tqdm # Shows progress over iterations, including in pandas via `df.progress_apply`
 from multiprocessing import Pool, cpu_count; cores = cpu_count() # count cores
 from functools import partial
+from count_accumulator import CountsAccumulator
+from corpus import open_corpus, read_article_list
+from compiled_dictionaries import load_dictionaries
+import instrumentation
+instrumentation.setup('word_count_decades') # before reading sys.argv: removes --metrics/--profile/--sample
 
 
 ###############################################
@@ -40,6 +45,8 @@ root = str.replace(cwd, 'dictionary_methods/code', '')
 DICTS_HOME = join(root, 'dictionary_methods/dictionaries')
 DATA_HOME = join(root, 'dictionary_methods/article_data')
 INDICES_HOME = join(root, 'models_storage/article_lists_jstor')
+BLACKLIST = join(DATA_HOME, 'expanded_dict_blacklist.csv') # terms removed from every dictionary
+COMPILED_DICTS = join(root, 'models_storage/dictionaries/compiled_dictionaries.pkl') # rebuilt when a dictionary changes
 JSTOR_HOME = join(root, 'jstor_data')
 
 # get decade-specific list of JSTOR filepaths (INDICES)
@@ -56,6 +63,11 @@ with open(INDICES, 'r') as f:
     files = f.read().split('\n')[1:-1]
     files = [fp.split(',')[1] for fp in files] # ignore index; get filepath only
 
+# Optional article list (e.g. written by 'build_allowlist'): count only the articles in it
+if len(sys.argv) > 2:
+    allowed = set(read_article_list(sys.argv[2]))
+    files = [file for file in files if file in allowed]
+
     
 ###############################################
 #                Update words                 #
@@ -79,12 +91,10 @@ words_type = 'terms' # set to count terms
 
 # Load decade-specific dictionaries
 DECADE_UNDER = DECADE.replace('-', '_')
-dem = pd.read_csv(join(DICTS_HOME, f'expanded_decades/demographic_{DECADE_UNDER}.txt'), delimiter = '\n', 
-                       header=None)[0].apply(lambda word: word.replace(',', ' ')).tolist()
-relt = pd.read_csv(join(DICTS_HOME, f'expanded_decades/relational_{DECADE_UNDER}.txt'), delimiter = '\n', 
-                        header=None)[0].apply(lambda word: word.replace(',', ' ')).tolist()
-cult = pd.read_csv(join(DICTS_HOME, f'expanded_decades/cultural_{DECADE_UNDER}.txt'), delimiter = '\n', 
-                        header=None)[0].apply(lambda word: word.replace(',', ' ')).tolist()
+dictionaries = load_dictionaries(COMPILED_DICTS, DICTS_HOME, BLACKLIST) # compiled once: normalized, blacklisted terms removed
+dem = dictionaries.terms(f'expanded_{DECADE_UNDER}', 'demographic')
+relt = dictionaries.terms(f'expanded_{DECADE_UNDER}', 'relational')
+cult = dictionaries.terms(f'expanded_{DECADE_UNDER}', 'cultural')
 
 ALL_WORDS = dem + relt + cult # full list of dictionaries; note underscores to separate ngrams
 
@@ -100,49 +110,48 @@ WORDS_PERSPECTIVES_DICT = {word: persp for word, persp in list(zip(ALL_WORDS, AL
 #          Define counting functions          #
 ###############################################
 
-def generate_ngram_counts(ngram_value:int, files:list, ALL_WORDS:list, JSTOR_HOME:str):
+def generate_ngram_counts(ngram_value:int, counts:CountsAccumulator, files:list, ALL_WORDS:list, JSTOR_HOME:str):
     '''Generates ngram counts by parsing through JSTOR article files, and collecting and storing the word counts 
     for the words used in the JSTOR article. 
     
     Args: 
         ngram_value (int): how many words to count: 1 = unigram, 2 = bigram, 3 = trigram
+        counts (CountsAccumulator): the per-article counts to update, one column per term
         files (list): list of all article filepaths
         ALL_TERMS (list): list of all words to count (regardless of whether unigram, bigram, etc.)
         JSTOR_HOME (str): path to top-level folder, under which are folders with ngram data
     
     Returns:
-        counts_df (pd.DataFrame): DataFrame with columns for words, values for counts
+        counts (CountsAccumulator): updated with counts for the terms of length ngram_value
     '''
     
     # Check that ngram_value between 1 and 3
     assert (ngram_value>=1 and ngram_value<=3), f"Unable to count entries of {ngram_value} length. Please limit the word number to 1-3."
         
     # Filter ALL_WORDS to length of ngram_value (to improve counting speed)
-    terms = [term for term in ALL_WORDS if len(term.split('_'))==ngram_value] # underscores separate words
-    
-    # Initialize DataFrame to store counting results
-    counts_df = pd.DataFrame(columns=["article_id"]+terms)
+    terms = ngram_terms(ALL_WORDS, ngram_value)
     
-    folder = join(JSTOR_HOME, f'ngram{ngram_value}')
+    corpus = open_corpus(JSTOR_HOME) # extracted text files or packed n-gram store
+    # corpus key -> term; n-gram files use spaces to separate words where dictionaries use underscores
+    terms_keys = corpus.encode(ngram_value, {term.replace('_', ' '): term for term in terms})
 
     for file in tqdm(files):
-        with open(join(folder, f'{file}-ngram{ngram_value}.txt'), 'r') as f:
-
-            file_dict = {} # initialize dict for relevant vocab from article
-
-            for line in f.read().splitlines():
-                word, count = line.split('\t')
-                word = word.replace(' ', '_') # to match dictionary format, use underscores to separate words
-                if word in terms:
-                    file_dict[word] = int(count)
-                    
-            # Create dict for row, with word:count and article id:file
-            row = {word: file_dict.get(word, 0) for word in terms}
-            row['article_id'] = file #row = {"article_id": file}
-            
-            counts_df = counts_df.append(row, ignore_index=True) # add row for article to DF
+        file_dict = {} # initialize dict for relevant vocab from article
+
+        for key, count in corpus.read_keys(file, ngram_value):
+            word = terms_keys.get(key)
+            if word is not None:
+                file_dict[word] = count
+                
+        # Add word counts to the article's row, in the columns for this ngram_value
+        counts.add(file, [file_dict.get(word, 0) for word in terms], columns=terms)
     
-    return counts_df
+    return counts
+
+
+def ngram_terms(ALL_WORDS:list, ngram_value:int):
+    '''Returns the unique terms in ALL_WORDS of length ngram_value, in order of first appearance.'''
+    return list(dict.fromkeys(term for term in ALL_WORDS if len(term.split('_'))==ngram_value)) # underscores separate words
 
         
 ################################################
@@ -152,20 +161,22 @@ def generate_ngram_counts(ngram_value:int, files:list, ALL_WORDS:list, JSTOR_HOM
 assert words_type, "No type specified. Check the script to specify 'citations' or 'words' as counting target."
 print(f'Counting {words_type}...')
 
-trigram_counts_df = generate_ngram_counts(3, files=files, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count trigrams
+# One preallocated row per article, one column per term (trigrams, then bigrams, then unigrams)
+counts = CountsAccumulator(columns=ngram_terms(ALL_WORDS, 3) + ngram_terms(ALL_WORDS, 2) + ngram_terms(ALL_WORDS, 1), 
+                           size=len(files))
 
-bigram_counts_df = generate_ngram_counts(2, files=files, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count bigrams
-counts_df = pd.concat([trigram_counts_df, bigram_counts_df], axis=1) # merge bigram + trigram counts
+counts = generate_ngram_counts(3, counts, files=files, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count trigrams
+counts = generate_ngram_counts(2, counts, files=files, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count bigrams
+counts = generate_ngram_counts(1, counts, files=files, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count unigrams
 
-unigram_counts_df = generate_ngram_counts(1, files=files, ALL_WORDS=ALL_WORDS, JSTOR_HOME=JSTOR_HOME) # Count unigrams
-counts_df = pd.concat([counts_df, unigram_counts_df], axis=1) # merge unigram counts with the rest
+counts_df = counts.to_frame()
 
 
 ################################################
 #       Transpose terms from cols to rows      #
 ################################################
 
-counts_df = counts_df.sum(axis=0).drop(index='article_id').reset_index(drop=False) # sum across articles
+counts_df = counts_df.sum(axis=0).reset_index(drop=False) # sum across articles
 counts_df.columns = ['term', 'count']
 counts_df['count'] = counts_df['count'].astype(int) # cast as int
 